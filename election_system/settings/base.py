@@ -11,6 +11,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # trigram lookups for voter search
     'voting',
 ]
 
@@ -20,6 +21,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'voting.middleware.ClientProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,3 +64,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'voting:custom_redirect'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Live dashboard events (voting.events): 'local' delivers within one process,
+# 'postgres' fans out through LISTEN/NOTIFY across web and import workers
+VOTING_EVENTS_BACKEND = 'local'
+
+# In-process DNI -> voter index for mark_by_dni_set (voting.dni_index), and how
+# many clients each worker keeps loaded
+VOTING_DNI_INDEX = False
+VOTING_DNI_INDEX_CLIENTS = 16
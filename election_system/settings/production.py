@@ -55,6 +55,10 @@ LANGUAGE_CODE = 'es'
 LANGUAGE_SESSION_KEY = '_language'  # Session key for language preference
 
 # Database
+# Connections are reused across requests instead of opening one (plus TLS handshake) per
+# request: persistent per worker thread by default, or with DB_POOL=1 drawn from Django's
+# psycopg 3 pool (the two are mutually exclusive; the pool suits ASGI/threaded workers).
+DB_POOL = os.environ.get('DB_POOL', '0') == '1'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -63,8 +67,25 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        # Check reused connections before use so a dropped one never fails a request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
 }
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    }
+
+# Several web workers plus the import worker publish counter changes; fan out via the database
+VOTING_EVENTS_BACKEND = os.environ.get('VOTING_EVENTS_BACKEND', 'postgres')
+
+# Election-day DNI marking skips the lookup query; ~28 bytes per voter per worker
+VOTING_DNI_INDEX = os.environ.get('VOTING_DNI_INDEX', '1') == '1'
 
 # Security settings
 SECURE_SSL_REDIRECT = True
@@ -89,6 +110,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'voting.middleware.ClientProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -19,6 +19,8 @@ urlpatterns = [
         ),
         name='login',
     ),
+    # Override logout to wipe the offline voter list stored in the browser
+    path('accounts/logout/', views.ClearSiteDataLogoutView.as_view(), name='logout'),
     path('accounts/', include('django.contrib.auth.urls')),
     path('voting/', include('voting.urls')),
     re_path(r'^favicon\.ico$', lambda request: HttpResponseRedirect(settings.STATIC_URL + 'favicon.svg')),
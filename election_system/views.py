@@ -1,5 +1,6 @@
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import LogoutView
 
 def root_redirect(request):
     # If user is authenticated, send them to their dashboard directly
@@ -7,3 +8,13 @@ def root_redirect(request):
         return redirect('voting:custom_redirect')
     # Otherwise, to the login page
     return redirect('login')
+
+
+class ClearSiteDataLogoutView(LogoutView):
+    """Logout that also drops the offline voter copy (IndexedDB) and the dashboard's
+    service-worker cache from the browser; visitor_dashboard clears them itself too."""
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        response['Clear-Site-Data'] = '"cache", "storage"'
+        return response
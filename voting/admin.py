@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 
 from election_system.forms import SpanishAdminAuthenticationForm
-from .models import ClientProfile, Voter
+from .models import ClientProfile, ImportJob, Voter
 
 
 class ClientProfileInline(admin.StackedInline):
@@ -43,7 +43,14 @@ class CustomUserAdmin(UserAdmin):
         return super().get_inline_instances(request, obj)
 
 
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "client", "filename", "zone_name", "status", "rows_processed", "created_at")
+    list_filter = ("status",)
+    exclude = ("payload",)
+
+
 admin.site.register(Voter)
+admin.site.register(ImportJob, ImportJobAdmin)
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
@@ -0,0 +1,226 @@
+"""PostgreSQL bulk paths for padrón imports.
+
+A client's first list is streamed with ``COPY`` straight into ``voting_voter``
+(``load_new_voters``). A list replacement is loaded with ``COPY`` into a
+session temporary table, de-duplicated and validated there, and only then
+swapped into ``voting_voter`` in one short transaction; until it commits,
+dashboards and visitors keep reading the previous list. Other databases (and
+imports into a non-empty list) use ``importer.import_voters``; see
+``jobs.run_import_job``.
+"""
+import csv
+import io
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from . import events
+from .counters import rebuild_mesa_turnout, stamp_changes
+from .importer import IMPORT_FIELDS, NORMALIZED_COLUMNS, NO_VALID_ROWS, ImportResult
+from .models import ClientProfile, MesaTurnout, Voter, Zone
+
+STAGING_TABLE = 'voting_voter_staging'
+NULLABLE_COLUMNS = ['mesa', 'orden']
+
+
+def supported() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def copy_rows(cursor, table, columns, rows, nullable=()) -> None:
+    """``COPY table (columns) FROM STDIN`` with ``rows`` (tuples); None is NULL in the ``nullable`` columns."""
+    qn = connection.ops.quote_name
+    options = 'FORMAT csv'
+    if nullable:
+        options += f", FORCE_NULL ({', '.join(qn(c) for c in nullable)})"
+    sql = f"COPY {qn(table)} ({', '.join(qn(c) for c in columns)}) FROM STDIN WITH ({options})"
+    buffer = io.StringIO()
+    # Every string and None is written quoted, so '' stays an empty string outside ``nullable``
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n').writerows(rows)
+    if hasattr(cursor, 'copy_expert'):  # psycopg2
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+    else:  # psycopg 3
+        with cursor.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def load_new_voters(client_profile, chunks, zone, progress=None) -> ImportResult:
+    """Insert normalized ``chunks`` into ``zone`` for a client that has no voters yet.
+
+    Each chunk is one transaction: the zone and client counters grow by the
+    chunk's row count, the client's change sequence is bumped, and the rows are
+    COPYed with it (zone, then client, then new rows: marks lock voter, zone,
+    client, so the order never inverts). A DNI repeated in the file is inserted
+    on its first row; later rows are upserted at the end, so the last one wins
+    and counts as "updated" when it changes something, as with ``import_voters``.
+    Per-mesa counts are tallied from the chunks and written once at the end.
+    """
+    result = ImportResult()
+    qn = connection.ops.quote_name
+    voter_columns = ['client_id', 'zone_id', 'voted', 'change_seq'] + NORMALIZED_COLUMNS
+    seen = set()
+    repeated = {}  # dni -> last values (IMPORT_FIELDS order) of rows after the first
+    mesas = Counter()  # (establecimiento, mesa) -> inserted rows
+    with connection.cursor() as cursor:
+        for clean, rejected in chunks:
+            result.rows += len(clean) + len(rejected)
+            result.skipped += len(rejected)
+            result.rejected.extend(rejected)
+            first = []
+            for dni in clean['dni'].tolist():
+                first.append(dni not in seen)
+                seen.add(dni)
+            fresh = clean[first]
+            for dni, *values in clean[[not f for f in first]].itertuples(index=False, name=None):
+                repeated[dni] = values + [zone.id]
+            if len(fresh):
+                with transaction.atomic():
+                    Zone.objects.filter(id=zone.id).update(total_voters=F('total_voters') + len(fresh))
+                    cursor.execute(
+                        f"UPDATE {qn(ClientProfile._meta.db_table)} SET total_voters = total_voters + %s,"
+                        " stats_version = stats_version + 1, change_seq = change_seq + 1 WHERE id = %s RETURNING change_seq",
+                        [len(fresh), client_profile.id],
+                    )
+                    seq, = cursor.fetchone()
+                    copy_rows(cursor, Voter._meta.db_table, voter_columns, (
+                        (client_profile.id, zone.id, False, seq, *values)
+                        for values in fresh.itertuples(index=False, name=None)
+                    ), NULLABLE_COLUMNS)
+                result.created += len(fresh)
+                mesas.update(zip(fresh['establecimiento'].tolist(), fresh['mesa'].tolist()))
+            if progress:
+                progress(result)
+    if repeated:
+        result.updated = _upsert_repeated(client_profile, repeated)
+    if result.updated:
+        rebuild_mesa_turnout(client_profile.id)  # a repeated row may have moved a voter between mesas
+    else:
+        rebuild_mesa_turnout(client_profile.id, {key: (total, 0) for key, total in mesas.items()})
+    events.publish(client_profile.id, {'type': 'reset'})
+    return result
+
+
+def _upsert_repeated(client_profile, repeated):
+    current = {
+        row[0]: list(row[1:])
+        for row in Voter.objects.filter(client=client_profile, dni__in=list(repeated)).values_list('dni', *IMPORT_FIELDS)
+    }
+    changed = {dni: values for dni, values in repeated.items() if current.get(dni) != values}
+    if changed:
+        with transaction.atomic():
+            written = Voter.objects.bulk_create(
+                [Voter(client=client_profile, dni=dni, **dict(zip(IMPORT_FIELDS, values))) for dni, values in changed.items()],
+                update_conflicts=True,
+                unique_fields=['client', 'dni'],
+                update_fields=IMPORT_FIELDS,
+            )
+            stamp_changes(client_profile.id, [voter.pk for voter in written])
+    return len(changed)
+
+
+def _create_staging(cursor):
+    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    cursor.execute(f"""
+        CREATE TEMPORARY TABLE {STAGING_TABLE} (
+            line integer NOT NULL,
+            dni varchar(20) NOT NULL,
+            last_name varchar(255) NOT NULL,
+            first_name varchar(255) NOT NULL,
+            sex varchar(1) NOT NULL,
+            address varchar(255) NOT NULL,
+            mesa integer,
+            orden integer,
+            establecimiento varchar(255) NOT NULL,
+            voted boolean NOT NULL DEFAULT FALSE
+        )
+    """)
+
+
+def _load_staging(cursor, chunks, result, progress):
+    for clean, rejected in chunks:
+        result.rows += len(clean) + len(rejected)
+        result.skipped += len(rejected)
+        result.rejected.extend(rejected)
+        if len(clean):
+            copy_rows(cursor, STAGING_TABLE, ['line'] + NORMALIZED_COLUMNS, clean.itertuples(index=True, name=None), NULLABLE_COLUMNS)
+        if progress:
+            progress(result)
+    # A DNI repeated in the file keeps its last row, as successive upserts would
+    cursor.execute(f"""
+        DELETE FROM {STAGING_TABLE} WHERE ctid IN (
+            SELECT ctid FROM (
+                SELECT ctid, row_number() OVER (PARTITION BY dni ORDER BY line DESC) AS rank FROM {STAGING_TABLE}
+            ) ranked WHERE rank > 1
+        )
+    """)
+    cursor.execute(f"CREATE UNIQUE INDEX ON {STAGING_TABLE} (dni)")
+    cursor.execute(f"ANALYZE {STAGING_TABLE}")
+    cursor.execute(f"SELECT count(*) FROM {STAGING_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def _swap(cursor, client_id, zone_name, keep_votes):
+    """Replace the client's voters with the staging rows; returns ``(total, voted)``."""
+    voters = connection.ops.quote_name(Voter._meta.db_table)
+    with transaction.atomic():
+        # Voter rows, then zones, then the client row: the lock order used by marks
+        if keep_votes:
+            # A mark committed before the DELETE reaches its row is carried over
+            cursor.execute(f"""
+                WITH old AS (DELETE FROM {voters} WHERE client_id = %s RETURNING dni, voted)
+                UPDATE {STAGING_TABLE} AS s SET voted = TRUE FROM old WHERE old.voted AND old.dni = s.dni
+            """, [client_id])
+        else:
+            cursor.execute(f"DELETE FROM {voters} WHERE client_id = %s", [client_id])
+        zone, _ = Zone.objects.get_or_create(client_id=client_id, name=zone_name)
+        Zone.objects.filter(client_id=client_id).exclude(id=zone.id)._raw_delete(cursor.db.alias)
+        cursor.execute(f"""
+            INSERT INTO {voters} (client_id, zone_id, voted, change_seq, {', '.join(NORMALIZED_COLUMNS)})
+            SELECT %s, %s, voted, 0, {', '.join(NORMALIZED_COLUMNS)} FROM {STAGING_TABLE}
+        """, [client_id, zone.id])
+        total = cursor.rowcount
+        cursor.execute(f"SELECT count(*) FROM {STAGING_TABLE} WHERE voted")
+        voted = cursor.fetchone()[0]
+        Zone.objects.filter(id=zone.id).update(total_voters=total, voted_count=voted)
+        MesaTurnout.objects.filter(client_id=client_id)._raw_delete(cursor.db.alias)
+        cursor.execute(f"""
+            INSERT INTO {connection.ops.quote_name(MesaTurnout._meta.db_table)}
+                (client_id, establecimiento, mesa, total_voters, voted_count)
+            SELECT %s, establecimiento, mesa, count(*), count(*) FILTER (WHERE voted)
+            FROM {STAGING_TABLE} GROUP BY establecimiento, mesa
+        """, [client_id])
+        # New rows carry no change sequence: the epoch bump sends offline copies to a fresh snapshot
+        ClientProfile.objects.filter(id=client_id).update(
+            total_voters=total,
+            voted_count=voted,
+            stats_version=F('stats_version') + 1,
+            list_epoch=F('list_epoch') + 1,
+        )
+        events.publish(client_id, {'type': 'reset'})
+    return total, voted
+
+
+def replace_voters(client_profile, chunks, zone_name, keep_votes=False, progress=None) -> ImportResult:
+    """Replace the client's whole list with normalized ``chunks``, all voters in ``zone_name``.
+
+    With ``keep_votes``, DNIs already marked in the previous list stay marked.
+    Raises ``ValueError`` (leaving the current list untouched) if no row is valid.
+    Callers should ``dni_index.invalidate`` the client afterwards.
+    """
+    result = ImportResult()
+    with connection.cursor() as cursor:
+        _create_staging(cursor)
+        try:
+            if not _load_staging(cursor, chunks, result, progress):
+                raise ValueError(NO_VALID_ROWS)
+            result.created, _ = _swap(cursor, client_profile.id, zone_name, keep_votes)
+        except Exception:
+            # In a caller's transaction a failed statement blocks the DROP; its rollback removes the table
+            if not connection.in_atomic_block:
+                cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            raise
+        # The table lives as long as the (possibly reused) connection: drop it now
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+    return result
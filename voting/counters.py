@@ -0,0 +1,158 @@
+"""Maintenance of the denormalized voter counters on ClientProfile, Zone and MesaTurnout."""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from . import events
+from .models import MesaTurnout, Voter, ClientProfile, Zone
+
+
+def _count_subquery(voters, group_by):
+    """Scalar subquery counting ``voters`` grouped by ``group_by`` (0 when empty)."""
+    return Coalesce(Subquery(voters.values(group_by).annotate(n=Count('id')).values('n')[:1]), 0)
+
+
+def recompute_client_counters(client_profile: ClientProfile) -> None:
+    """Recompute denormalized counters for a given client, its zones and its mesas.
+    Safe to call after bulk operations (uploads, deletes); bumps ``stats_version``.
+
+    Runs two set-based UPDATEs regardless of the number of zones: one for all
+    of its zones (correlated counts per zone) and one for the client row, and
+    rebuilds the per-mesa rows from one grouped query.
+
+    The zone, mesa and client rows are locked first, in the order ``apply_vote_delta``
+    takes them, so a recompute running alongside marks cannot deadlock with
+    them; the counts are then read by later statements, so a mark that
+    committed while we waited for a lock is counted, and one still waiting on
+    our locks applies its delta on top of the recomputed values.
+    """
+    client_voters = Voter.objects.filter(client=OuterRef('pk'))
+    zone_voters = Voter.objects.filter(zone=OuterRef('pk'))
+    with transaction.atomic():
+        list(Zone.objects.select_for_update().filter(client=client_profile).order_by('id').values_list('id', flat=True))
+        list(MesaTurnout.objects.select_for_update().filter(client=client_profile).order_by('id').values_list('id', flat=True))
+        ClientProfile.objects.select_for_update().filter(id=client_profile.id).values_list('id', flat=True).first()
+        Zone.objects.filter(client=client_profile).update(
+            total_voters=_count_subquery(zone_voters, 'zone'),
+            voted_count=_count_subquery(zone_voters.filter(voted=True), 'zone'),
+        )
+        rebuild_mesa_turnout(client_profile.id)
+        ClientProfile.objects.filter(id=client_profile.id).update(
+            total_voters=_count_subquery(client_voters, 'client'),
+            voted_count=_count_subquery(client_voters.filter(voted=True), 'client'),
+            stats_version=F('stats_version') + 1,
+        )
+        # Totals may have changed arbitrarily: live dashboards re-fetch the stats
+        events.publish(client_profile.id, {'type': 'reset'})
+
+
+def rebuild_mesa_turnout(client_id, groups=None) -> None:
+    """Rewrite the client's ``MesaTurnout`` rows, from ``groups`` or a grouped count of its voters.
+
+    ``groups`` maps ``(establecimiento, mesa)`` to ``(total_voters, voted_count)``.
+    Rows are updated in place (only groups that appeared or vanished are
+    inserted or deleted), so a mark waiting on a row applies its delta to the
+    new counts instead of losing it to a deleted row.
+    """
+    if groups is None:
+        groups = {
+            (row['establecimiento'], row['mesa']): (row['total'], row['voted'])
+            for row in Voter.objects.filter(client_id=client_id).order_by()
+            .values('establecimiento', 'mesa').annotate(total=Count('id'), voted=Count('id', filter=Q(voted=True)))
+        }
+    groups = {key: counts for key, counts in groups.items() if counts[0]}
+    with transaction.atomic():
+        changed, gone = [], []
+        for row in MesaTurnout.objects.select_for_update().filter(client_id=client_id).order_by('id'):
+            counts = groups.pop((row.establecimiento, row.mesa), None)
+            if counts is None:
+                gone.append(row.id)
+            elif counts != (row.total_voters, row.voted_count):
+                row.total_voters, row.voted_count = counts
+                changed.append(row)
+        if gone:
+            MesaTurnout.objects.filter(id__in=gone).delete()
+        MesaTurnout.objects.bulk_update(changed, ['total_voters', 'voted_count'], batch_size=1000)
+        MesaTurnout.objects.bulk_create([
+            MesaTurnout(client_id=client_id, establecimiento=establecimiento, mesa=mesa, total_voters=total, voted_count=voted)
+            for (establecimiento, mesa), (total, voted) in groups.items()
+        ], batch_size=1000)
+
+
+def _mesa_q(establecimiento, mesa):
+    return Q(establecimiento=establecimiento, mesa=mesa) if mesa is not None else Q(establecimiento=establecimiento, mesa__isnull=True)
+
+
+def apply_vote_delta(client_id, zone_id, delta, voter_id=None, mesa=None) -> None:
+    """Shift ``voted_count`` on the client, its zone (if any) and ``mesa`` by ``delta``.
+
+    Call inside the transaction that flipped the voter so counters never drift
+    from the rows: voter row first, then zone, then mesa, then client. Every
+    writer of these rows (``recompute_client_counters``, the purge and bulk
+    import paths) takes them in that order, which rules out deadlocks.
+    ``voter_id`` is stamped with the new change sequence; ``mesa`` is the
+    voter's ``(establecimiento, mesa)``.
+    """
+    apply_vote_deltas(client_id, {zone_id: delta}, [voter_id] if voter_id else (), {mesa: delta} if mesa else None)
+
+
+def apply_vote_deltas(client_id, zone_deltas, voter_ids=(), mesa_deltas=None) -> None:
+    """Grouped form of ``apply_vote_delta``: ``zone_deltas`` maps zone id (or None) to a delta,
+    ``mesa_deltas`` maps ``(establecimiento, mesa)`` to a delta.
+
+    All zones move in a single UPDATE, and so do all mesas, whatever the number involved.
+    """
+    zone_deltas = {zone_id: delta for zone_id, delta in zone_deltas.items() if delta}
+    if not zone_deltas:
+        return
+    total = sum(zone_deltas.values())
+    zone_deltas.pop(None, None)
+    events.publish(client_id, {'type': 'delta', 'voted': total, 'zones': {str(z): d for z, d in zone_deltas.items()}})
+    if len(zone_deltas) == 1:
+        (zone_id, delta), = zone_deltas.items()
+        Zone.objects.filter(id=zone_id).update(voted_count=F('voted_count') + delta)
+    elif zone_deltas:
+        Zone.objects.filter(id__in=sorted(zone_deltas)).update(voted_count=F('voted_count') + Case(
+            *[When(id=zone_id, then=Value(delta)) for zone_id, delta in zone_deltas.items()],
+            default=Value(0),
+        ))
+    mesa_deltas = {key: delta for key, delta in (mesa_deltas or {}).items() if delta}
+    if len(mesa_deltas) == 1:
+        (key, delta), = mesa_deltas.items()
+        MesaTurnout.objects.filter(_mesa_q(*key), client_id=client_id).update(voted_count=F('voted_count') + delta)
+    elif mesa_deltas:
+        MesaTurnout.objects.filter(reduce(or_, (_mesa_q(*key) for key in mesa_deltas)), client_id=client_id).update(
+            voted_count=F('voted_count') + Case(
+                *[When(_mesa_q(*key), then=Value(delta)) for key, delta in mesa_deltas.items()],
+                default=Value(0),
+            ),
+        )
+    ClientProfile.objects.filter(id=client_id).update(
+        voted_count=F('voted_count') + total,
+        stats_version=F('stats_version') + 1,
+        change_seq=F('change_seq') + 1,
+    )
+    if voter_ids:
+        _stamp_voters(client_id, voter_ids)
+
+
+def _stamp_voters(client_id, voter_ids):
+    # The client row stays locked until commit, so sequences become visible in order
+    Voter.objects.filter(client_id=client_id, id__in=voter_ids).update(
+        change_seq=Subquery(ClientProfile.objects.filter(id=client_id).values('change_seq')[:1]),
+    )
+
+
+def stamp_changes(client_id, voter_ids) -> None:
+    """Give ``voter_ids`` the client's next change sequence (read by ``offline.changed_voters``).
+
+    Call inside the transaction that wrote the voter rows, after writing them
+    (voter rows before the client row, as in ``apply_vote_delta``).
+    """
+    if not voter_ids:
+        return
+    ClientProfile.objects.filter(id=client_id).update(change_seq=F('change_seq') + 1)
+    _stamp_voters(client_id, voter_ids)
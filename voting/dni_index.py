@@ -0,0 +1,142 @@
+"""Per-worker DNI -> (voter id, zone id, mesa) index for marking voters by DNI.
+
+Each client's voters are loaded lazily into sorted NumPy arrays (about 28 bytes
+per voter, plus one ``(establecimiento, mesa)`` tuple per mesa; DNIs that are
+not plain numbers go to a small dict) and the most recently used
+``VOTING_DNI_INDEX_CLIENTS`` clients are kept. Entries can go stale when
+another process imports or clears voters, so callers must verify them in the
+statement that uses them (see ``mark_voted_by_dni_set``) and call
+``invalidate`` when the database disagrees. Reloads also happen on a version
+bump in this process (imports, ``clear_voters``) and after ``INDEX_TTL``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Voter
+
+# Seconds before a client's index is reloaded, bounding staleness from other processes
+INDEX_TTL = 600
+# Largest DNI stored as a number; longer or zero-padded ones use the dict
+_MAX_NUMERIC_LENGTH = 18
+
+_indexes = OrderedDict()  # client_id -> _ClientIndex, least recently used first
+_versions = {}  # client_id -> local version, bumped by invalidate()
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return getattr(settings, 'VOTING_DNI_INDEX', False)
+
+
+def _numeric_key(dni):
+    if dni.isascii() and dni.isdigit() and dni[0] != '0' and len(dni) <= _MAX_NUMERIC_LENGTH:
+        return int(dni)
+    return None
+
+
+class _ClientIndex:
+    __slots__ = ('version', 'expires_at', 'keys', 'ids', 'zones', 'mesas', 'mesa_keys', 'other', 'hits', 'misses')
+
+    def __init__(self, client_id, version):
+        import numpy as np  # type: ignore
+
+        keys, ids, zones, mesas, other = [], [], [], [], {}
+        mesa_codes = {}  # (establecimiento, mesa) -> position in mesa_keys
+        rows = Voter.objects.filter(client_id=client_id).values_list('dni', 'id', 'zone_id', 'establecimiento', 'mesa')
+        for dni, voter_id, zone_id, establecimiento, mesa in rows.iterator(chunk_size=10000):
+            code = mesa_codes.setdefault((establecimiento, mesa), len(mesa_codes))
+            key = _numeric_key(dni)
+            if key is None:
+                other[dni] = (voter_id, zone_id, code)
+            else:
+                keys.append(key)
+                ids.append(voter_id)
+                zones.append(-1 if zone_id is None else zone_id)
+                mesas.append(code)
+        order = np.argsort(np.array(keys, dtype=np.int64), kind='stable')
+        self.keys = np.array(keys, dtype=np.int64)[order]
+        self.ids = np.array(ids, dtype=np.int64)[order]
+        self.zones = np.array(zones, dtype=np.int64)[order]
+        self.mesas = np.array(mesas, dtype=np.int32)[order]
+        self.mesa_keys = list(mesa_codes)
+        self.other = other
+        self.version = version
+        self.expires_at = time.monotonic() + INDEX_TTL
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, dni):
+        key = _numeric_key(dni)
+        if key is None:
+            entry = self.other.get(dni)
+            return entry and (entry[0], entry[1], self.mesa_keys[entry[2]])
+        pos = int(self.keys.searchsorted(key))
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return None
+        zone_id = int(self.zones[pos])
+        return int(self.ids[pos]), (None if zone_id < 0 else zone_id), self.mesa_keys[int(self.mesas[pos])]
+
+    def nbytes(self):
+        # Dict entries and mesa tuples: key strings + tuple, roughly
+        arrays = self.keys.nbytes + self.ids.nbytes + self.zones.nbytes + self.mesas.nbytes
+        return arrays + (len(self.other) + len(self.mesa_keys)) * 200
+
+
+def lookup(client_id, dni):
+    """``(voter_id, zone_id, (establecimiento, mesa))`` for ``dni`` as of the last load, or None (ask the database)."""
+    now = time.monotonic()
+    with _lock:
+        version = _versions.get(client_id, 0)
+        index = _indexes.get(client_id)
+        if index is not None and (index.version != version or index.expires_at <= now):
+            del _indexes[client_id]
+            index = None
+        if index is not None:
+            _indexes.move_to_end(client_id)
+    if index is None:
+        # Built outside the lock: concurrent first lookups may both load, the last one wins
+        index = _ClientIndex(client_id, version)
+        with _lock:
+            if _versions.get(client_id, 0) == version:
+                _indexes[client_id] = index
+                _indexes.move_to_end(client_id)
+                while len(_indexes) > getattr(settings, 'VOTING_DNI_INDEX_CLIENTS', 16):
+                    _indexes.popitem(last=False)
+    entry = index.find(dni)
+    with _lock:
+        if entry is None:
+            index.misses += 1
+        else:
+            index.hits += 1
+    return entry
+
+
+def invalidate(client_id) -> None:
+    """Drop the client's index in this process; the next lookup reloads it."""
+    with _lock:
+        _versions[client_id] = _versions.get(client_id, 0) + 1
+        _indexes.pop(client_id, None)
+
+
+def stats():
+    """Per-client entries, memory and hit ratio of the indexes loaded in this process."""
+    with _lock:
+        loaded = list(_indexes.items())
+    clients = {}
+    for client_id, index in loaded:
+        lookups = index.hits + index.misses
+        clients[client_id] = {
+            'voters': len(index.keys) + len(index.other),
+            'bytes': index.nbytes(),
+            'hits': index.hits,
+            'misses': index.misses,
+            'hit_ratio': round(index.hits / lookups, 4) if lookups else None,
+        }
+    return {
+        'enabled': enabled(),
+        'bytes': sum(c['bytes'] for c in clients.values()),
+        'clients': clients,
+    }
@@ -0,0 +1,144 @@
+"""Live turnout events for the dashboards (Server-Sent Events).
+
+Counter changes are published per client and fanned out in-process to every
+open stream. With ``VOTING_EVENTS_BACKEND = 'postgres'`` events travel through
+PostgreSQL LISTEN/NOTIFY instead, so each web worker keeps a single listening
+connection no matter how many dashboards it serves.
+"""
+import asyncio
+import json
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+CHANNEL = 'voting_events'
+# Comment frames sent on idle streams so proxies keep the connection open
+KEEPALIVE_SECONDS = 20
+# Events buffered per stream; a consumer that falls further behind gets a 'reset'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+# client_id -> set of (event loop, asyncio.Queue), one per open stream
+_subscribers = {}
+_lock = threading.Lock()
+_listener = None
+
+
+def _use_postgres():
+    return getattr(settings, 'VOTING_EVENTS_BACKEND', 'local') == 'postgres'
+
+
+def _offer(queue, event):
+    # Runs on the subscriber's loop
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({'type': 'reset'})
+
+
+def _fan_out(client_id, event):
+    """Deliver ``event`` to the streams of ``client_id`` in this process (thread-safe)."""
+    with _lock:
+        targets = list(_subscribers.get(client_id, ()))
+    for loop, queue in targets:
+        loop.call_soon_threadsafe(_offer, queue, event)
+
+
+def _fan_out_all(event):
+    with _lock:
+        client_ids = list(_subscribers)
+    for client_id in client_ids:
+        _fan_out(client_id, event)
+
+
+def publish(client_id, event) -> None:
+    """Send ``event`` to every stream watching ``client_id`` once the current transaction commits."""
+    if _use_postgres():
+        # NOTIFY is transactional: listeners only see it after COMMIT
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps({'client': client_id, 'event': event})])
+    else:
+        transaction.on_commit(lambda: _fan_out(client_id, event))
+
+
+def _dispatch(payload):
+    data = json.loads(payload)
+    _fan_out(data['client'], data['event'])
+
+
+def _listen():
+    """Forward NOTIFY payloads to local streams; reconnects (and resets the streams) on failure."""
+    wrapper = connections['default']
+    reconnecting = False
+    while True:
+        raw = None
+        try:
+            # A dedicated connection, never one borrowed from the pool (OPTIONS['pool'])
+            raw = wrapper.Database.connect(**wrapper.get_connection_params())
+            raw.autocommit = True
+            raw.cursor().execute(f"LISTEN {CHANNEL}")
+            if reconnecting:
+                # Anything published while we were disconnected is lost: make dashboards re-sync
+                _fan_out_all({'type': 'reset'})
+            reconnecting = True
+            if hasattr(raw, 'poll'):  # psycopg2
+                while True:
+                    if select.select([raw], [], [], KEEPALIVE_SECONDS) != ([], [], []):
+                        raw.poll()
+                        while raw.notifies:
+                            _dispatch(raw.notifies.pop(0).payload)
+            else:  # psycopg 3
+                while True:
+                    for notify in raw.notifies(timeout=KEEPALIVE_SECONDS):
+                        _dispatch(notify.payload)
+        except Exception:
+            time.sleep(1)
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+
+def _ensure_listener():
+    global _listener
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name='voting-events', daemon=True)
+            _listener.start()
+
+
+def _frame(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def stream(client_id):
+    """Async iterator of SSE frames for one dashboard of ``client_id``."""
+    if _use_postgres():
+        _ensure_listener()
+    subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+    with _lock:
+        _subscribers.setdefault(client_id, set()).add(subscriber)
+    try:
+        yield "retry: 5000\n\n"
+        # Sent on every (re)connect; the dashboard re-fetches the stats it may have missed
+        yield _frame({'type': 'ready'})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber[1].get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _frame(event)
+    finally:
+        with _lock:
+            watchers = _subscribers.get(client_id)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del _subscribers[client_id]
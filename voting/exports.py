@@ -0,0 +1,89 @@
+"""Streaming writers for voter exports (offline walk lists).
+
+Each writer consumes an iterator of value tuples (one per voter, in ``fields``
+order) and yields encoded chunks, so the whole export never sits in memory.
+CSV and XLSX use the padrón column names, so an export can be uploaded again.
+"""
+import csv
+import io
+import json
+import tempfile
+from itertools import islice
+
+# Rows fetched per server-side cursor round trip and written per output chunk
+EXPORT_CHUNK_SIZE = 2000
+
+# Voter field -> padrón column (the importer's spreadsheet headers)
+COLUMN_NAMES = {
+    'dni': 'dni',
+    'last_name': 'Apellido',
+    'first_name': 'Nombre',
+    'sex': 'Sexo',
+    'address': 'Direccion',
+    'mesa': 'Mesa',
+    'orden': 'Orden',
+    'establecimiento': 'Establecimiento',
+}
+
+
+def _chunks(rows, size=EXPORT_CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_csv(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the accents correctly
+    buffer.write('\ufeff')
+    writer.writerow([COLUMN_NAMES[f] for f in fields])
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_ndjson(rows, fields):
+    for chunk in _chunks(rows):
+        yield ''.join(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n' for row in chunk).encode('utf-8')
+
+
+def write_columnar(rows, fields):
+    """``{"fields": [...], "chunks": [[column, ...], ...]}``: each chunk holds one array per field."""
+    yield ('{"fields": %s, "chunks": [' % json.dumps(list(fields))).encode('utf-8')
+    separator = ''
+    for chunk in _chunks(rows):
+        columns = [list(column) for column in zip(*chunk)]
+        yield (separator + json.dumps(columns, ensure_ascii=False)).encode('utf-8')
+        separator = ', '
+    yield b']}'
+
+
+def write_xlsx(rows, fields):
+    """Return a temporary file holding the workbook (openpyxl write-only mode keeps memory flat)."""
+    from openpyxl import Workbook  # type: ignore
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Pendientes')
+    ws.append([COLUMN_NAMES[f] for f in fields])
+    for row in rows:
+        ws.append(row)
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+# format -> (writer, content type, file extension); XLSX is handled separately
+STREAM_FORMATS = {
+    'csv': (write_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (write_ndjson, 'application/x-ndjson', 'ndjson'),
+    'columnar': (write_columnar, 'application/json', 'json'),
+}
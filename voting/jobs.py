@@ -0,0 +1,239 @@
+"""Background processing of queued padrón uploads (ImportJob).
+
+Jobs are claimed straight from the database, so no external broker is needed:
+``python manage.py run_import_worker`` runs them on a thread pool.
+"""
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import BinaryField, Q
+from django.db.models.functions import Length, Substr
+from django.utils import timezone
+
+from . import bulkload, dni_index
+from .counters import recompute_client_counters
+from .importer import NO_VALID_ROWS, import_voters, open_voter_file
+from .purge import purge_client_voters
+from .models import ClientProfile, ImportJob, Voter, Zone
+
+# Rejected-row messages kept on a job (the rest are only counted in ``skipped``)
+MAX_JOB_ERRORS = 200
+# A running job whose worker has not reported for this long is considered dead
+JOB_LEASE = timedelta(minutes=10)
+# Bytes of the stored upload read per query when a worker spools it to disk
+PAYLOAD_SLICE = 4 * 1024 * 1024
+# How often a running job renews its lease, independently of the import's progress
+HEARTBEAT_SECONDS = 30
+
+
+def enqueue_import(client_profile, uploaded_file, zone_name, replace=False, keep_votes=False) -> ImportJob:
+    """Store the uploaded file on a new pending job."""
+    return ImportJob.objects.create(
+        client=client_profile,
+        zone_name=zone_name,
+        replace=replace,
+        keep_votes=keep_votes,
+        filename=uploaded_file.name[:255],
+        payload=uploaded_file.read(),
+    )
+
+
+def fail_abandoned_jobs() -> int:
+    """Fail running jobs whose lease expired (worker killed by a redeploy, OOM...); returns how many.
+
+    Whatever the dead worker committed stays, so the client's counters are
+    recomputed; the dashboard stops polling and the client can upload again.
+    """
+    cutoff = timezone.now() - JOB_LEASE
+    abandoned = ImportJob.objects.filter(status=ImportJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = 0
+    for job in abandoned.select_related('client').only('id', 'client'):
+        # Conditional on the lease so a worker that reported meanwhile keeps its job
+        if ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING).filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True)
+        ).update(
+            status=ImportJob.FAILED,
+            errors=["La importacion se interrumpio antes de terminar; vuelva a subir el archivo."],
+            payload=b'',
+            finished_at=timezone.now(),
+        ):
+            failed += 1
+            recompute_client_counters(job.client)
+            dni_index.invalidate(job.client_id)
+    return failed
+
+
+def claim_next_job():
+    """Mark the oldest runnable pending job as running and return it (or None).
+
+    Jobs for a client that already has one running wait their turn, so two
+    uploads for the same padrón never interleave. Abandoned jobs are failed
+    first (see ``fail_abandoned_jobs``) so they do not block their client.
+    """
+    fail_abandoned_jobs()
+    with transaction.atomic():
+        busy = ImportJob.objects.filter(status=ImportJob.RUNNING).values('client_id')
+        job = (
+            ImportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ImportJob.PENDING)
+            .exclude(client_id__in=busy)
+            .order_by('created_at')
+            .only('id', 'client_id')
+            .first()
+        )
+        if job is None:
+            return None
+        # Serialize claims per client, then re-check under the lock
+        ClientProfile.objects.select_for_update().filter(id=job.client_id).first()
+        if ImportJob.objects.filter(client_id=job.client_id, status=ImportJob.RUNNING).exists():
+            return None
+        now = timezone.now()
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.RUNNING, started_at=now, heartbeat_at=now)
+    return job
+
+
+def _replace_with_import(client_profile, chunks, zone_name, keep_votes=False, progress=None):
+    """``bulkload.replace_voters`` for databases without COPY: purge and import in one transaction.
+
+    Same guarantees: the current list survives a file without valid rows
+    (``ValueError``), and with ``keep_votes`` DNIs marked before stay marked.
+    """
+    with transaction.atomic():
+        voted = set(Voter.objects.filter(client=client_profile, voted=True).values_list('dni', flat=True)) if keep_votes else set()
+        # Deleted rows leave no change to sync: the purge bumps list_epoch
+        purge_client_voters(client_profile.id)
+        zone, _ = Zone.objects.get_or_create(client=client_profile, name=zone_name)
+        result = import_voters(client_profile, chunks, zone, progress=progress)
+        if not result.created:
+            raise ValueError(NO_VALID_ROWS)
+        voted = list(voted)
+        for start in range(0, len(voted), 500):
+            Voter.objects.filter(client=client_profile, dni__in=voted[start:start + 500]).update(voted=True)
+    return result
+
+
+def _report_progress(job_id, result):
+    ImportJob.objects.filter(id=job_id).update(
+        rows_processed=result.rows,
+        created=result.created,
+        updated=result.updated,
+        skipped=result.skipped,
+    )
+
+
+def _beat(job_id, stop):
+    try:
+        while True:
+            ImportJob.objects.filter(id=job_id, status=ImportJob.RUNNING).update(heartbeat_at=timezone.now())
+            if stop.wait(HEARTBEAT_SECONDS):
+                return
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _heartbeat(job_id):
+    """Renew the job's lease from a separate thread (and connection) while the block runs.
+
+    Progress reports land per chunk, and the fallback path writes them inside
+    its transaction, so they cannot keep a slow COPY, swap or recompute alive.
+    """
+    stop = threading.Event()
+    beater = threading.Thread(target=_beat, args=(job_id, stop), daemon=True)
+    beater.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        beater.join()
+
+
+def _spool_payload(job_id):
+    """Copy the job's stored upload to a temporary file, ``PAYLOAD_SLICE`` bytes at a time.
+
+    Workers run several jobs for minutes each, so the upload is never held
+    in memory whole; the parsers read it back from disk.
+    """
+    job = ImportJob.objects.filter(id=job_id)
+    size = job.annotate(size=Length('payload')).values_list('size', flat=True).get()
+    spool = tempfile.TemporaryFile()
+    for start in range(0, size, PAYLOAD_SLICE):
+        part = Substr('payload', start + 1, PAYLOAD_SLICE, output_field=BinaryField())
+        spool.write(job.annotate(part=part).values_list('part', flat=True).get())
+    spool.seek(0)
+    return spool
+
+
+def run_import_job(job_id) -> None:
+    """Process one claimed job; failures are recorded on the job, never raised."""
+    job = ImportJob.objects.select_related('client').defer('payload').get(id=job_id)
+    with _heartbeat(job.id):
+        status, errors = _process_job(job)
+    # Only a job still running is finished here; one failed as abandoned keeps its outcome
+    ImportJob.objects.filter(id=job.id, status=ImportJob.RUNNING).update(
+        status=status,
+        errors=errors,
+        payload=b'',
+        finished_at=timezone.now(),
+    )
+
+
+def _process_job(job):
+    """Run the import for ``job``; returns its final ``(status, errors)``."""
+    client_profile = job.client
+    errors = []
+    status = ImportJob.FAILED
+    counted = False  # the bulk paths keep the counters themselves
+    payload = None
+    try:
+        payload = _spool_payload(job.id)
+        sheet = open_voter_file(payload, job.filename)
+        if sheet.missing_columns():
+            sheet.close()
+            errors.append("El archivo debe tener columnas 'dni', 'Apellido' y 'Nombre'.")
+        else:
+            progress = partial(_report_progress, job.id)
+            try:
+                if job.replace and bulkload.supported():
+                    # Staged and swapped in one short transaction: the old list stays readable meanwhile
+                    result = bulkload.replace_voters(
+                        client_profile, sheet.chunks(), job.zone_name, keep_votes=job.keep_votes, progress=progress,
+                    )
+                    counted = True
+                elif job.replace:
+                    result = _replace_with_import(
+                        client_profile, sheet.chunks(), job.zone_name, keep_votes=job.keep_votes, progress=progress,
+                    )
+                elif not job.replace and bulkload.supported() and client_profile.total_voters == 0 and not client_profile.voters.exists():
+                    # First list: COPY straight into the voter table, nothing to diff against
+                    zone, _ = Zone.objects.get_or_create(client=client_profile, name=job.zone_name)
+                    result = bulkload.load_new_voters(client_profile, sheet.chunks(), zone, progress=progress)
+                    counted = True
+                else:
+                    zone, _ = Zone.objects.get_or_create(client=client_profile, name=job.zone_name)
+                    result = import_voters(client_profile, sheet.chunks(), zone, progress=progress)
+            finally:
+                sheet.close()
+            _report_progress(job.id, result)
+            errors = [f"Fila {row_number} omitida: {reason}." for row_number, reason in result.rejected[:MAX_JOB_ERRORS]]
+            status = ImportJob.DONE
+    except Exception as e:
+        errors.append(f"Error al procesar el archivo: {str(e)}")
+    finally:
+        if payload is not None:
+            payload.close()
+        # Counters must reflect whatever was written, even on partial failure
+        try:
+            if not counted:
+                recompute_client_counters(client_profile)
+            dni_index.invalidate(client_profile.id)
+        except Exception:
+            pass
+    return status, errors
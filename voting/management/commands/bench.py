@@ -0,0 +1,647 @@
+"""Micro-benchmarks for the voting hot paths.
+
+Usage: ``python manage.py bench <scenario> [options]``. Scenarios that touch the
+database run against the configured DATABASES, so point them at a scratch DB.
+"""
+import importlib.util
+import time
+
+from django.core.management.base import BaseCommand
+
+
+def synthetic_padron(rows, seed=0):
+    """Raw padrón DataFrame shaped like a real export, with ~1% incomplete rows."""
+    import numpy as np  # type: ignore
+    import pandas as pd  # type: ignore
+
+    rng = np.random.default_rng(seed)
+    dni = (20_000_000 + np.arange(rows)).astype(object)
+    last_names = np.array(['GOMEZ', 'PEREZ', 'RODRIGUEZ', 'FERNANDEZ', 'LOPEZ', 'DIAZ', 'MARTINEZ', 'SOSA'])
+    first_names = np.array(['MARIA', 'JUAN', 'ANA', 'CARLOS', 'LUCIA', 'JOSE', 'SOFIA', 'PABLO'])
+    df = pd.DataFrame({
+        'dni': dni,
+        'Apellido': rng.choice(last_names, rows),
+        'Nombre': rng.choice(first_names, rows),
+        'Sexo': rng.choice(np.array(['f', 'm', ' F', 'M ']), rows),
+        'Direccion': [f'Calle {n} ' for n in rng.integers(1, 5000, rows)],
+        'Mesa': rng.integers(1, 400, rows).astype(float),
+        'Orden': rng.integers(1, 350, rows),
+        'Establecimiento': rng.choice(np.array(['ESCUELA 1', 'ESCUELA 2', 'COLEGIO NACIONAL']), rows),
+    })
+    holes = rng.random(rows) < 0.01
+    df.loc[holes, 'Nombre'] = None
+    df.loc[rng.random(rows) < 0.01, 'Mesa'] = np.nan
+    return df
+
+
+def legacy_normalize(df):
+    """The per-row normalization the upload views used before ``normalize_frame``."""
+    import pandas as pd  # type: ignore
+
+    records = []
+    for index, row in df.iterrows():
+        dni_val = '' if pd.isna(row.get('dni')) else str(row.get('dni')).strip()
+        last_name = '' if pd.isna(row.get('Apellido')) else str(row.get('Apellido')).strip()
+        first_name = '' if pd.isna(row.get('Nombre')) else str(row.get('Nombre')).strip()
+        sex = '' if pd.isna(row.get('Sexo')) else str(row.get('Sexo')).strip().upper()
+        address = '' if pd.isna(row.get('Direccion')) else str(row.get('Direccion')).strip()
+        mesa = None if pd.isna(row.get('Mesa')) else int(row.get('Mesa')) if str(row.get('Mesa')).strip().isdigit() else None
+        orden = None if pd.isna(row.get('Orden')) else int(row.get('Orden')) if str(row.get('Orden')).strip().isdigit() else None
+        establecimiento = '' if pd.isna(row.get('Establecimiento')) else str(row.get('Establecimiento')).strip()
+        if not dni_val or not last_name or not first_name:
+            continue
+        records.append((dni_val, last_name, first_name, sex, address, mesa, orden, establecimiento))
+    return records
+
+
+def legacy_dni_lookup(client_id, dni):
+    """search_voter_by_dni before the single-query lookup: full count, voter, then lazy zone."""
+    from voting.models import Voter
+
+    if Voter.objects.filter(client_id=client_id).count() == 0:
+        return {"status": "no_data"}
+    voter = Voter.objects.filter(client_id=client_id, dni=dni).first()
+    if not voter:
+        return {"status": "not_found"}
+    return {"status": "success", "voter": {"id": voter.id, "zone": voter.zone.name if voter.zone else 'Sin asignar'}}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Run a micro-benchmark scenario (see subcommands)."
+
+    def add_arguments(self, parser):
+        scenarios = parser.add_subparsers(dest='scenario', required=True)
+
+        normalize = scenarios.add_parser('normalize', help="Per-row vs column-wise padrón normalization.")
+        normalize.add_argument('--rows', type=int, default=100_000)
+        normalize.add_argument('--repeat', type=int, default=3)
+
+        formats = scenarios.add_parser('formats', help="Parse time per upload format for the same padrón.")
+        formats.add_argument('--rows', type=int, default=200_000)
+
+        stats = scenarios.add_parser('stats', help="Dashboards polling voter/zone stats: uncached vs cached vs ETag.")
+        stats.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to poll.")
+        stats.add_argument('--dashboards', type=int, default=200, help="Concurrent dashboards polling.")
+        stats.add_argument('--polls', type=int, default=5, help="Polls per dashboard (each hits both endpoints).")
+        stats.add_argument('--workers', type=int, default=16, help="Server threads serving the dashboards.")
+
+        search = scenarios.add_parser('search', help="Voter search latency (p50/p95) by query kind.")
+        search.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to search.")
+        search.add_argument('--seed-rows', type=int, default=0, help="Import this many synthetic voters first (e.g. 1000000).")
+        search.add_argument('--queries', type=int, default=200, help="Queries per kind.")
+
+        lookup = scenarios.add_parser('lookup', help="DNI lookup latency: count + fetch + zone vs single query.")
+        lookup.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to search.")
+        lookup.add_argument('--lookups', type=int, default=1000, help="Lookups per variant (90% hits, 10% misses).")
+
+        index = scenarios.add_parser('dni-index', help="In-process DNI index: load time, memory, lookups vs the database.")
+        index.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to index.")
+        index.add_argument('--lookups', type=int, default=2000)
+
+        conns = scenarios.add_parser('connections', help="get_voter_stats latency: new connection per request vs persistent vs pool.")
+        conns.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to poll.")
+        conns.add_argument('--requests', type=int, default=300)
+
+        purge = scenarios.add_parser('purge', help="Deleting a client's list: count + QuerySet.delete() vs set-based purge.")
+        purge.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to fill and empty (its list is deleted).")
+        purge.add_argument('--rows', type=int, default=500_000)
+        purge.add_argument('--zones', type=int, default=20)
+        purge.add_argument('--repeat', type=int, default=1, help="Rounds; the order of the two variants alternates.")
+
+        replace = scenarios.add_parser('replace', help="List replacement: purge + import vs staging table swap.")
+        replace.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id whose list is replaced.")
+        replace.add_argument('--rows', type=int, default=200_000)
+
+        copy = scenarios.add_parser('copy', help="First load of an empty client: import_voters (bulk upserts) vs COPY.")
+        copy.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id to fill (its list is deleted).")
+        copy.add_argument('--rows', type=int, default=1_000_000)
+
+        parts = scenarios.add_parser('partitions', help="Small client next to a large one: plain vs hash-partitioned voter table.")
+        parts.add_argument('--big-rows', type=int, default=2_000_000)
+        parts.add_argument('--small-rows', type=int, default=3_000)
+        parts.add_argument('--partitions', type=int, default=16)
+        parts.add_argument('--lookups', type=int, default=1000)
+
+        load = scenarios.add_parser('load', help="Concurrent-connection load test against a running server (sync vs ASGI).")
+        load.add_argument('--client', type=int, required=True, dest='client_id', help="ClientProfile id whose session is used.")
+        load.add_argument('--base-url', default='http://127.0.0.1:8000', help="Server under test.")
+        load.add_argument('--path', default='/voting/voter_stats/')
+        load.add_argument('--slow', type=int, default=20, help="Slow clients trickling their request headers.")
+        load.add_argument('--slow-seconds', type=float, default=8.0, help="Time each slow client takes to send its request.")
+        load.add_argument('--concurrency', type=int, default=10, help="Fast clients polling back to back.")
+        load.add_argument('--duration', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['scenario'].replace('-', '_')}")(**options)
+
+    def report(self, label, seconds, rows=None, unit='rows'):
+        rate = f"  ({rows / seconds:,.0f} {unit}/s)" if rows and seconds else ''
+        self.stdout.write(f"{label:<40} {seconds * 1000:>10.1f} ms{rate}")
+
+    def bench_normalize(self, rows, repeat, **options):
+        from voting.importer import normalize_frame
+
+        df = synthetic_padron(rows)
+        self.stdout.write(f"normalize: {rows:,} rows, best of {repeat}")
+        legacy = min(timed(legacy_normalize, df)[1] for _ in range(repeat))
+        vectorized = min(timed(normalize_frame, df)[1] for _ in range(repeat))
+        self.report('per-row (iterrows)', legacy, rows)
+        self.report('column-wise (normalize_frame)', vectorized, rows)
+        self.stdout.write(f"speedup: {legacy / vectorized:.1f}x")
+
+    def bench_formats(self, rows, **options):
+        import tempfile
+
+        from openpyxl import Workbook  # type: ignore
+
+        from voting.importer import open_voter_file
+
+        df = synthetic_padron(rows)
+        self.stdout.write(f"formats: {rows:,} rows, full read + normalization")
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {ext: f"{tmp}/padron{ext}" for ext in ('.csv', '.parquet', '.xlsx')}
+            df.to_csv(paths['.csv'], index=False)
+            df.to_parquet(paths['.parquet'], index=False)
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False, name=None):
+                ws.append([None if v != v else v for v in row])  # NaN -> empty cell
+            wb.save(paths['.xlsx'])
+
+            for ext, path in paths.items():
+                def parse():
+                    with open(path, 'rb') as f:
+                        return sum(len(clean) for clean, _ in open_voter_file(f, path).chunks())
+                parsed, seconds = timed(parse)
+                self.report(f"{ext} ({parsed:,} valid rows)", seconds, rows)
+
+    def bench_stats(self, client_id, dashboards, polls, workers, **options):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from django.conf import settings
+        from django.db import connection
+        from django.test import Client, override_settings
+        from django.urls import reverse
+
+        from voting.models import ClientProfile
+
+        profile = ClientProfile.objects.select_related('user').get(id=client_id)
+        urls = [reverse('voting:get_voter_stats'), reverse('voting:get_zone_stats')]
+        login = Client()
+        login.force_login(profile.user)
+        cookies = login.cookies
+
+        def dashboard(conditional):
+            # One browser tab: polls both endpoints, replaying ETags when conditional
+            client = Client()
+            client.cookies = cookies
+            etags = {}
+            codes = []
+            try:
+                for _ in range(polls):
+                    for url in urls:
+                        headers = {'If-None-Match': etags[url]} if conditional and url in etags else {}
+                        response = client.get(url, headers=headers)
+                        etags[url] = response.get('ETag', '')
+                        codes.append(response.status_code)
+            finally:
+                connection.close()
+            return codes
+
+        def run(conditional):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return [code for codes in pool.map(dashboard, [conditional] * dashboards) for code in codes]
+
+        requests = dashboards * polls * len(urls)
+        self.stdout.write(f"stats: {dashboards} dashboards x {polls} polls x {len(urls)} endpoints on {workers} threads")
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            dummy = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            with override_settings(CACHES=dummy):
+                _, seconds = timed(run, False)
+            self.report('uncached (DB on every poll)', seconds, requests, 'req')
+            _, seconds = timed(run, False)
+            self.report('cached payload', seconds, requests, 'req')
+            codes, seconds = timed(run, True)
+            self.report(f"cached + ETag ({codes.count(304)} x 304)", seconds, requests, 'req')
+
+    def bench_search(self, client_id, seed_rows, queries, **options):
+        import numpy as np  # type: ignore
+
+        from voting.counters import recompute_client_counters
+        from voting.importer import import_voters, normalize_frame
+        from voting.models import ClientProfile, Voter, Zone
+        from voting.search import search_voters, trigram_available
+
+        profile = ClientProfile.objects.get(id=client_id)
+        rng = np.random.default_rng(1)
+        if seed_rows:
+            df = synthetic_padron(seed_rows, seed=1)
+            # Realistic spread of surnames (the padrón generator only has a handful)
+            syllables = np.array(['GO', 'ME', 'RO', 'DRI', 'FER', 'NAN', 'LO', 'PE', 'SAN', 'TOS', 'VAL', 'DEZ', 'RI', 'QUE', 'MAR', 'TIN'])
+            parts = rng.choice(syllables, (seed_rows, 3))
+            df['Apellido'] = [''.join(p) for p in parts]
+            zone, _ = Zone.objects.get_or_create(client=profile, name='bench-search')
+            chunks = (normalize_frame(df.iloc[i:i + 50_000], first_row=i + 2) for i in range(0, seed_rows, 50_000))
+            result, seconds = timed(import_voters, profile, chunks, zone)
+            recompute_client_counters(profile)
+            self.report(f"seed ({result.created:,} created)", seconds, seed_rows)
+
+        total = Voter.objects.filter(client=profile).count()
+        sample = list(
+            Voter.objects.filter(client=profile).order_by('?')
+            .values_list('dni', 'last_name', 'first_name', 'establecimiento')[:queries]
+        )
+        if not sample:
+            self.stdout.write("search: the client has no voters (use --seed-rows)")
+            return
+
+        def typo(word):
+            if len(word) < 4:
+                return word
+            i = int(rng.integers(1, len(word) - 1))
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+        kinds = {
+            'dni prefix (5 digits)': [dni[:5] for dni, *_ in sample],
+            'surname': [last for _, last, _, _ in sample],
+            'surname with typo': [typo(last) for _, last, _, _ in sample],
+            'surname + first name': [f"{last} {first}" for _, last, first, _ in sample],
+            'establecimiento': [school for *_, school in sample if school],
+        }
+        mode = 'pg_trgm' if trigram_available() else 'substring fallback'
+        self.stdout.write(f"search: {total:,} voters, {len(sample)} queries per kind, {mode}")
+        for label, terms in kinds.items():
+            latencies = []
+            for term in terms:
+                _, seconds = timed(search_voters, profile.id, term)
+                latencies.append(seconds * 1000)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            self.stdout.write(f"{label:<40} p50 {p50:>8.1f} ms   p95 {p95:>8.1f} ms")
+
+    def bench_lookup(self, client_id, lookups, **options):
+        import numpy as np  # type: ignore
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from voting.models import Voter
+        from voting.views import lookup_voter_by_dni
+
+        dnis = list(Voter.objects.filter(client_id=client_id).order_by('?').values_list('dni', flat=True)[:lookups])
+        if not dnis:
+            self.stdout.write("lookup: the client has no voters")
+            return
+        # One in ten lookups is a mistyped DNI
+        dnis = [dni if i % 10 else f"X{dni}" for i, dni in enumerate(dnis)]
+        total = Voter.objects.filter(client_id=client_id).count()
+        self.stdout.write(f"lookup: {len(dnis)} DNIs against {total:,} voters")
+        for label, lookup in (('count + fetch + zone', legacy_dni_lookup), ('single query', lookup_voter_by_dni)):
+            latencies = []
+            with CaptureQueriesContext(connection) as queries:
+                for dni in dnis:
+                    _, seconds = timed(lookup, client_id, dni)
+                    latencies.append(seconds * 1000)
+            p50, p95 = np.percentile(latencies, [50, 95])
+            per_lookup = len(queries.captured_queries) / len(dnis)
+            self.stdout.write(f"{label:<40} p50 {p50:>7.2f} ms   p95 {p95:>7.2f} ms   {per_lookup:.1f} queries")
+
+    def bench_dni_index(self, client_id, lookups, **options):
+        from voting import dni_index
+        from voting.models import Voter
+
+        dnis = list(Voter.objects.filter(client_id=client_id).order_by('?').values_list('dni', flat=True)[:lookups])
+        if not dnis:
+            self.stdout.write("dni-index: the client has no voters")
+            return
+        dni_index.invalidate(client_id)
+        _, seconds = timed(dni_index.lookup, client_id, dnis[0])
+        loaded = dni_index.stats()['clients'][client_id]
+        self.stdout.write(f"dni-index: {loaded['voters']:,} voters, {loaded['bytes'] / 1e6:.1f} MB in this process")
+        self.report('load (first lookup)', seconds, loaded['voters'])
+
+        def from_db():
+            for dni in dnis:
+                Voter.objects.filter(client_id=client_id, dni=dni).only('id', 'client_id', 'zone_id').first()
+
+        def from_index():
+            for dni in dnis:
+                dni_index.lookup(client_id, dni)
+
+        _, seconds = timed(from_db)
+        self.report('database (unique index)', seconds, len(dnis), 'lookups')
+        _, seconds = timed(from_index)
+        self.report('in-process index', seconds, len(dnis), 'lookups')
+        self.stdout.write(f"hit ratio: {dni_index.stats()['clients'][client_id]['hit_ratio']}")
+
+    def bench_purge(self, client_id, rows, zones, repeat, **options):
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+
+        from voting.models import Voter, Zone
+        from voting.purge import purge_client_voters
+
+        def seed():
+            purge_client_voters(client_id)
+            zone_ids = [Zone.objects.create(client_id=client_id, name=f"bench-purge-{n}").id for n in range(zones)]
+            batch = []
+            for n in range(rows):
+                batch.append(Voter(client_id=client_id, zone_id=zone_ids[n % zones], dni=str(30_000_000 + n),
+                                   last_name='PEREZ', first_name='ANA', mesa=n % 400 + 1, orden=n % 350 + 1, voted=n % 3 == 0))
+                if len(batch) == 10_000:
+                    Voter.objects.bulk_create(batch)
+                    batch = []
+            Voter.objects.bulk_create(batch)
+            if connection.vendor == 'postgresql':
+                # Dead rows from the previous round would otherwise slow the next delete
+                with connection.cursor() as cursor:
+                    cursor.execute("VACUUM ANALYZE voting_voter")
+
+        def legacy():
+            # clear_voters before the purge routine
+            with transaction.atomic():
+                voters = Voter.objects.filter(client_id=client_id)
+                deleted = voters.count()
+                voters.delete()
+                zones_qs = Zone.objects.filter(client_id=client_id)
+                zones_deleted = zones_qs.count()
+                zones_qs.delete()
+            return deleted, zones_deleted
+
+        variants = [('count + QuerySet.delete()', legacy), ('purge_client_voters', lambda: purge_client_voters(client_id))]
+        self.stdout.write(f"purge: {rows:,} voters in {zones} zones, {repeat} round(s)")
+        for round_number in range(repeat):
+            for label, delete in variants[::-1] if round_number % 2 else variants:
+                _, seconds = timed(seed)
+                self.report('seed', seconds, rows)
+                with CaptureQueriesContext(connection) as queries:
+                    (deleted, zones_deleted), seconds = timed(delete)
+                self.report(f"{label} ({len(queries.captured_queries)} queries)", seconds, deleted)
+                assert (deleted, zones_deleted) == (rows, zones)
+
+    def bench_replace(self, client_id, rows, **options):
+        from django.db import connection
+
+        from voting import bulkload
+        from voting.importer import ImportResult, import_voters, normalize_frame
+        from voting.models import ClientProfile, Zone
+        from voting.purge import purge_client_voters
+
+        if not bulkload.supported():
+            self.stdout.write("replace: the staging swap needs PostgreSQL")
+            return
+        profile = ClientProfile.objects.get(id=client_id)
+        df = synthetic_padron(rows, seed=2)
+        frames = [normalize_frame(df.iloc[i:i + 5000], first_row=i + 2) for i in range(0, rows, 5000)]
+
+        def purge_and_import():
+            purge_client_voters(client_id)
+            zone, _ = Zone.objects.get_or_create(client=profile, name='Sin asignar')
+            import_voters(profile, iter(frames), zone)
+
+        self.stdout.write(f"replace: {rows:,} voters replaced by {rows:,}")
+        _, seconds = timed(purge_and_import)
+        self.report('seed', seconds, rows)
+        # The whole run leaves the list empty or partial
+        _, seconds = timed(purge_and_import)
+        self.report('purge + import (list incomplete)', seconds, rows)
+
+        with connection.cursor() as cursor:
+            bulkload._create_staging(cursor)
+            loaded, load_seconds = timed(bulkload._load_staging, cursor, iter(frames), ImportResult(), None)
+            self.report('staging COPY (old list readable)', load_seconds, rows)
+            _, swap_seconds = timed(bulkload._swap, cursor, client_id, 'Sin asignar', True)
+            self.report('swap transaction (rows locked)', swap_seconds, loaded)
+            cursor.execute(f"DROP TABLE IF EXISTS {bulkload.STAGING_TABLE}")
+        self.report('staging total', load_seconds + swap_seconds, rows)
+
+    def bench_copy(self, client_id, rows, **options):
+        from voting import bulkload
+        from voting.importer import import_voters, normalize_frame
+        from voting.models import ClientProfile, Zone
+        from voting.purge import purge_client_voters
+
+        if not bulkload.supported():
+            self.stdout.write("copy: COPY needs PostgreSQL")
+            return
+        df = synthetic_padron(rows, seed=3)
+        frames = [normalize_frame(df.iloc[i:i + 5000], first_row=i + 2) for i in range(0, rows, 5000)]
+        self.stdout.write(f"copy: {rows:,} rows into an empty client (normalization not timed)")
+        for label, load in (('import_voters', import_voters), ('load_new_voters (COPY)', bulkload.load_new_voters)):
+            purge_client_voters(client_id)
+            profile = ClientProfile.objects.get(id=client_id)
+            zone = Zone.objects.create(client=profile, name='Sin asignar')
+            result, seconds = timed(load, profile, iter(frames), zone)
+            self.report(f"{label} ({result.created:,} created)", seconds, rows)
+        purge_client_voters(client_id)
+
+    def bench_partitions(self, big_rows, small_rows, partitions, lookups, **options):
+        """Scratch tables shaped like voting_voter (same hot indexes), not the real one."""
+        import numpy as np  # type: ignore
+        from django.db import connection
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write("partitions: needs PostgreSQL")
+            return
+        big_client = 1
+        cursor = connection.cursor()
+
+        def create(table, partitioned):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            columns = "id bigint NOT NULL, client_id bigint NOT NULL, dni varchar(20) NOT NULL, voted boolean NOT NULL, zone_id bigint, mesa integer, orden integer"
+            if partitioned:
+                cursor.execute(f"CREATE TABLE {table} ({columns}) PARTITION BY HASH (client_id)")
+                for n in range(partitions):
+                    cursor.execute(f"CREATE TABLE {table}_p{n} PARTITION OF {table} FOR VALUES WITH (MODULUS {partitions}, REMAINDER {n})")
+            else:
+                cursor.execute(f"CREATE TABLE {table} ({columns})")
+
+        def fill(table, client_id, rows, first_id):
+            cursor.execute(
+                f"INSERT INTO {table} SELECT g, %s, (20000000 + g)::text, g %% 3 = 0, 1, g %% 400, g %% 350"
+                f" FROM generate_series(%s, %s) g", [client_id, first_id, first_id + rows - 1],
+            )
+
+        def partition_of(table, client_id):
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {table} WHERE client_id = %s LIMIT 1", [client_id])
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        # Pick one small client hashed next to the big one and one hashed elsewhere
+        create('bench_voter_hash', True)
+        fill('bench_voter_hash', big_client, 1, 0)
+        big_partition = partition_of('bench_voter_hash', big_client)
+        small = {}
+        for client_id in range(2, 2 + 50 * partitions):
+            fill('bench_voter_hash', client_id, 1, 0)
+            key = 'same partition' if partition_of('bench_voter_hash', client_id) == big_partition else 'other partition'
+            small.setdefault(key, client_id)
+            if len(small) == 2:
+                break
+
+        for table, partitioned in (('bench_voter_plain', False), ('bench_voter_hash', True)):
+            create(table, partitioned)
+            fill(table, big_client, big_rows, 1)
+            for n, client_id in enumerate(small.values()):
+                fill(table, client_id, small_rows, big_rows + 1 + n * small_rows)
+            cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, client_id)")
+            cursor.execute(f"CREATE UNIQUE INDEX ON {table} (client_id, dni)")
+            cursor.execute(f"CREATE INDEX ON {table} (client_id, voted)")
+            cursor.execute(f"CREATE INDEX ON {table} (client_id, mesa, orden) WHERE NOT voted")
+            cursor.execute(f"VACUUM ANALYZE {table}")
+
+        self.stdout.write(f"partitions: {big_rows:,}-voter client + {small_rows:,}-voter clients, {partitions} hash partitions")
+        for label, client_id in sorted(small.items()):
+            cursor.execute("SELECT dni FROM bench_voter_plain WHERE client_id = %s ORDER BY random() LIMIT %s", [client_id, lookups])
+            dnis = [dni for dni, in cursor.fetchall()]
+            for table in ('bench_voter_plain', 'bench_voter_hash'):
+                latencies = []
+                for dni in dnis:
+                    _, seconds = timed(cursor.execute, f"SELECT id FROM {table} WHERE client_id = %s AND dni = %s", [client_id, dni])
+                    cursor.fetchall()
+                    latencies.append(seconds * 1000)
+                pending = []
+                for _ in range(50):
+                    _, seconds = timed(cursor.execute, f"SELECT id FROM {table} WHERE client_id = %s AND NOT voted ORDER BY mesa, orden LIMIT 100", [client_id])
+                    cursor.fetchall()
+                    pending.append(seconds * 1000)
+                # Purge, then vacuum what it dirtied: the whole table, or only the client's partition
+                vacuumed = partition_of(table, client_id)
+                _, purge_seconds = timed(cursor.execute, f"DELETE FROM {table} WHERE client_id = %s", [client_id])
+                _, vacuum_seconds = timed(cursor.execute, f"VACUUM {vacuumed}")
+                p50, p95 = np.percentile(latencies, [50, 95])
+                self.stdout.write(
+                    f"{label:<16} {table:<18} lookup p50 {p50:.3f} p95 {p95:.3f} ms   pending page {np.median(pending):.2f} ms"
+                    f"   purge {purge_seconds * 1000:.1f} ms   vacuum {vacuum_seconds * 1000:.1f} ms"
+                )
+        for table in ('bench_voter_plain', 'bench_voter_hash'):
+            cursor.execute(f"DROP TABLE {table}")
+
+    def bench_connections(self, client_id, requests, **options):
+        import numpy as np  # type: ignore
+        from django.conf import settings
+        from django.db import close_old_connections, connections
+        from django.test import Client, override_settings
+        from django.urls import reverse
+
+        from voting.models import ClientProfile
+
+        profile = ClientProfile.objects.select_related('user').get(id=client_id)
+        client = Client()
+        client.force_login(profile.user)
+        url = reverse('voting:get_voter_stats')
+        wrapper = connections['default']
+        original = dict(wrapper.settings_dict, OPTIONS=dict(wrapper.settings_dict['OPTIONS']))
+        modes = [
+            ('new connection per request', {'CONN_MAX_AGE': 0}),
+            ('persistent', {'CONN_MAX_AGE': 600}),
+            ('persistent + health checks', {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True}),
+            ('psycopg pool (max 4)', {'CONN_MAX_AGE': 0, 'OPTIONS': {**original['OPTIONS'], 'pool': {'min_size': 1, 'max_size': 4}}}),
+        ]
+
+        def request():
+            # The test client skips the connection housekeeping of a real request; replay it
+            close_old_connections()
+            client.get(url)
+            close_old_connections()
+
+        def connect():
+            wrapper.connect()
+            wrapper.close()
+
+        _, seconds = timed(lambda: [connect() for _ in range(50)])
+        self.stdout.write(f"connections: {requests} sequential GET {url}; opening a connection costs {seconds / 50 * 1000:.2f} ms here")
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for label, overrides in modes:
+                if 'pool' in overrides.get('OPTIONS', {}):
+                    if importlib.util.find_spec('psycopg_pool') is None:
+                        self.stdout.write(f"{label:<40} skipped: needs psycopg[pool]")
+                        continue
+                wrapper.close()
+                wrapper.settings_dict.update(overrides)
+                try:
+                    client.get(url)  # warm up (opens the pool)
+                    latencies = [timed(request)[1] * 1000 for _ in range(requests)]
+                finally:
+                    wrapper.close()
+                    if wrapper.alias in wrapper._connection_pools:
+                        wrapper.close_pool()
+                    wrapper.settings_dict.clear()
+                    wrapper.settings_dict.update(original)
+                p50, p95 = np.percentile(latencies, [50, 95])
+                self.stdout.write(f"{label:<40} p50 {p50:>7.2f} ms   p95 {p95:>7.2f} ms")
+
+    def bench_load(self, client_id, base_url, path, slow, slow_seconds, concurrency, duration, **options):
+        import asyncio
+        from urllib.parse import urlsplit
+
+        import numpy as np  # type: ignore
+        from django.conf import settings
+        from django.test import Client
+
+        from voting.models import ClientProfile
+
+        profile = ClientProfile.objects.select_related('user').get(id=client_id)
+        login = Client()
+        login.force_login(profile.user)
+        cookie = login.cookies[settings.SESSION_COOKIE_NAME].value
+        url = urlsplit(base_url)
+        host, port = url.hostname, url.port or 80
+        request_lines = [f"GET {path} HTTP/1.1", f"Host: {host}", f"Cookie: {settings.SESSION_COOKIE_NAME}={cookie}", "Connection: close"]
+
+        async def get(pause=0.0):
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                # A slow client (phone on a bad network) sends its headers a line at a time
+                for line in request_lines:
+                    writer.write(f"{line}\r\n".encode())
+                    await writer.drain()
+                    if pause:
+                        await asyncio.sleep(pause)
+                writer.write(b"\r\n")
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                await reader.read()
+                return status
+            finally:
+                writer.close()
+
+        async def fast_client(deadline, latencies, failures):
+            loop = asyncio.get_running_loop()
+            while loop.time() < deadline:
+                start = loop.time()
+                try:
+                    status = await asyncio.wait_for(get(), timeout=10)
+                except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                    failures.append(None)
+                    continue
+                if status == 200:
+                    latencies.append((loop.time() - start) * 1000)
+                else:
+                    failures.append(status)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            slow_tasks = [asyncio.create_task(get(pause=slow_seconds / len(request_lines))) for _ in range(slow)]
+            await asyncio.sleep(0.5)  # let the slow clients occupy their connections
+            latencies, failures = [], []
+            deadline = loop.time() + duration
+            await asyncio.gather(*[fast_client(deadline, latencies, failures) for _ in range(concurrency)])
+            slow_results = await asyncio.gather(*slow_tasks, return_exceptions=True)
+            return latencies, failures, sum(1 for r in slow_results if r == 200)
+
+        self.stdout.write(
+            f"load: {base_url}{path}, {slow} slow clients ({slow_seconds:.0f} s each) + {concurrency} fast clients for {duration:.0f} s"
+        )
+        latencies, failures, slow_ok = asyncio.run(run())
+        if latencies:
+            p50, p95 = np.percentile(latencies, [50, 95])
+            self.stdout.write(f"fast requests: {len(latencies)} ok ({len(latencies) / duration:.1f} req/s), p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+        else:
+            self.stdout.write("fast requests: none completed")
+        self.stdout.write(f"failed or timed out: {len(failures)}; slow clients served: {slow_ok}/{slow}")
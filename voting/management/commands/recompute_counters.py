@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from voting.counters import recompute_client_counters
+from voting.models import ClientProfile
+
+
+def _recompute(profile):
+    # Each pool thread uses its own DB connection; release it afterwards
+    try:
+        recompute_client_counters(profile)
+        profile.refresh_from_db(fields=['total_voters', 'voted_count'])
+        return profile
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized voter counters for every client (or the given ones) in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', type=int, action='append', dest='client_ids', help="ClientProfile id (repeatable).")
+        parser.add_argument('--workers', type=int, default=4, help="Clients recomputed concurrently.")
+
+    def handle(self, *args, client_ids, workers, **options):
+        profiles = ClientProfile.objects.only('id', 'organization_name').order_by('id')
+        if client_ids:
+            profiles = profiles.filter(id__in=client_ids)
+            missing = set(client_ids) - {p.id for p in profiles}
+            if missing:
+                raise CommandError(f"ClientProfile inexistente: {', '.join(map(str, sorted(missing)))}")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for profile in pool.map(_recompute, list(profiles)):
+                self.stdout.write(f"{profile.id} {profile.organization_name}: {profile.voted_count}/{profile.total_voters}")
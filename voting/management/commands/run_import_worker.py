@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from voting.jobs import claim_next_job, fail_abandoned_jobs, run_import_job
+
+
+def _run_in_thread(job_id):
+    # Pool threads hold their own DB connection; drop it when the job is done
+    close_old_connections()
+    try:
+        run_import_job(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Process queued voter import jobs on a local thread pool (no broker required)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help="Jobs processed concurrently.")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between queue checks when idle.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+
+    def handle(self, *args, threads, poll, once, **options):
+        threads = max(1, threads)
+        # Jobs left running by a worker that died (claims also check this on every poll)
+        abandoned = fail_abandoned_jobs()
+        if abandoned:
+            self.stdout.write(f"{abandoned} importación(es) interrumpida(s) marcada(s) como error")
+        running = set()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='import-job') as pool:
+            while True:
+                running = {f for f in running if not f.done()}
+                job = claim_next_job() if len(running) < threads else None
+                if job is not None:
+                    self.stdout.write(f"Procesando importación #{job.id}")
+                    running.add(pool.submit(_run_in_thread, job.id))
+                    continue
+                if once and not running:
+                    break
+                close_old_connections()
+                time.sleep(poll if not once else 0.1)
@@ -1,2 +1,112 @@
+"""Per-request resolution of the acting ClientProfile (client user or its visitor account)."""
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+from .models import ClientProfile
+
 # LanguageMiddleware removed as the application no longer uses runtime i18n.
 # All UI text is hardcoded to Spanish in templates and views.
+
+ROLE_CLIENT = 'client'
+ROLE_VISITOR = 'visitor'
+
+# Process-local user id -> (expires_at, client_id, role); cleared on any ClientProfile change.
+# The TTL bounds staleness in the other worker processes, which never see the signal: the
+# mapping decides whose voters a user may touch, so a reassigned visitor account must not
+# keep acting for its old client for long. A fiscal marking voters still hits it on nearly
+# every request.
+CACHE_SIZE = 4096
+CACHE_TTL = 10
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cached(user_pk):
+    with _lock:
+        hit = _cache.get(user_pk)
+        if hit is not None and hit[0] > time.monotonic():
+            _cache.move_to_end(user_pk)
+            return hit[1], hit[2]
+    return None
+
+
+def resolve_client(user):
+    """Return ``(client_id, role)`` for ``user``, or ``(None, None)`` if it acts for no client."""
+    if not user.is_authenticated:
+        return None, None
+    hit = _cached(user.pk)
+    if hit is not None:
+        return hit
+
+    now = time.monotonic()
+    client_id, role = None, None
+    for profile_id, owner_id in ClientProfile.objects.filter(Q(user_id=user.pk) | Q(visitor_user_id=user.pk)).values_list('id', 'user_id')[:2]:
+        # Owning a profile wins over being someone's visitor account
+        if owner_id == user.pk:
+            client_id, role = profile_id, ROLE_CLIENT
+            break
+        client_id, role = profile_id, ROLE_VISITOR
+
+    with _lock:
+        _cache[user.pk] = (now + CACHE_TTL, client_id, role)
+        _cache.move_to_end(user.pk)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return client_id, role
+
+
+async def aresolve_client(user):
+    """``resolve_client`` for async code: only a cache miss leaves the event loop."""
+    if not user.is_authenticated:
+        return None, None
+    hit = _cached(user.pk)
+    if hit is not None:
+        return hit
+    return await sync_to_async(resolve_client)(user)
+
+
+@receiver(post_save, sender=ClientProfile)
+@receiver(post_delete, sender=ClientProfile)
+def clear_client_cache(sender, **kwargs):
+    # Profiles rarely change (and counter updates bypass save()), so drop everything
+    with _lock:
+        _cache.clear()
+
+
+class ClientProfileMiddleware:
+    """Set ``request.client_id``, ``request.client_role`` and a lazy ``request.client_profile``.
+
+    Resolution costs no query on a cache hit; the profile row itself is only
+    fetched if a view reads ``request.client_profile``. Runs natively under
+    ASGI too, so async views are not pushed through a thread for it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self._annotate(request, *resolve_client(request.user))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._annotate(request, *await aresolve_client(await request.auser()))
+        return await self.get_response(request)
+
+    @staticmethod
+    def _annotate(request, client_id, role):
+        request.client_id = client_id
+        request.client_role = role
+        request.client_profile = SimpleLazyObject(lambda: ClientProfile.objects.get(id=client_id)) if client_id else None
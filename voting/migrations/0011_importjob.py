@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0010_remove_voter_name_voter_address_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zone_name', models.CharField(max_length=120)),
+                ('replace', models.BooleanField(default=False)),
+                ('filename', models.CharField(blank=True, default='', max_length=255)),
+                ('payload', models.BinaryField(default=b'')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Procesando'), ('done', 'Completado'), ('failed', 'Error')], default='pending', max_length=10)),
+                ('rows_processed', models.IntegerField(default=0)),
+                ('created', models.IntegerField(default=0)),
+                ('updated', models.IntegerField(default=0)),
+                ('skipped', models.IntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='voting.clientprofile')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='importjob_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0011_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientprofile',
+            name='stats_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
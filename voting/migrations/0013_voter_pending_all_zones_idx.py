@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0012_clientprofile_stats_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voter',
+            index=models.Index(condition=models.Q(('voted', False)), fields=['client', 'mesa', 'orden'], name='voter_c_mo_notv'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import DatabaseError, migrations, transaction
+
+# Index name -> Voter column, all GIN with gin_trgm_ops
+TRIGRAM_INDEXES = {
+    'voter_last_name_trgm': 'last_name',
+    'voter_first_name_trgm': 'first_name',
+    'voter_establecimiento_trgm': 'establecimiento',
+    'voter_dni_trgm': 'dni',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Install pg_trgm and the search indexes when the server allows it.
+
+    Servers without the extension (or without the privilege to create it) keep
+    working: voting/search.py falls back to substring matching.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    table = apps.get_model('voting', 'Voter')._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            return
+        for name, column in TRIGRAM_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)")
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name in TRIGRAM_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0014_offline_sync_sequences'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
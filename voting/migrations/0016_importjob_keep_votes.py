@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0015_voter_trigram_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='keep_votes',
+            field=models.BooleanField(default=False),
+        ),
+    ]
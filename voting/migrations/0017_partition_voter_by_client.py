@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# Hash partitions of voting_voter; changing it means running this rebuild again
+VOTER_PARTITIONS = 16
+
+
+def _rebuild_voter_table(schema_editor, partitions):
+    """Recreate voting_voter as a hash-partitioned table (``partitions``) or a plain one (0).
+
+    Rows are copied inside the migration's transaction, so the table is locked
+    for the duration: run it in a maintenance window on large databases.
+    Foreign keys, unique constraints and every other index (including the
+    optional pg_trgm ones from 0015) are read from the catalog and recreated
+    with their names; on a partitioned table each becomes a partitioned index.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = 'voting_voter'::regclass AND contype IN ('u', 'f') ORDER BY conname"
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'voting_voter'"
+            " AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'voting_voter'::regclass)"
+            " ORDER BY indexname"
+        )
+        indexes = [indexdef for indexdef, in cursor.fetchall()]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM voting_voter")
+        next_id, = cursor.fetchone()
+
+        # Columns, NOT NULL and CHECK constraints; no defaults (the id default depends on the old table)
+        if partitions:
+            cursor.execute("CREATE TABLE voting_voter_new (LIKE voting_voter INCLUDING CONSTRAINTS) PARTITION BY HASH (client_id)")
+            for remainder in range(partitions):
+                cursor.execute(
+                    f"CREATE TABLE voting_voter_p{remainder} PARTITION OF voting_voter_new"
+                    f" FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+        else:
+            cursor.execute("CREATE TABLE voting_voter_new (LIKE voting_voter INCLUDING CONSTRAINTS)")
+        cursor.execute("INSERT INTO voting_voter_new SELECT * FROM voting_voter")
+        cursor.execute("DROP TABLE voting_voter")
+        cursor.execute("ALTER TABLE voting_voter_new RENAME TO voting_voter")
+
+        if partitions:
+            # Partitioned tables only take identity columns from PostgreSQL 17: use an owned sequence.
+            # The primary key must include the partition key; id first so lookups by id still use it.
+            cursor.execute("CREATE SEQUENCE voting_voter_id_seq OWNED BY voting_voter.id")
+            cursor.execute("ALTER TABLE voting_voter ALTER COLUMN id SET DEFAULT nextval('voting_voter_id_seq')")
+            cursor.execute("SELECT setval('voting_voter_id_seq', %s, false)", [next_id])
+            cursor.execute("ALTER TABLE voting_voter ADD CONSTRAINT voting_voter_pkey PRIMARY KEY (id, client_id)")
+        else:
+            cursor.execute("ALTER TABLE voting_voter ADD CONSTRAINT voting_voter_pkey PRIMARY KEY (id)")
+            cursor.execute("ALTER TABLE voting_voter ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+            cursor.execute("SELECT setval(pg_get_serial_sequence('voting_voter', 'id'), %s, false)", [next_id])
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE voting_voter ADD CONSTRAINT {name} {definition}")
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+
+
+def partition_voters(apps, schema_editor):
+    _rebuild_voter_table(schema_editor, VOTER_PARTITIONS)
+
+
+def unpartition_voters(apps, schema_editor):
+    _rebuild_voter_table(schema_editor, 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0016_importjob_keep_votes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_voters, unpartition_voters),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_mesa_turnout(apps, schema_editor):
+    Voter = apps.get_model('voting', 'Voter')
+    MesaTurnout = apps.get_model('voting', 'MesaTurnout')
+    groups = (
+        Voter.objects.order_by().values('client_id', 'establecimiento', 'mesa')
+        .annotate(total=Count('id'), voted=Count('id', filter=Q(voted=True)))
+    )
+    MesaTurnout.objects.bulk_create([
+        MesaTurnout(
+            client_id=row['client_id'], establecimiento=row['establecimiento'], mesa=row['mesa'],
+            total_voters=row['total'], voted_count=row['voted'],
+        )
+        for row in groups.iterator(chunk_size=2000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0017_partition_voter_by_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MesaTurnout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('establecimiento', models.CharField(blank=True, default='', max_length=255)),
+                ('mesa', models.IntegerField(blank=True, null=True)),
+                ('total_voters', models.IntegerField(default=0)),
+                ('voted_count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mesa_turnout', to='voting.clientprofile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'establecimiento', 'mesa'), name='mesaturnout_client_est_mesa_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_mesa_turnout, migrations.RunPython.noop),
+    ]
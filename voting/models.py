@@ -1,6 +1,6 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
@@ -13,6 +13,12 @@ class ClientProfile(models.Model):
     # Denormalized totals for performance
     total_voters = models.IntegerField(default=0)
     voted_count = models.IntegerField(default=0)
+    # Bumped with every counter change; keys the cached stats and their ETags
+    stats_version = models.PositiveBigIntegerField(default=0)
+    # Last change sequence stamped on this client's voters (see Voter.change_seq)
+    change_seq = models.PositiveBigIntegerField(default=0)
+    # Bumped when the list is replaced or cleared: offline copies must be downloaded again
+    list_epoch = models.PositiveIntegerField(default=0)
 
     def delete(self, *args, **kwargs):
         """ Ensure the visitor account is deleted when the client profile is deleted. """
@@ -37,6 +43,8 @@ class Voter(models.Model):
     mesa = models.IntegerField(null=True, blank=True)
     orden = models.IntegerField(null=True, blank=True)
     establecimiento = models.CharField(max_length=255, blank=True, default='')
+    # ClientProfile.change_seq at the voter's last change, for incremental sync
+    change_seq = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         full = (self.last_name + ", " + self.first_name).strip(', ')
@@ -58,7 +66,19 @@ class Voter(models.Model):
                 name="voter_cz_mo_notv",
                 condition=Q(voted=False),
             ),
+            # Same ordering across all zones ("Todas"), for keyset pagination of pending voters
+            models.Index(
+                fields=["client", "mesa", "orden"],
+                name="voter_c_mo_notv",
+                condition=Q(voted=False),
+            ),
+            # Changes feed: voters changed after a given sequence
+            models.Index(fields=["client", "change_seq"], name="voter_client_change_seq_idx"),
         ]
+        # Name/DNI/establecimiento search also uses pg_trgm GIN indexes, created by
+        # migration 0015 only where the extension is available (see voting/search.py)
+        # On PostgreSQL the table is hash-partitioned by client (migration 0017): the
+        # database primary key is (id, client_id), so filter by client wherever possible
         constraints = [
             models.UniqueConstraint(fields=["client", "dni"], name="voter_client_dni_uniq"),
         ]
@@ -144,3 +164,77 @@ class Zone(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.client.organization_name})"
+
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+def bump_stats_version_on_zone_change(sender, instance, **kwargs):
+    """Zone names and membership are part of the cached zone stats (counter updates bypass save()).
+
+    Bumped once committed, so the client row is not locked ahead of the zones
+    inside an import (see the lock order in ``voting.counters``).
+    """
+    client_id = instance.client_id
+    transaction.on_commit(
+        lambda: ClientProfile.objects.filter(id=client_id).update(stats_version=F('stats_version') + 1)
+    )
+
+class MesaTurnout(models.Model):
+    """Denormalized voter counts per (client, establecimiento, mesa), kept next to the Zone counters."""
+    client = models.ForeignKey(ClientProfile, on_delete=models.CASCADE, related_name='mesa_turnout')
+    establecimiento = models.CharField(max_length=255, blank=True, default='')
+    mesa = models.IntegerField(null=True, blank=True)
+    total_voters = models.IntegerField(default=0)
+    voted_count = models.IntegerField(default=0)
+
+    class Meta:
+        # Rows are only written by rebuilds (counters.rebuild_mesa_turnout and the bulk
+        # import paths), one per group including mesa NULL; marks find theirs through this index
+        constraints = [
+            models.UniqueConstraint(fields=["client", "establecimiento", "mesa"], name="mesaturnout_client_est_mesa_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.establecimiento or 'Sin establecimiento'} - mesa {self.mesa}"
+
+class ImportJob(models.Model):
+    """A padrón upload queued for the background import worker (see run_import_worker)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (RUNNING, 'Procesando'),
+        (DONE, 'Completado'),
+        (FAILED, 'Error'),
+    ]
+
+    client = models.ForeignKey(ClientProfile, on_delete=models.CASCADE, related_name='import_jobs')
+    zone_name = models.CharField(max_length=120)
+    # Delete the client's voters and zones before importing
+    replace = models.BooleanField(default=False)
+    # On replace, keep voted=True for DNIs already marked in the previous list
+    keep_votes = models.BooleanField(default=False)
+    filename = models.CharField(max_length=255, blank=True, default='')
+    # Uploaded file contents; cleared once the job finishes
+    payload = models.BinaryField(default=b'')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker on every progress report; a running job past its lease was abandoned
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="importjob_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.filename or 'import'} ({self.get_status_display()})"
@@ -0,0 +1,82 @@
+"""Compact voter snapshots and change feeds for the offline visitor dashboard.
+
+A device downloads a snapshot tagged with the client's ``list_epoch`` and
+``change_seq``, then asks for voters changed after that sequence. When the
+epoch moves (list replaced or cleared) the device starts over from a snapshot.
+"""
+import json
+
+from django.db.models import Q
+
+from .models import ClientProfile, Voter
+
+# Row layout shared by snapshots and change feeds
+OFFLINE_FIELDS = ['dni', 'name', 'mesa', 'orden', 'voted', 'zone_id']
+# Rows per chunk when streaming a snapshot, and per change-feed response
+OFFLINE_CHUNK_SIZE = 5000
+# Voter fields returned by the full change feed (voter_changes view)
+CHANGE_FIELDS = [
+    'id', 'dni', 'last_name', 'first_name', 'sex', 'address', 'mesa', 'orden',
+    'establecimiento', 'zone_id', 'voted', 'change_seq',
+]
+
+
+def sync_state(client_id):
+    """``(list_epoch, change_seq)`` of a client, or None if it does not exist."""
+    return ClientProfile.objects.filter(id=client_id).values_list('list_epoch', 'change_seq').first()
+
+
+_COLUMNS = ('dni', 'last_name', 'first_name', 'mesa', 'orden', 'voted', 'zone_id')
+
+
+def _row(dni, last_name, first_name, mesa, orden, voted, zone_id):
+    return [dni, f"{last_name}, {first_name}".strip(', '), mesa, orden, voted, zone_id]
+
+
+def write_snapshot(client_id, epoch, seq, zones):
+    """Stream ``{"epoch", "seq", "fields", "zones", "rows": [[...], ...]}`` as JSON bytes.
+
+    Read ``epoch``/``seq`` before calling: rows changed meanwhile are simply
+    delivered again by the change feed.
+    """
+    head = {'status': 'success', 'epoch': epoch, 'seq': seq, 'fields': OFFLINE_FIELDS, 'zones': zones}
+    yield json.dumps(head, ensure_ascii=False)[:-1].encode('utf-8') + b', "rows": ['
+    separator = ''
+    chunk = []
+    voters = Voter.objects.filter(client_id=client_id).order_by('id').values_list(*_COLUMNS)
+    for values in voters.iterator(chunk_size=OFFLINE_CHUNK_SIZE):
+        chunk.append(json.dumps(_row(*values), ensure_ascii=False))
+        if len(chunk) == OFFLINE_CHUNK_SIZE:
+            yield (separator + ', '.join(chunk)).encode('utf-8')
+            separator, chunk = ', ', []
+    if chunk:
+        yield (separator + ', '.join(chunk)).encode('utf-8')
+    yield b']}'
+
+
+def changed_voters(client_id, since, after=None, limit=OFFLINE_CHUNK_SIZE, fields=_COLUMNS):
+    """Values of ``fields`` for voters changed after the cursor ``(since, after)``, oldest change first.
+
+    The cursor is the last ``(change_seq, id)`` seen; ``after=None`` means every
+    row of sequence ``since`` is already known (e.g. right after a snapshot).
+    Returns ``(rows, next_cursor, has_more)``. Served by ``voter_client_change_seq_idx``.
+    """
+    cursor_filter = Q(change_seq__gt=since)
+    if after is not None:
+        cursor_filter |= Q(change_seq=since, id__gt=after)
+    changed = list(
+        Voter.objects.filter(cursor_filter, client_id=client_id)
+        .order_by('change_seq', 'id')
+        .values_list('change_seq', 'id', *fields)[:limit + 1]
+    )
+    has_more = len(changed) > limit
+    changed = changed[:limit]
+    if not changed:
+        return [], (since, after), False
+    return [values[2:] for values in changed], changed[-1][:2], has_more
+
+
+def changes_after(client_id, since, after=None, limit=OFFLINE_CHUNK_SIZE):
+    """``changed_voters`` in the compact snapshot row layout."""
+    rows, cursor, has_more = changed_voters(client_id, since, after, limit)
+    return [_row(*values) for values in rows], cursor, has_more
@@ -0,0 +1,32 @@
+"""Set-based deletion of a client's voter list (clear_voters and list replacement)."""
+from django.db import router, transaction
+from django.db.models import F
+
+from . import events
+from .models import ClientProfile, MesaTurnout, Voter, Zone
+
+
+def purge_client_voters(client_id):
+    """Delete every voter, zone and mesa count of ``client_id`` and zero its counters in one transaction.
+
+    ``QuerySet.delete()`` loads each row to run ``on_delete`` handlers and signals;
+    neither model needs that here (nothing references ``Voter``, and ``Voter.zone``
+    is the only reference to ``Zone``, whose rows are gone by then), so each table
+    gets a single DELETE. Returns ``(voters_deleted, zones_deleted)`` from the
+    statements' row counts. Bumps ``list_epoch`` so offline copies start over.
+    Callers should ``dni_index.invalidate(client_id)`` once committed.
+    """
+    using = router.db_for_write(Voter)
+    with transaction.atomic(using=using):
+        # Voter rows, then zones, then the client row: the lock order used by marks
+        voters_deleted = Voter.objects.filter(client_id=client_id)._raw_delete(using)
+        zones_deleted = Zone.objects.filter(client_id=client_id)._raw_delete(using)
+        MesaTurnout.objects.filter(client_id=client_id)._raw_delete(using)
+        ClientProfile.objects.filter(id=client_id).update(
+            total_voters=0,
+            voted_count=0,
+            stats_version=F('stats_version') + 1,
+            list_epoch=F('list_epoch') + 1,
+        )
+        events.publish(client_id, {'type': 'reset'})
+    return voters_deleted, zones_deleted
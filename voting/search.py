@@ -0,0 +1,100 @@
+"""Voter search by surname, first name, DNI prefix and establecimiento.
+
+With the ``pg_trgm`` extension (installed by migration 0015 where the server
+ships it) names match by trigram word similarity through GIN indexes, so a
+misspelled surname still finds the voter, and results are ranked by
+similarity. Without it the search falls back to case-insensitive substring
+matching. A query made only of digits is a DNI prefix, served by the
+``(client, dni)`` unique index.
+"""
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import Voter
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Shortest query worth searching, and most words taken from it
+MIN_QUERY_LENGTH = 2
+MAX_TERMS = 4
+
+SEARCH_FIELDS = ['id', 'dni', 'last_name', 'first_name', 'voted', 'mesa', 'orden', 'establecimiento']
+
+_trigram = None
+
+
+def trigram_available() -> bool:
+    """Whether pg_trgm is installed in the database (checked once per process)."""
+    global _trigram
+    if _trigram is None:
+        if connection.vendor != 'postgresql':
+            _trigram = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigram = cursor.fetchone() is not None
+    return _trigram
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest digit string greater than every string starting with ``prefix`` (None if unbounded)."""
+    stripped = prefix.rstrip('9')
+    if not stripped:
+        return None
+    return stripped[:-1] + str(int(stripped[-1]) + 1)
+
+
+def _by_dni(voters, prefix, limit):
+    # A range instead of LIKE 'prefix%' so the btree index is used whatever the collation
+    matches = voters.filter(dni__gte=prefix)
+    upper = _prefix_upper_bound(prefix)
+    if upper is not None:
+        matches = matches.filter(dni__lt=upper)
+    found = list(matches.order_by('dni')[:limit])
+    if len(found) < limit and len(prefix) >= 6 and trigram_available():
+        # A misread digit: closest DNIs after the exact prefix matches
+        found += list(
+            voters.filter(dni__trigram_similar=prefix)
+            .exclude(id__in=[voter['id'] for voter in found])
+            .annotate(score=TrigramSimilarity('dni', prefix))
+            .order_by('-score', 'dni')[:limit - len(found)]
+        )
+    return found
+
+
+def _by_name(voters, terms, limit):
+    if trigram_available():
+        ranks = []
+        for term in terms:
+            voters = voters.filter(
+                Q(last_name__trigram_word_similar=term)
+                | Q(first_name__trigram_word_similar=term)
+                | Q(establecimiento__trigram_word_similar=term)
+            )
+            ranks.append(Greatest(
+                TrigramWordSimilarity(term, 'last_name'),
+                TrigramWordSimilarity(term, 'first_name'),
+                TrigramWordSimilarity(term, 'establecimiento'),
+            ))
+        return list(voters.annotate(score=sum(ranks[1:], ranks[0])).order_by('-score', 'last_name', 'first_name', 'id')[:limit])
+    for term in terms:
+        voters = voters.filter(
+            Q(last_name__icontains=term) | Q(first_name__icontains=term) | Q(establecimiento__icontains=term)
+        )
+    return list(voters.order_by('last_name', 'first_name', 'id')[:limit])
+
+
+def search_voters(client_id, query, limit=SEARCH_LIMIT):
+    """Voters of ``client_id`` matching ``query``, best first, as dicts (``SEARCH_FIELDS`` + ``zone``)."""
+    terms = [term for term in re.split(r'[\s,]+', query.strip()) if term][:MAX_TERMS]
+    if not terms:
+        return []
+    voters = Voter.objects.filter(client_id=client_id).values(*SEARCH_FIELDS, zone_name=F('zone__name'))
+    # isdigit() alone also accepts non-ASCII digits ('²', '٣'), which are not DNIs
+    if len(terms) == 1 and terms[0].isascii() and terms[0].isdigit():
+        return _by_dni(voters, terms[0], limit)
+    return _by_name(voters, terms, limit)
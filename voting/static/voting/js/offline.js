@@ -0,0 +1,249 @@
+// Offline support for the visitor dashboard.
+// Keeps a copy of the client's voter list in IndexedDB (snapshot + change feed),
+// answers DNI lookups from it when the network is down, and queues marks made
+// offline to replay them through the batch endpoint once the connection returns.
+// The copy holds names and DNIs: it is wiped on logout and when another client
+// signs in on the same device (see clearAll).
+(function (window) {
+    'use strict';
+
+    const DB_VERSION = 1;
+    const DB_PREFIX = 'voting-offline-';
+    const CACHE_PREFIX = 'voting-';
+    // localStorage keys: client whose copy is on this device, and every database opened
+    const OWNER_KEY = 'voting-offline-client';
+    const NAMES_KEY = 'voting-offline-dbs';
+    const SYNC_INTERVAL_MS = 60000;
+    const BATCH_SIZE = 500; // MAX_BATCH_DNIS on the server
+
+    function request(req) {
+        return new Promise(function (resolve, reject) {
+            req.onsuccess = function () { resolve(req.result); };
+            req.onerror = function () { reject(req.error); };
+        });
+    }
+
+    function done(tx) {
+        return new Promise(function (resolve, reject) {
+            tx.oncomplete = function () { resolve(); };
+            tx.onerror = tx.onabort = function () { reject(tx.error); };
+        });
+    }
+
+    function openDb(name) {
+        const req = indexedDB.open(name, DB_VERSION);
+        req.onupgradeneeded = function () {
+            const db = req.result;
+            db.createObjectStore('voters', { keyPath: 'dni' });
+            db.createObjectStore('meta');
+            db.createObjectStore('queue', { keyPath: 'dni' });
+        };
+        return request(req);
+    }
+
+    function storedNames() {
+        try { return JSON.parse(window.localStorage.getItem(NAMES_KEY)) || []; } catch (e) { return []; }
+    }
+
+    // Delete every offline voter database and service-worker cache of this origin
+    function clearAll() {
+        const listed = indexedDB.databases
+            ? indexedDB.databases().then(function (dbs) { return dbs.map(function (db) { return db.name; }); })
+            : Promise.resolve([]);
+        const dbs = listed.catch(function () { return []; }).then(function (names) {
+            const all = new Set(names.concat(storedNames()));
+            return Promise.all(Array.from(all).filter(function (name) { return name && name.startsWith(DB_PREFIX); }).map(function (name) {
+                return request(indexedDB.deleteDatabase(name)).catch(function () {});
+            }));
+        });
+        const cached = window.caches
+            ? caches.keys().then(function (keys) {
+                return Promise.all(keys.filter(function (key) { return key.startsWith(CACHE_PREFIX); }).map(function (key) { return caches.delete(key); }));
+            }).catch(function () {})
+            : Promise.resolve();
+        return Promise.all([dbs, cached]).then(function () {
+            window.localStorage.removeItem(OWNER_KEY);
+            window.localStorage.removeItem(NAMES_KEY);
+        });
+    }
+
+    // Wipe another client's copy before opening ours
+    function claimDevice(clientId) {
+        const owner = window.localStorage.getItem(OWNER_KEY);
+        const ready = owner !== null && owner !== String(clientId) ? clearAll() : Promise.resolve();
+        return ready.then(function () {
+            window.localStorage.setItem(OWNER_KEY, String(clientId));
+            const names = storedNames();
+            if (names.indexOf(DB_PREFIX + clientId) === -1) {
+                window.localStorage.setItem(NAMES_KEY, JSON.stringify(names.concat([DB_PREFIX + clientId])));
+            }
+        });
+    }
+
+    function toVoter(row) {
+        return { dni: row[0], name: row[1], mesa: row[2], orden: row[3], voted: row[4], zone_id: row[5] };
+    }
+
+    function VotingOffline(opts) {
+        this.opts = opts;
+        this.db = null;
+        this.meta = null;
+        this.syncing = null;
+    }
+
+    VotingOffline.prototype.start = function () {
+        const self = this;
+        if (!window.indexedDB) return Promise.resolve(null);
+        if ('serviceWorker' in navigator && self.opts.serviceWorkerUrl) {
+            navigator.serviceWorker.register(self.opts.serviceWorkerUrl).catch(function () {});
+        }
+        return claimDevice(self.opts.clientId).then(function () {
+            return openDb(DB_PREFIX + self.opts.clientId);
+        }).then(function (db) {
+            self.db = db;
+            return request(db.transaction('meta').objectStore('meta').get('state'));
+        }).then(function (meta) {
+            self.meta = meta || null;
+            window.addEventListener('online', function () { self.sync(); });
+            setInterval(function () { self.sync(); }, SYNC_INTERVAL_MS);
+            self.sync();
+            return self;
+        });
+    };
+
+    // Bring the local copy up to date, then replay queued marks. Safe to call repeatedly.
+    VotingOffline.prototype.sync = function () {
+        const self = this;
+        if (!self.db || self.syncing || !navigator.onLine) return self.syncing || Promise.resolve();
+        self.syncing = (self.meta ? self.pullChanges() : self.downloadSnapshot())
+            .then(function () { return self.flushQueue(); })
+            .catch(function () {})
+            .then(function () { self.syncing = null; self.notify(); });
+        return self.syncing;
+    };
+
+    VotingOffline.prototype.downloadSnapshot = function () {
+        const self = this;
+        return fetch(self.opts.snapshotUrl, { credentials: 'same-origin' })
+            .then(function (resp) { if (!resp.ok) throw new Error(resp.status); return resp.json(); })
+            .then(function (data) {
+                return self.queuedDnis().then(function (queued) {
+                    const tx = self.db.transaction(['voters', 'meta'], 'readwrite');
+                    const voters = tx.objectStore('voters');
+                    voters.clear();
+                    data.rows.forEach(function (row) {
+                        const voter = toVoter(row);
+                        // Marks not yet replayed stay visible locally
+                        if (queued.has(voter.dni)) voter.voted = true;
+                        voters.put(voter);
+                    });
+                    const meta = { epoch: data.epoch, since: data.seq, after: null, zones: data.zones };
+                    tx.objectStore('meta').put(meta, 'state');
+                    return done(tx).then(function () { self.meta = meta; });
+                });
+            });
+    };
+
+    VotingOffline.prototype.pullChanges = function () {
+        const self = this;
+        const meta = self.meta;
+        const params = new URLSearchParams({ epoch: meta.epoch, since: meta.since });
+        if (meta.after !== null) params.set('after', meta.after);
+        return fetch(self.opts.changesUrl + '?' + params, { credentials: 'same-origin' })
+            .then(function (resp) { if (!resp.ok) throw new Error(resp.status); return resp.json(); })
+            .then(function (data) {
+                if (data.status === 'reset') return self.downloadSnapshot();
+                if (data.status !== 'success') throw new Error(data.message);
+                return self.queuedDnis().then(function (queued) {
+                    const tx = self.db.transaction(['voters', 'meta'], 'readwrite');
+                    const voters = tx.objectStore('voters');
+                    data.rows.forEach(function (row) {
+                        const voter = toVoter(row);
+                        if (queued.has(voter.dni)) voter.voted = true;
+                        voters.put(voter);
+                    });
+                    const next = Object.assign({}, meta, { since: data.since, after: data.after });
+                    tx.objectStore('meta').put(next, 'state');
+                    return done(tx).then(function () {
+                        self.meta = next;
+                        if (data.has_more) return self.pullChanges();
+                    });
+                });
+            });
+    };
+
+    VotingOffline.prototype.queuedDnis = function () {
+        return request(this.db.transaction('queue').objectStore('queue').getAllKeys())
+            .then(function (keys) { return new Set(keys); });
+    };
+
+    VotingOffline.prototype.flushQueue = function () {
+        const self = this;
+        return self.queuedDnis().then(function (queued) {
+            const dnis = Array.from(queued).slice(0, BATCH_SIZE);
+            if (!dnis.length) return;
+            return fetch(self.opts.batchUrl, {
+                method: 'POST',
+                credentials: 'same-origin',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': self.opts.csrfToken() },
+                body: JSON.stringify({ dnis: dnis }),
+            }).then(function (resp) {
+                if (!resp.ok) throw new Error(resp.status);
+                return resp.json();
+            }).then(function (data) {
+                if (data.status !== 'success') throw new Error(data.message);
+                // Every DNI got an answer (marked, already_voted or not_found): drop them all
+                const tx = self.db.transaction('queue', 'readwrite');
+                data.results.forEach(function (r) { tx.objectStore('queue').delete(r.dni); });
+                return done(tx).then(function () {
+                    if (queued.size > dnis.length) return self.flushQueue();
+                });
+            });
+        });
+    };
+
+    // Local voter for a DNI (with its zone name), or null
+    VotingOffline.prototype.lookup = function (dni) {
+        const self = this;
+        if (!self.db) return Promise.resolve(null);
+        return request(self.db.transaction('voters').objectStore('voters').get(dni)).then(function (voter) {
+            if (!voter) return null;
+            const zones = (self.meta && self.meta.zones) || {};
+            return Object.assign({}, voter, { zone: zones[voter.zone_id] || 'Sin asignar' });
+        });
+    };
+
+    // Remember a mark made without connection; resolves to the number of queued marks
+    VotingOffline.prototype.queueMark = function (dni) {
+        const self = this;
+        if (!self.db) return Promise.reject(new Error('IndexedDB no disponible'));
+        const tx = self.db.transaction(['queue', 'voters'], 'readwrite');
+        tx.objectStore('queue').put({ dni: dni, at: Date.now() });
+        const voters = tx.objectStore('voters');
+        request(voters.get(dni)).then(function (voter) {
+            if (voter) { voter.voted = true; voters.put(voter); }
+        });
+        return done(tx).then(function () { return self.pendingCount(); });
+    };
+
+    VotingOffline.prototype.pendingCount = function () {
+        if (!this.db) return Promise.resolve(0);
+        return request(this.db.transaction('queue').objectStore('queue').count());
+    };
+
+    VotingOffline.prototype.notify = function () {
+        const onStatus = this.opts.onStatus;
+        if (onStatus) this.pendingCount().then(onStatus);
+    };
+
+    // Close our database first: an open connection blocks its deletion
+    VotingOffline.prototype.clear = function () {
+        if (this.db) { this.db.close(); this.db = null; }
+        return clearAll();
+    };
+
+    window.VotingOffline = {
+        init: function (opts) { return new VotingOffline(opts).start(); },
+        clear: function () { return window.indexedDB ? clearAll() : Promise.resolve(); },
+    };
+})(window);
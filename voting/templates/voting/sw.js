@@ -0,0 +1,58 @@
+{% load static %}// Service worker for the visitor dashboard: keeps the page shell available offline.
+// Voter data lives in IndexedDB (see voting/js/offline.js); API calls are never cached here.
+const SHELL_CACHE = 'voting-shell-v1';
+const DASHBOARD_URL = '{% url "voting:visitor_dashboard" %}';
+const SHELL_ASSETS = [
+    '{% static "css/base.css" %}',
+    '{% static "voting/css/main_dashboard.css" %}',
+    '{% static "voting/js/offline.js" %}',
+    '{% static "logo.svg" %}',
+    'https://code.jquery.com/jquery-3.6.0.min.js',
+];
+
+self.addEventListener('install', function (event) {
+    event.waitUntil(
+        caches.open(SHELL_CACHE).then(function (cache) {
+            // One missing asset must not prevent the worker from installing
+            return Promise.all(SHELL_ASSETS.map(function (url) {
+                return cache.add(new Request(url, { mode: url.startsWith('http') ? 'no-cors' : 'same-origin' })).catch(function () {});
+            }));
+        }).then(function () { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(
+        caches.keys().then(function (keys) {
+            return Promise.all(keys.filter(function (key) { return key !== SHELL_CACHE; }).map(function (key) { return caches.delete(key); }));
+        }).then(function () { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function (event) {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    // Dashboard page: network first, last good copy when offline
+    if (request.mode === 'navigate' && url.pathname === DASHBOARD_URL) {
+        event.respondWith(
+            fetch(request).then(function (response) {
+                // A redirect means the session ended (login page): never cache that as the dashboard
+                if (response.ok && !response.redirected) {
+                    const copy = response.clone();
+                    caches.open(SHELL_CACHE).then(function (cache) { cache.put(DASHBOARD_URL, copy); });
+                }
+                return response;
+            }).catch(function () { return caches.match(DASHBOARD_URL); })
+        );
+        return;
+    }
+
+    // Static shell assets: cache first
+    if (SHELL_ASSETS.indexOf(url.origin === self.location.origin ? url.pathname : request.url) !== -1) {
+        event.respondWith(
+            caches.match(request).then(function (cached) { return cached || fetch(request); })
+        );
+    }
+});
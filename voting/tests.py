@@ -1,3 +1,1126 @@
-from django.test import TestCase
+import asyncio
+import io
+import tempfile
+import threading
+import time
+import tracemalloc
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from . import dni_index, events
+from .importer import XlsxVoterFile, normalize_frame, open_voter_file
+from .counters import recompute_client_counters
+from .jobs import claim_next_job, enqueue_import, run_import_job
+from .middleware import ROLE_CLIENT, ROLE_VISITOR, resolve_client
+from .models import ClientProfile, ImportJob, MesaTurnout, Voter, Zone
+from .search import trigram_available
+
+
+def make_xlsx(rows, extra=()):
+    """Write a padrón .xlsx with ``rows`` synthetic voters (plus ``extra`` raw rows) to a temp file."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(['dni', 'Apellido', 'Nombre', 'Sexo', 'Direccion', 'Mesa', 'Orden', 'Establecimiento'])
+    for i in range(rows):
+        ws.append([20000000 + i, 'PEREZ', 'ANA', 'f', f'Calle {i % 500}', i % 300 + 1, i % 250 + 1, 'ESCUELA 1'])
+    for row in extra:
+        ws.append(row)
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+class XlsxVoterFileTests(SimpleTestCase):
+    def test_chunks_keep_sheet_row_numbers(self):
+        f = make_xlsx(3, extra=[[None] * 8, ['123', 'GOMEZ', None, 'M', '', 'x', 2, '']])
+        sheet = XlsxVoterFile(f, chunk_size=2)
+        self.assertEqual(sheet.missing_columns(), [])
+        chunks = list(sheet.chunks())
+        self.assertEqual([list(clean.index) for clean, _ in chunks], [[2, 3], [4]])
+        self.assertEqual(chunks[0][0].iloc[0].tolist(), ['20000000', 'PEREZ', 'ANA', 'F', 'Calle 0', 1, 1, 'ESCUELA 1'])
+        # Row 5 is blank and ignored; row 6 lacks a first name
+        self.assertEqual(chunks[1][1], [(6, 'Falta DNI o Nombre')])
+
+    def test_peak_memory_does_not_grow_with_file_size(self):
+        def peak(rows):
+            f = make_xlsx(rows)
+            tracemalloc.start()
+            try:
+                count = sum(len(clean) for clean, _ in XlsxVoterFile(f, chunk_size=250).chunks())
+                return count, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        peak(10)  # warm up lazy imports
+        small_count, small_peak = peak(1500)
+        large_count, large_peak = peak(6000)
+        self.assertEqual((small_count, large_count), (1500, 6000))
+        # 4x the rows must not come close to 4x the memory
+        self.assertLess(large_peak, 5 * 1024 * 1024)
+        self.assertLess(large_peak, small_peak * 2)
+
+
+class NormalizeFrameTests(SimpleTestCase):
+    def normalize(self, rows, **kwargs):
+        import pandas as pd
+
+        columns = ['dni', 'Apellido', 'Nombre', 'Sexo', 'Direccion', 'Mesa', 'Orden', 'Establecimiento']
+        return normalize_frame(pd.DataFrame(rows, columns=columns), **kwargs)
+
+    def test_cleans_cells(self):
+        nan = float('nan')
+        clean, rejected = self.normalize([
+            [20000001.0, '  PEREZ ', 'ANA', ' f', nan, 3.0, 'x', nan],
+            [20000002.0, 'GOMEZ', 'JUAN', nan, 'Calle 1', -1, 2.5, ' ESCUELA 1 '],
+        ])
+        self.assertEqual(rejected, [])
+        self.assertEqual(clean.loc[2].tolist(), ['20000001', 'PEREZ', 'ANA', 'F', '', 3, None, ''])
+        self.assertEqual(clean.loc[3].tolist(), ['20000002', 'GOMEZ', 'JUAN', '', 'Calle 1', None, None, 'ESCUELA 1'])
+
+    def test_text_dni_keeps_leading_zeros(self):
+        clean, _ = self.normalize([['01234567', 'PAZ', 'LIA', '', '', '', '', ''], ['7654321.0', 'RUIZ', 'EVA', '', '', '', '', '']])
+        self.assertEqual(clean['dni'].tolist(), ['01234567', '7654321'])
+
+    def test_rejection_reasons_and_row_numbers(self):
+        clean, rejected = self.normalize([
+            ['1', 'PAZ', 'LIA', 'F', '', 1, 1, ''],
+            ['2', '  ', 'LIA', '', '', '', '', ''],
+            ['9' * 21, 'PAZ', 'LIA', '', '', '', '', ''],
+            ['3', 'PAZ', 'LIA', 'FEM', '', '', '', ''],
+            ['4', 'PAZ', 'LIA', '', 'x' * 256, '', '', ''],
+        ], first_row=10)
+        self.assertEqual(clean.index.tolist(), [10])
+        self.assertEqual(rejected, [
+            (11, 'Falta DNI o Nombre'),
+            (12, 'DNI demasiado largo'),
+            (13, 'Valor demasiado largo en Sexo'),
+            (14, 'Valor demasiado largo en Direccion'),
+        ])
+
+    def test_first_row_none_keeps_index(self):
+        import pandas as pd
+
+        clean, rejected = normalize_frame(pd.DataFrame({'dni': ['1', None], 'Apellido': ['A', 'B'], 'Nombre': ['C', 'D']}, index=[7, 9]), first_row=None)
+        self.assertEqual((clean.index.tolist(), rejected), ([7], [(9, 'Falta DNI o Nombre')]))
+        self.assertEqual(clean.loc[7, ['sex', 'mesa']].tolist(), ['', None])
+
+
+class CsvParquetVoterFileTests(SimpleTestCase):
+    def test_csv_semicolon_latin1(self):
+        data = "dni;Apellido;Nombre;Mesa;Extra\n01234567;PE\u00d1A;ANA;12;x\n;GOMEZ;JUAN;3;y\n".encode('latin-1')
+        sheet = open_voter_file(io.BytesIO(data), 'padron.CSV')
+        self.assertEqual(sheet.missing_columns(), [])
+        (clean, rejected), = list(sheet.chunks())
+        self.assertEqual(clean.loc[2, ['dni', 'last_name', 'mesa']].tolist(), ['01234567', 'PE\u00d1A', 12])
+        self.assertEqual(rejected, [(3, 'Falta DNI o Nombre')])
+
+    def test_csv_row_numbers_count_blank_lines(self):
+        data = b"\ndni,Apellido,Nombre\n1,PAZ,LIA\n\n,GOMEZ,JUAN\n2,RUIZ,EVA\n"
+        (clean, rejected), = list(open_voter_file(io.BytesIO(data), 'padron.csv').chunks())
+        self.assertEqual(clean.index.tolist(), [3, 6])
+        self.assertEqual(rejected, [(5, 'Falta DNI o Nombre')])
+
+    def test_parquet_reads_known_columns(self):
+        import pandas as pd
+
+        buf = io.BytesIO()
+        pd.DataFrame({'dni': [20000001, 20000002], 'Apellido': ['A', 'B'], 'Nombre': ['C', None], 'Otra': [1, 2]}).to_parquet(buf)
+        buf.seek(0)
+        sheet = open_voter_file(buf, 'padron.parquet')
+        self.assertEqual(sheet.missing_columns(), [])
+        (clean, rejected), = list(sheet.chunks())
+        self.assertEqual(clean['dni'].tolist(), ['20000001'])
+        self.assertEqual(rejected, [(3, 'Falta DNI o Nombre')])
+
+
+class ImportVotersTests(TestCase):
+    def test_batches_repeats_and_partial_updates(self):
+        import pandas as pd
+        from django.test.utils import CaptureQueriesContext
+
+        from .importer import import_voters
+
+        profile = ClientProfile.objects.get(user=User.objects.create_user('cliente', password='secreto'))
+        zone = Zone.objects.create(client=profile, name='Centro')
+        Voter.objects.create(client=profile, zone=zone, dni='1', last_name='PAZ', first_name='LIA')
+        Voter.objects.create(client=profile, zone=zone, dni='2', last_name='RUIZ', first_name='EVA', voted=True)
+        frame = pd.DataFrame({
+            'dni': ['1', '2', '3', '3', None, '4', '3'],
+            'Apellido': ['PAZ', 'RUIZ', 'SOL', 'SOL', 'X', 'LUZ', 'SOL'],
+            'Nombre': ['LIA', 'ANA', 'MAR', 'MAR', 'Y', 'EMA', 'MARTA'],
+        })
+        with CaptureQueriesContext(connection) as queries:
+            # Two rows per batch: 3 repeats within a batch and again two batches later
+            result = import_voters(profile, [normalize_frame(frame)], zone, batch_size=2)
+        self.assertEqual((result.rows, result.created, result.updated, result.skipped), (7, 2, 2, 1))
+        voters = {v.dni: (v.first_name, v.voted) for v in Voter.objects.filter(client=profile)}
+        self.assertEqual(voters, {'1': ('LIA', False), '2': ('ANA', True), '3': ('MARTA', False), '4': ('EMA', False)})
+        # Existing voters are looked up per batch, never loaded wholesale
+        lookups = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'voting_voter' in q['sql']]
+        self.assertEqual(len(lookups), 3)
+        self.assertTrue(all(' IN (' in sql for sql in lookups))
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.client.force_login(self.user)
+
+    def upload(self, f, zone_name='Centro'):
+        return self.client.post(reverse('voting:upload_voters_to_zone'), {
+            'zone_name': zone_name,
+            'file': SimpleUploadedFile('padron.xlsx', f.read()),
+        }).json()
+
+    def test_zone_upload_is_queued_and_processed(self):
+        resp = self.upload(make_xlsx(30, extra=[['1', 'GOMEZ', None, '', '', '', '', '']]))
+        self.assertEqual(resp['status'], 'queued')
+        self.assertEqual(self.client.get(resp['status_url']).json()['job']['state'], ImportJob.PENDING)
+
+        job = claim_next_job()
+        self.assertEqual(job.id, resp['job_id'])
+        run_import_job(job.id)
+
+        status = self.client.get(resp['status_url']).json()['job']
+        self.assertEqual(status['state'], ImportJob.DONE)
+        self.assertEqual((status['rows_processed'], status['created'], status['updated'], status['skipped']), (31, 30, 0, 1))
+        self.assertEqual(status['errors'], ['Fila 32 omitida: Falta DNI o Nombre.'])
+        profile = ClientProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_voters, 30)
+        self.assertEqual(Zone.objects.get(client=profile, name='Centro').total_voters, 30)
+        self.assertEqual(ImportJob.objects.get(id=job.id).payload, b'')
+
+    def test_first_load_with_repeated_dnis(self):
+        # 20000001 changes on its second row; 20000002 repeats unchanged
+        extra = [['20000001', 'RUIZ', 'EVA', '', '', '', '', ''], ['20000002', 'PEREZ', 'ANA', 'f', 'Calle 2', 3, 3, 'ESCUELA 1']]
+        resp = self.upload(make_xlsx(3, extra=extra))
+        run_import_job(claim_next_job().id)
+        status = self.client.get(resp['status_url']).json()['job']
+        self.assertEqual((status['rows_processed'], status['created'], status['updated']), (5, 3, 1))
+        profile = ClientProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_voters, Zone.objects.get(client=profile).total_voters), (3, 3))
+        voter = Voter.objects.get(client=profile, dni='20000001')
+        self.assertEqual((voter.last_name, voter.mesa), ('RUIZ', None))
+        # The repeated row moved 20000001 out of mesa 2
+        mesas = MesaTurnout.objects.filter(client=profile).order_by('mesa').values_list('establecimiento', 'mesa', 'total_voters')
+        self.assertEqual(list(mesas), [('ESCUELA 1', 1, 1), ('ESCUELA 1', 3, 1), ('', None, 1)])
+        self.assertGreater(Voter.objects.get(client=profile, dni='20000000').change_seq, 0)
+
+    def test_one_running_job_per_client(self):
+        first = self.upload(make_xlsx(2))
+        self.upload(make_xlsx(2), zone_name='Norte')
+        self.assertEqual(claim_next_job().id, first['job_id'])
+        self.assertIsNone(claim_next_job())
+        run_import_job(first['job_id'])
+        self.assertIsNotNone(claim_next_job())
+
+    def test_abandoned_running_job_is_failed(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .jobs import JOB_LEASE
+
+        orphan = self.upload(make_xlsx(2))
+        waiting = self.upload(make_xlsx(2), zone_name='Norte')
+        self.assertEqual(claim_next_job().id, orphan['job_id'])
+        # The worker dies: no more heartbeats
+        ImportJob.objects.filter(id=orphan['job_id']).update(heartbeat_at=timezone.now() - JOB_LEASE - timedelta(seconds=1))
+        self.assertEqual(claim_next_job().id, waiting['job_id'])
+        status = self.client.get(orphan['status_url']).json()['job']
+        self.assertEqual(status['state'], ImportJob.FAILED)
+        self.assertEqual(ImportJob.objects.get(id=orphan['job_id']).payload, b'')
+
+    def test_payload_is_read_in_slices(self):
+        from unittest import mock
+
+        from . import jobs
+
+        data = make_xlsx(200).read()
+        job = enqueue_import(ClientProfile.objects.get(user=self.user), SimpleUploadedFile('padron.xlsx', data), 'Centro')
+        with mock.patch.object(jobs, 'PAYLOAD_SLICE', 1000):
+            with jobs._spool_payload(job.id) as spool:
+                self.assertEqual(spool.read(), data)
+            self.assertEqual(claim_next_job().id, job.id)
+            run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created, job.payload), (ImportJob.DONE, 200, b''))
+
+    def test_job_failed_meanwhile_keeps_its_outcome(self):
+        resp = self.upload(make_xlsx(2))
+        job = claim_next_job()
+        # Reaped as abandoned while the (slow) worker was still going
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.FAILED)
+        run_import_job(job.id)
+        self.assertEqual(self.client.get(resp['status_url']).json()['job']['state'], ImportJob.FAILED)
+
+    def test_other_clients_cannot_see_job(self):
+        resp = self.upload(make_xlsx(2))
+        self.client.force_login(User.objects.create_user('otro', password='secreto'))
+        self.assertEqual(self.client.get(resp['status_url']).status_code, 404)
+
+
+class ImportJobLeaseTests(TransactionTestCase):
+    def test_reaper_spares_a_slow_job(self):
+        from datetime import timedelta
+        from unittest import mock
+
+        from . import jobs
+
+        profile = ClientProfile.objects.get(user=User.objects.create_user('cliente', password='secreto'))
+        job = enqueue_import(profile, SimpleUploadedFile('padron.xlsx', make_xlsx(5).read()), 'Centro')
+        self.assertEqual(claim_next_job().id, job.id)
+        report_progress = jobs._report_progress
+        reaped = []
+
+        def slow_progress(job_id, result):
+            report_progress(job_id, result)
+            if not reaped:
+                # The chunk takes longer than the whole lease; another worker looks for dead jobs
+                time.sleep(1.5)
+                reaper = threading.Thread(target=lambda: (reaped.append(jobs.fail_abandoned_jobs()), connection.close()))
+                reaper.start()
+                reaper.join(10)
+
+        with mock.patch.object(jobs, 'JOB_LEASE', timedelta(seconds=1)), \
+                mock.patch.object(jobs, 'HEARTBEAT_SECONDS', 0.1), \
+                mock.patch.object(jobs, '_report_progress', slow_progress):
+            run_import_job(job.id)
+        self.assertEqual(reaped, [0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.created), (ImportJob.DONE, 5))
+
+
+class ConcurrentVoteMarkingTests(TransactionTestCase):
+    """Several fiscales hammering the same voter must not drift the counters."""
+    THREADS = 8
+    REQUESTS_PER_THREAD = 15
+
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Centro')
+        self.voter = Voter.objects.create(client=self.profile, zone=self.zone, dni='123', last_name='A', first_name='B')
+        Voter.objects.create(client=self.profile, zone=self.zone, dni='456', last_name='C', first_name='D')
+        recompute_client_counters(self.profile)
+
+    def hammer(self, post):
+        barrier = threading.Barrier(self.THREADS)
+        failures = []
+
+        def worker(user):
+            client = Client()
+            client.force_login(user)
+            barrier.wait()
+            try:
+                for _ in range(self.REQUESTS_PER_THREAD):
+                    if post(client).json()['status'] != 'success':
+                        failures.append(True)
+            finally:
+                connection.close()
+
+        users = [self.user, self.profile.visitor_user]
+        threads = [threading.Thread(target=worker, args=(users[i % 2],)) for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(failures, [])
+
+    def assertCountersMatchRecount(self):
+        self.profile.refresh_from_db()
+        self.zone.refresh_from_db()
+        voted = Voter.objects.filter(client=self.profile, voted=True).count()
+        self.assertEqual(self.profile.voted_count, voted)
+        self.assertEqual(self.zone.voted_count, voted)
+        self.assertEqual(MesaTurnout.objects.get(client=self.profile).voted_count, voted)
+
+    def test_concurrent_toggles(self):
+        url = reverse('voting:mark_voted', args=[self.voter.id])
+        self.hammer(lambda client: client.post(url))
+        self.voter.refresh_from_db()
+        # An even number of toggles leaves the voter where it started
+        self.assertFalse(self.voter.voted)
+        self.assertCountersMatchRecount()
+
+    def test_concurrent_marks_by_dni(self):
+        url = reverse('voting:mark_by_dni_set')
+        self.hammer(lambda client: client.post(url, {'dni': '123'}))
+        self.assertCountersMatchRecount()
+        self.assertEqual(self.profile.voted_count, 1)
+
+    def test_marks_alongside_recompute(self):
+        # Recomputes lock zones, mesas and then the client row, like marks, so neither side deadlocks
+        url = reverse('voting:mark_voted', args=[self.voter.id])
+        done = threading.Event()
+        errors = []
+
+        def recompute():
+            try:
+                while not done.is_set():
+                    recompute_client_counters(self.profile)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=recompute)
+        thread.start()
+        try:
+            self.hammer(lambda client: client.post(url))
+        finally:
+            done.set()
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertCountersMatchRecount()
+
+    def test_concurrent_batches_overlap(self):
+        url = reverse('voting:mark_by_dni_batch')
+        self.hammer(lambda client: client.post(url, {'dnis': ['456', '123', '999']}, content_type='application/json'))
+        self.assertCountersMatchRecount()
+        self.assertEqual(self.profile.voted_count, 2)
+
+
+class BatchMarkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.north = Zone.objects.create(client=self.profile, name='Norte')
+        self.south = Zone.objects.create(client=self.profile, name='Sur')
+        Voter.objects.create(client=self.profile, zone=self.north, dni='1', last_name='A', first_name='B')
+        Voter.objects.create(client=self.profile, zone=self.north, dni='2', last_name='A', first_name='B', voted=True)
+        Voter.objects.create(client=self.profile, zone=self.south, dni='3', last_name='A', first_name='B')
+        recompute_client_counters(self.profile)
+        self.client.force_login(self.user)
+
+    def test_per_dni_results_and_grouped_deltas(self):
+        response = self.client.post(
+            reverse('voting:mark_by_dni_batch'),
+            {'dnis': ['1', ' 2', '3', '4', '1']},
+            content_type='application/json',
+        )
+        data = response.json()
+        self.assertEqual(data['marked'], 2)
+        self.assertEqual(
+            [(r['dni'], r['status']) for r in data['results']],
+            [('1', 'marked'), ('2', 'already_voted'), ('3', 'marked'), ('4', 'not_found')],
+        )
+        self.profile.refresh_from_db()
+        self.north.refresh_from_db()
+        self.south.refresh_from_db()
+        self.assertEqual((self.profile.voted_count, self.north.voted_count, self.south.voted_count), (3, 2, 1))
+
+    def test_toggle_is_scoped_to_the_client(self):
+        other = ClientProfile.objects.get(user=User.objects.create_user('otro', password='secreto'))
+        foreign = Voter.objects.create(client=other, dni='1', last_name='A', first_name='B')
+        data = self.client.post(reverse('voting:mark_voted', args=[foreign.id])).json()
+        self.assertEqual(data, {'status': 'error', 'message': 'Votante no encontrado'})
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.voted)
+
+    def test_rejects_malformed_body(self):
+        response = self.client.post(reverse('voting:mark_by_dni_batch'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ClientProfileMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.visitor = self.profile.visitor_user
+
+    def test_resolves_role_and_caches(self):
+        self.assertEqual(resolve_client(self.user), (self.profile.id, ROLE_CLIENT))
+        self.assertEqual(resolve_client(self.visitor), (self.profile.id, ROLE_VISITOR))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_client(self.visitor), (self.profile.id, ROLE_VISITOR))
+
+    def test_profile_change_invalidates(self):
+        resolve_client(self.visitor)
+        other = User.objects.create_user('asisteotro')
+        self.profile.visitor_user = other
+        self.profile.save(update_fields=['visitor_user'])
+        self.assertEqual(resolve_client(self.visitor), (None, None))
+        self.assertEqual(resolve_client(other), (self.profile.id, ROLE_VISITOR))
+
+    def test_other_process_change_seen_after_ttl(self):
+        from unittest import mock
+
+        from . import middleware
+
+        resolve_client(self.visitor)
+        # Reassigned by another worker: no signal reaches this process
+        ClientProfile.objects.filter(id=self.profile.id).update(visitor_user=User.objects.create_user('asisteotro'))
+        self.assertEqual(resolve_client(self.visitor), (self.profile.id, ROLE_VISITOR))
+        later = time.monotonic() + middleware.CACHE_TTL + 1
+        with mock.patch('voting.middleware.time.monotonic', return_value=later):
+            self.assertEqual(resolve_client(self.visitor), (None, None))
+
+    def test_visitor_lookup_skips_profile_queries(self):
+        Voter.objects.create(client=self.profile, dni='123', last_name='A', first_name='B')
+        self.client.force_login(self.visitor)
+        url = reverse('voting:mark_by_dni_set')
+        self.client.post(url, {'dni': '123'})  # warm the cache
+        # Session, user, voter lookup and the conditional update (plus its savepoint pair); no profile queries
+        with self.assertNumQueries(6):
+            self.client.post(url, {'dni': '123'})
+
+
+class StatsCachingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        zone = Zone.objects.create(client=self.profile, name='Centro')
+        Voter.objects.create(client=self.profile, zone=zone, dni='123', last_name='A', first_name='B')
+        recompute_client_counters(self.profile)
+        self.client.force_login(self.user)
+
+    def test_etag_revalidates_until_counters_change(self):
+        for name in ('voting:get_voter_stats', 'voting:get_zone_stats'):
+            url = reverse(name)
+            first = self.client.get(url)
+            etag = first['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+            self.client.post(reverse('voting:mark_by_dni_set'), {'dni': '123'})
+            changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed['ETag'], etag)
+            Voter.objects.filter(dni='123').update(voted=False)
+            recompute_client_counters(self.profile)
+
+        self.assertEqual(self.client.get(reverse('voting:get_voter_stats')).json()['stats']['voted_count'], 0)
+
+
+    def test_zone_rename_or_addition_changes_zone_etag(self):
+        url = reverse('voting:get_zone_stats')
+        etag = self.client.get(url)['ETag']
+        zone = Zone.objects.get(client=self.profile)
+        zone.name = 'Centro Norte'
+        with self.captureOnCommitCallbacks(execute=True):
+            zone.save()
+        renamed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(renamed.status_code, 200)
+        self.assertEqual([z['name'] for z in renamed.json()['zones']], ['Centro Norte'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Zone.objects.create(client=self.profile, name='Sur')
+        added = self.client.get(url, HTTP_IF_NONE_MATCH=renamed['ETag'])
+        self.assertEqual([z['name'] for z in added.json()['zones']], ['Centro Norte', 'Sur'])
+
+class TurnoutStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Centro')
+        Voter.objects.create(client=self.profile, zone=self.zone, dni='123', last_name='A', first_name='B')
+        self.client.force_login(self.user)
+
+    def test_vote_delta_reaches_open_streams_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('voting:mark_by_dni_set'), {'dni': '123'})
+
+        async def watch():
+            frames = events.stream(self.profile.id)
+            self.assertIn('retry', await anext(frames))
+            self.assertIn('event: ready', await anext(frames))
+            for callback in callbacks:
+                callback()
+            frame = await asyncio.wait_for(anext(frames), 1)
+            await frames.aclose()
+            return frame
+
+        frame = asyncio.run(watch())
+        self.assertTrue(frame.startswith('event: delta\n'))
+        self.assertIn(f'"zones": {{"{self.zone.id}": 1}}', frame)
+        self.assertEqual(events._subscribers, {})
+
+    def test_wsgi_requests_fall_back_to_polling(self):
+        self.assertEqual(self.client.get(reverse('voting:stats_stream')).status_code, 503)
+
+
+class TurnoutStreamConnectionTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+
+    async def test_stream_releases_database_connection(self):
+        from asgiref.sync import sync_to_async
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('voting:stats_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        # The stream is still open, but the request's connection is back (closed, or in the pool)
+        self.assertIsNone(await sync_to_async(lambda: connection.connection)())
+
+
+class PendingVotersCursorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Centro')
+        # Duplicate (mesa, orden) pairs and NULLs on both keys exercise every seek range
+        keys = [(1, 1), (1, 1), (1, 2), (1, None), (2, 1), (2, None), (None, 3), (None, None), (None, None)]
+        for i, (mesa, orden) in enumerate(keys * 3):
+            Voter.objects.create(client=self.profile, zone=self.zone, dni=f'{i:03d}', mesa=mesa, orden=orden, voted=(i == 4))
+        recompute_client_counters(self.profile)
+        self.client.force_login(self.user)
+
+    def test_cursor_walks_same_order_as_offset(self):
+        url = reverse('voting:pending_voters')
+        expected = [v['dni'] for v in self.client.get(url, {'page_size': 100, 'zone_id': self.zone.id}).json()['voters']]
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = self.client.get(url, {'page_size': 10, 'zone_id': self.zone.id, 'cursor': cursor}).json()
+            self.assertEqual(data['total'], 26)
+            seen += [v['dni'] for v in data['voters']]
+            cursor = data['next_cursor']
+            self.assertEqual(data['has_more'], cursor is not None)
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(seen), 26)
+
+    def test_rejects_tampered_cursor(self):
+        response = self.client.get(reverse('voting:pending_voters'), {'cursor': 'bm9wZQ'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PendingExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Barrio Norte')
+        Voter.objects.create(client=self.profile, zone=self.zone, dni='2', last_name='PÉREZ', first_name='ANA', mesa=1, orden=2)
+        Voter.objects.create(client=self.profile, zone=self.zone, dni='1', last_name='GOMEZ', first_name='LUIS', mesa=1, orden=1)
+        Voter.objects.create(client=self.profile, zone=self.zone, dni='3', last_name='SOSA', first_name='EVA', voted=True)
+        self.client.force_login(self.user)
+        self.url = reverse('voting:export_pending_voters')
+
+    def download(self, export_format, **headers):
+        response = self.client.get(self.url, {'zone_id': self.zone.id, 'format': export_format}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_gzipped_csv_can_be_imported_again(self):
+        import gzip
+
+        response = self.download('csv', accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('pendientes-barrio-norte-', response['Content-Disposition'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        chunks = list(open_voter_file(io.BytesIO(body), 'pendientes.csv').chunks())
+        self.assertEqual(list(chunks[0][0]['dni']), ['1', '2'])
+        self.assertEqual(chunks[0][0]['last_name'].tolist(), ['GOMEZ', 'PÉREZ'])
+
+    def test_ndjson_and_columnar(self):
+        import json
+
+        lines = b''.join(self.download('ndjson').streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['dni'] for line in lines], ['1', '2'])
+        data = json.loads(b''.join(self.download('columnar').streaming_content))
+        self.assertEqual(data['chunks'], [[['1', '2'], ['GOMEZ', 'PÉREZ'], ['LUIS', 'ANA'], ['', ''], ['', ''], [1, 1], [1, 2], ['', '']]])
+        self.assertEqual(data['fields'][0], 'dni')
+
+    def test_xlsx(self):
+        f = io.BytesIO(b''.join(self.download('xlsx').streaming_content))
+        sheet = XlsxVoterFile(f)
+        self.assertEqual(sheet.missing_columns(), [])
+        self.assertEqual(list(next(sheet.chunks())[0]['dni']), ['1', '2'])
+
+    async def test_streamed_chunk_by_chunk_under_asgi(self):
+        # A sync body would be list()ed whole by the ASGI handler before the first byte
+        await self.async_client.aforce_login(self.user)
+        csv_response = await self.async_client.get(self.url, {'zone_id': self.zone.id, 'format': 'csv'})
+        self.assertTrue(csv_response.is_async)
+        body = b''.join([chunk async for chunk in csv_response.streaming_content])
+        self.assertIn('GOMEZ', body.decode('utf-8-sig'))
+        xlsx_response = await self.async_client.get(self.url, {'zone_id': self.zone.id, 'format': 'xlsx'})
+        self.assertTrue(xlsx_response.is_async)
+        body = b''.join([chunk async for chunk in xlsx_response.streaming_content])
+        self.assertEqual(len(body), int(xlsx_response['Content-Length']))
+
+
+class OfflineSyncTests(TestCase):
+    def setUp(self):
+        import json
+
+        self.json = json
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Centro')
+        self.voters = [
+            Voter.objects.create(client=self.profile, zone=self.zone, dni=str(i), last_name='LOPEZ', first_name='ANA', mesa=1, orden=i)
+            for i in range(1, 4)
+        ]
+        self.client.force_login(self.user)
+
+    def snapshot(self, **headers):
+        return self.client.get(reverse('voting:offline_snapshot'), headers=headers)
+
+    def changes(self, **params):
+        return self.client.get(reverse('voting:offline_changes'), params).json()
+
+    def test_snapshot_is_tagged_and_conditional(self):
+        response = self.snapshot()
+        data = self.json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row[0] for row in data['rows']], ['1', '2', '3'])
+        self.assertEqual(data['rows'][0][1], 'LOPEZ, ANA')
+        self.assertEqual(data['zones'], {str(self.zone.id): 'Centro'})
+        self.assertEqual(self.snapshot(if_none_match=response['ETag']).status_code, 304)
+
+    def test_logout_clears_offline_copy(self):
+        response = self.client.post(reverse('logout'))
+        self.assertEqual(response['Clear-Site-Data'], '"cache", "storage"')
+
+    async def test_snapshot_streamed_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('voting:offline_snapshot'))
+        self.assertTrue(response.is_async)
+        data = self.json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual([row[0] for row in data['rows']], ['1', '2', '3'])
+
+    def test_changes_after_mark(self):
+        data = self.json.loads(b''.join(self.snapshot().streaming_content))
+        self.client.post(reverse('voting:mark_voted', args=[self.voters[1].id]))
+        changes = self.changes(epoch=data['epoch'], since=data['seq'])
+        self.assertEqual(changes['status'], 'success')
+        self.assertEqual([(row[0], row[4]) for row in changes['rows']], [('2', True)])
+        # Continuing from the returned cursor yields nothing new
+        again = self.changes(epoch=data['epoch'], since=changes['since'], after=changes['after'])
+        self.assertEqual(again['rows'], [])
+
+    def test_clear_resets_offline_copies(self):
+        data = self.json.loads(b''.join(self.snapshot().streaming_content))
+        self.client.post(reverse('voting:clear_voters'), {'confirm_password': '09285252'})
+        self.assertEqual(self.changes(epoch=data['epoch'], since=data['seq'])['status'], 'reset')
+
+    def test_service_worker(self):
+        response = self.client.get(reverse('voting:offline_service_worker'))
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertIn(b'voting-shell-v1', response.content)
+
+
+class VoterChangesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.zone = Zone.objects.create(client=self.profile, name='Centro')
+        self.client.force_login(self.user)
+
+    def feed(self, **params):
+        return self.client.get(reverse('voting:voter_changes'), params).json()
+
+    def test_import_and_marks_are_fed_in_order(self):
+        import pandas as pd
+        from .importer import import_voters, normalize_frame
+
+        frame = pd.DataFrame({'dni': ['1', '2', '3'], 'Apellido': ['A', 'B', 'C'], 'Nombre': ['X', 'Y', 'Z']})
+        import_voters(self.profile, [normalize_frame(frame)], self.zone)
+        first = self.feed(limit=2)
+        self.assertTrue(first['has_more'])
+        rest = self.feed(limit=2, since=first['since'], after=first['after'])
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([c['dni'] for c in first['changes'] + rest['changes']], ['1', '2', '3'])
+
+        voter = Voter.objects.get(client=self.profile, dni='2')
+        self.client.post(reverse('voting:mark_voted', args=[voter.id]))
+        latest = self.feed(since=rest['since'], after=rest['after'])
+        self.assertEqual([(c['dni'], c['voted']) for c in latest['changes']], [('2', True)])
+        self.assertGreater(latest['changes'][0]['change_seq'], rest['since'])
+
+        # Re-importing identical rows writes (and feeds) nothing
+        import_voters(self.profile, [normalize_frame(frame)], self.zone)
+        self.assertEqual(self.feed(since=latest['since'], after=latest['after'])['changes'], [])
+
+    def test_stale_epoch_resets(self):
+        epoch = self.feed()['epoch']
+        self.client.post(reverse('voting:clear_voters'), {'confirm_password': '09285252'})
+        self.assertEqual(self.feed(epoch=epoch)['status'], 'reset')
+
+
+class VoterSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        zone = Zone.objects.create(client=self.profile, name='Centro')
+        for dni, last_name, first_name, school in [
+            ('20111222', 'GONZALEZ', 'MARIA', 'ESCUELA 12'),
+            ('20111333', 'GOMEZ', 'JUAN', 'COLEGIO NACIONAL'),
+            ('30999111', 'FERNANDEZ', 'MARIA', 'ESCUELA 12'),
+        ]:
+            Voter.objects.create(client=self.profile, zone=zone, dni=dni, last_name=last_name, first_name=first_name, establecimiento=school)
+        other = ClientProfile.objects.get(user=User.objects.create_user('otro', password='secreto'))
+        Voter.objects.create(client=other, dni='20111444', last_name='GOMEZ', first_name='ANA')
+        self.client.force_login(self.user)
+
+    def search(self, q):
+        response = self.client.get(reverse('voting:search_voters'), {'q': q}).json()
+        return [v['dni'] for v in response['voters']]
+
+    def test_dni_prefix(self):
+        self.assertEqual(self.search('20111'), ['20111222', '20111333'])
+        self.assertEqual(self.search('3099'), ['30999111'])
+        # Unicode digits are searched as text, not as a DNI range
+        self.assertEqual(self.search('20\u00b2\u00b2'), [])
+        self.assertEqual(self.search('\u0663\u0663'), [])
+
+    def test_name_terms_and_school(self):
+        self.assertEqual(self.search('gomez'), ['20111333'])
+        # Every word must match somewhere; equal ranks fall back to surname order
+        self.assertEqual(self.search('maria escuela'), ['30999111', '20111222'])
+
+    def test_typo_tolerance(self):
+        if not trigram_available():
+            self.skipTest("pg_trgm no está instalado")
+        self.assertIn('20111222', self.search('gonzales'))
+
+    def test_visitor_dashboard_query(self):
+        visitor = User.objects.get(username=f'asiste{self.user.username}')
+        self.client.force_login(visitor)
+        response = self.client.get(reverse('voting:visitor_dashboard'), {'q': 'gomez'})
+        self.assertEqual(response.status_code, 200)
+
+
+class DniLookupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.client.force_login(self.user)
+
+    def lookup(self, dni):
+        return self.client.post(reverse('voting:search_voter_by_dni'), {'dni': dni}).json()
+
+    def test_single_query_per_outcome(self):
+        from .views import lookup_voter_by_dni
+
+        with self.assertNumQueries(1):
+            self.assertEqual(lookup_voter_by_dni(self.profile.id, '1')['status'], 'no_data')
+        zone = Zone.objects.create(client=self.profile, name='Sur')
+        voter = Voter.objects.create(client=self.profile, zone=zone, dni='1', last_name='RUIZ', first_name='EVA', mesa=3)
+        recompute_client_counters(self.profile)
+        with self.assertNumQueries(1):
+            self.assertEqual(lookup_voter_by_dni(self.profile.id, '2')['status'], 'not_found')
+        with self.assertNumQueries(1):
+            found = lookup_voter_by_dni(self.profile.id, '1')
+        self.assertEqual(found['voter']['id'], voter.id)
+
+    def test_response_format(self):
+        Voter.objects.create(client=self.profile, dni='7', last_name='RUIZ', first_name='EVA', sex='F', orden=4)
+        recompute_client_counters(self.profile)
+        self.assertEqual(self.lookup('7'), {
+            'status': 'success',
+            'voter': {
+                'id': Voter.objects.get(dni='7').id, 'name': 'RUIZ, EVA', 'last_name': 'RUIZ', 'first_name': 'EVA',
+                'dni': '7', 'voted': False, 'sex': 'F', 'address': '', 'mesa': None, 'orden': 4,
+                'establecimiento': '', 'zone': 'Sin asignar',
+            },
+        })
+        self.assertEqual(list(self.lookup('7')['voter']), [
+            'id', 'name', 'last_name', 'first_name', 'dni', 'voted', 'sex', 'address', 'mesa', 'orden', 'establecimiento', 'zone',
+        ])
+
+
+@override_settings(VOTING_DNI_INDEX=True)
+class DniIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        self.norte = Zone.objects.create(client=self.profile, name='Norte')
+        self.sur = Zone.objects.create(client=self.profile, name='Sur')
+        for dni in ('30111222', '0123', 'AB-9'):
+            Voter.objects.create(client=self.profile, zone=self.norte, dni=dni, last_name='PAZ', first_name='LIA')
+        recompute_client_counters(self.profile)
+        dni_index.invalidate(self.profile.id)
+        self.client.force_login(self.user)
+
+    def mark(self, dni):
+        return self.client.post(reverse('voting:mark_by_dni_set'), {'dni': dni}).json()
+
+    def test_marks_through_index(self):
+        for dni in ('30111222', '0123', 'AB-9'):
+            self.assertEqual(self.mark(dni)['status'], 'success')
+        self.assertEqual(self.mark('999')['status'], 'not_found')
+        self.assertEqual(Voter.objects.filter(client=self.profile, voted=True).count(), 3)
+        self.norte.refresh_from_db()
+        self.assertEqual(self.norte.voted_count, 3)
+        client_stats = dni_index.stats()['clients'][self.profile.id]
+        self.assertEqual((client_stats['voters'], client_stats['hits'], client_stats['misses']), (3, 3, 1))
+
+    def test_stale_entry_falls_back_to_database(self):
+        self.assertIsNotNone(dni_index.lookup(self.profile.id, '30111222'))
+        # Moved by another process: this worker's index still says Norte
+        Voter.objects.filter(dni='30111222').update(zone=self.sur)
+        self.assertEqual(self.mark('30111222')['status'], 'success')
+        self.sur.refresh_from_db()
+        self.norte.refresh_from_db()
+        self.assertEqual((self.sur.voted_count, self.norte.voted_count), (1, 0))
+        self.assertNotIn(self.profile.id, dni_index.stats()['clients'])
+
+    def test_about_28_bytes_per_voter(self):
+        profile = ClientProfile.objects.get(user=User.objects.create_user('otro', password='secreto'))
+        Voter.objects.bulk_create([Voter(client=profile, dni=str(40000000 + i), last_name='PAZ', first_name='LIA') for i in range(1000)])
+        dni_index.lookup(profile.id, '40000000')
+        # 28 per voter, plus the one (establecimiento, mesa) tuple they share
+        self.assertEqual(dni_index.stats()['clients'][profile.id]['bytes'], 1000 * 28 + 200)
+
+    def test_stats_are_for_superusers(self):
+        self.assertEqual(self.client.get(reverse('voting:dni_index_stats')).status_code, 403)
+        self.client.force_login(User.objects.create_superuser('admin', password='secreto'))
+        self.assertEqual(self.client.get(reverse('voting:dni_index_stats')).json()['status'], 'success')
+
+
+class AsyncEndpointsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        zone = Zone.objects.create(client=self.profile, name='Norte')
+        for n in range(3):
+            Voter.objects.create(client=self.profile, zone=zone, dni=str(n + 1), last_name='PAZ', first_name='LIA', mesa=1, orden=n)
+        Voter.objects.filter(dni='1').update(voted=True)
+        recompute_client_counters(self.profile)
+
+    async def test_hot_endpoints_under_async_client(self):
+        await self.async_client.aforce_login(self.user)
+        stats = (await self.async_client.get(reverse('voting:get_voter_stats'))).json()
+        self.assertEqual(stats['stats'], {'total_voters': 3, 'voted_count': 1, 'percentage': 33.33})
+        zones = (await self.async_client.get(reverse('voting:get_zone_stats'))).json()
+        self.assertEqual([(z['name'], z['voted_count']) for z in zones['zones']], [('Norte', 1)])
+        pending = (await self.async_client.get(reverse('voting:pending_voters'), {'cursor': '', 'page_size': 10})).json()
+        self.assertEqual(([v['dni'] for v in pending['voters']], pending['total']), (['2', '3'], 2))
+        found = (await self.async_client.post(reverse('voting:search_voter_by_dni'), {'dni': '3'})).json()
+        self.assertEqual((found['status'], found['voter']['zone']), ('success', 'Norte'))
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse('voting:get_voter_stats'))
+        self.assertEqual(response.status_code, 302)
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        other = ClientProfile.objects.get(user=User.objects.create_user('otro', password='secreto'))
+        for profile in (self.profile, other):
+            zone = Zone.objects.create(client=profile, name='Norte')
+            for dni in ('1', '2', '3'):
+                Voter.objects.create(client=profile, zone=zone, dni=dni, last_name='PAZ', first_name='LIA', voted=dni == '1')
+            recompute_client_counters(profile)
+        self.other = other
+        self.client.force_login(self.user)
+
+    def test_clear_voters_counts_from_deletes(self):
+        from .purge import purge_client_voters
+
+        epoch = self.profile.list_epoch
+        # Voter, zone and mesa DELETEs and one counter UPDATE, plus the savepoint and NOTIFY
+        with self.assertNumQueries(6):
+            self.assertEqual(purge_client_voters(self.profile.id), (3, 1))
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.total_voters, self.profile.voted_count, self.profile.list_epoch), (0, 0, epoch + 1))
+        self.assertEqual((Voter.objects.filter(client=self.other).count(), Zone.objects.filter(client=self.other).count()), (3, 1))
+        self.assertEqual((MesaTurnout.objects.filter(client=self.profile).count(), MesaTurnout.objects.filter(client=self.other).count()), (0, 1))
+        self.assertEqual(self.client.post(reverse('voting:clear_voters'), {'confirm_password': '09285252'}).json()['deleted_count'], 0)
+
+    def test_replace_import_purges_first(self):
+        job = enqueue_import(self.profile, SimpleUploadedFile('padron.xlsx', make_xlsx(2).read()), 'Sin asignar', replace=True)
+        run_import_job(job.id)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.total_voters, 2)
+        self.assertEqual(list(Zone.objects.filter(client=self.profile).values_list('name', flat=True)), ['Sin asignar'])
+
+
+class ReplaceImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        zone = Zone.objects.create(client=self.profile, name='Norte')
+        for dni in ('20000000', '20000001', '1'):
+            Voter.objects.create(client=self.profile, zone=zone, dni=dni, last_name='VIEJO', first_name='X', voted=dni != '20000001')
+        recompute_client_counters(self.profile)
+
+    def replace(self, f, keep_votes):
+        job = enqueue_import(self.profile, SimpleUploadedFile('padron.xlsx', f.read()), 'Sin asignar', replace=True, keep_votes=keep_votes)
+        self.assertEqual(claim_next_job().id, job.id)
+        run_import_job(job.id)
+        self.profile.refresh_from_db()
+        return ImportJob.objects.get(id=job.id)
+
+    def test_keep_votes(self):
+        # The last row of a repeated DNI wins
+        job = self.replace(make_xlsx(3, extra=[['20000002', 'RUIZ', 'EVA', '', '', '', '', '']]), keep_votes=True)
+        self.assertEqual((job.status, job.created), (ImportJob.DONE, 3))
+        voters = dict(Voter.objects.filter(client=self.profile).values_list('dni', 'voted'))
+        self.assertEqual(voters, {'20000000': True, '20000001': False, '20000002': False})
+        self.assertEqual(Voter.objects.get(client=self.profile, dni='20000002').last_name, 'RUIZ')
+        self.assertEqual((self.profile.total_voters, self.profile.voted_count), (3, 1))
+        zone = Zone.objects.get(client=self.profile)
+        self.assertEqual((zone.name, zone.total_voters, zone.voted_count), ('Sin asignar', 3, 1))
+        mesas = MesaTurnout.objects.filter(client=self.profile).order_by('mesa').values_list('mesa', 'total_voters', 'voted_count')
+        self.assertEqual(list(mesas), [(1, 1, 1), (2, 1, 0), (None, 1, 0)])
+
+    def test_without_keep_votes(self):
+        self.replace(make_xlsx(3), keep_votes=False)
+        self.assertFalse(Voter.objects.filter(client=self.profile, voted=True).exists())
+        self.assertEqual((self.profile.total_voters, self.profile.voted_count), (3, 0))
+
+    def test_empty_file_keeps_current_list(self):
+        job = self.replace(make_xlsx(0, extra=[['1', '', '', '', '', '', '', '']]), keep_votes=False)
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(Voter.objects.filter(client=self.profile).count(), 3)
+        self.assertEqual(list(Zone.objects.filter(client=self.profile).values_list('name', flat=True)), ['Norte'])
+
+
+class FallbackReplaceImportTests(ReplaceImportTests):
+    """The same replacements through purge + import_voters, as on databases without COPY."""
+
+    def replace(self, f, keep_votes):
+        from unittest import mock
+
+        with mock.patch('voting.bulkload.supported', return_value=False):
+            return super().replace(f, keep_votes)
+
+
+class VoterPartitioningTests(TestCase):
+    def test_client_voters_share_one_partition(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Partitioning is PostgreSQL only")
+        profile = ClientProfile.objects.get(user=User.objects.create_user('cliente', password='secreto'))
+        first = Voter.objects.create(client=profile, dni='1', last_name='PAZ', first_name='LIA')
+        second = Voter.objects.create(client=profile, dni='2', last_name='PAZ', first_name='LIA')
+        self.assertGreater(second.id, first.id)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT tableoid::regclass::text FROM voting_voter WHERE client_id = %s", [profile.id])
+            partitions = [name for name, in cursor.fetchall()]
+        self.assertEqual(len(partitions), 1)
+        self.assertTrue(partitions[0].startswith('voting_voter_p'))
+
+
+class MesaTurnoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cliente', password='secreto')
+        self.profile = ClientProfile.objects.get(user=self.user)
+        zone = Zone.objects.create(client=self.profile, name='Norte')
+        for dni, school, mesa in (('1', 'ESCUELA 1', 1), ('2', 'ESCUELA 1', 1), ('3', 'ESCUELA 1', 2), ('4', 'ESCUELA 2', None)):
+            Voter.objects.create(client=self.profile, zone=zone, dni=dni, last_name='PAZ', first_name='LIA', establecimiento=school, mesa=mesa)
+        recompute_client_counters(self.profile)
+        dni_index.invalidate(self.profile.id)
+        self.client.force_login(self.user)
+
+    def counts(self):
+        return {
+            (school, mesa): (total, voted)
+            for school, mesa, total, voted in MesaTurnout.objects.filter(client=self.profile)
+                .values_list('establecimiento', 'mesa', 'total_voters', 'voted_count')
+        }
+
+    def test_marks_move_their_mesa(self):
+        voter = Voter.objects.get(client=self.profile, dni='1')
+        self.client.post(reverse('voting:mark_voted', args=[voter.id]))
+        self.client.post(reverse('voting:mark_by_dni_set'), {'dni': '4'})
+        self.client.post(reverse('voting:mark_by_dni_batch'), {'dnis': ['2', '3']}, content_type='application/json')
+        self.client.post(reverse('voting:mark_voted', args=[voter.id]))  # unmark
+        self.assertEqual(self.counts(), {
+            ('ESCUELA 1', 1): (2, 1), ('ESCUELA 1', 2): (1, 1), ('ESCUELA 2', None): (1, 1),
+        })
+
+    @override_settings(VOTING_DNI_INDEX=True)
+    def test_index_path_moves_its_mesa(self):
+        self.client.post(reverse('voting:mark_by_dni_set'), {'dni': '3'})
+        self.assertEqual(self.counts()[('ESCUELA 1', 2)], (1, 1))
+
+    def test_endpoints_sorted_by_lowest_turnout(self):
+        self.client.post(reverse('voting:mark_by_dni_batch'), {'dnis': ['1', '3']}, content_type='application/json')
+        mesas = self.client.get(reverse('voting:get_mesa_stats')).json()['mesas']
+        self.assertEqual(
+            [(m['establecimiento'], m['mesa'], m['percentage']) for m in mesas],
+            [('ESCUELA 2', None, 0), ('ESCUELA 1', 1, 50.0), ('ESCUELA 1', 2, 100.0)],
+        )
+        schools = self.client.get(reverse('voting:get_establecimiento_stats')).json()['establecimientos']
+        self.assertEqual(
+            [(s['establecimiento'], s['mesas'], s['total_voters'], s['voted_count'], s['percentage']) for s in schools],
+            [('ESCUELA 2', 1, 1, 0, 0), ('ESCUELA 1', 2, 3, 2, 66.67)],
+        )
+
+
+class RecomputeCountersTests(TestCase):
+    def setUp(self):
+        self.profile = ClientProfile.objects.get(user=User.objects.create_user('cliente', password='secreto'))
+
+    def seed(self, zones):
+        for z in range(zones):
+            zone = Zone.objects.create(client=self.profile, name=f'Zona {z}')
+            for i in range(4):
+                Voter.objects.create(
+                    client=self.profile, zone=zone, dni=f'{z}-{i}', last_name='PAZ', first_name='LIA',
+                    establecimiento=f'ESCUELA {z}', mesa=i % 2, voted=i < z % 4 + 1,
+                )
+        Voter.objects.create(client=self.profile, dni='sin-zona', last_name='PAZ', first_name='LIA', voted=True)
+        recompute_client_counters(self.profile)
+        expected = self.counters()
+        # Drift every level: counts off, a mesa row lost and a stale one left behind
+        ClientProfile.objects.filter(id=self.profile.id).update(total_voters=99, voted_count=-3)
+        Zone.objects.filter(client=self.profile).update(total_voters=0, voted_count=7)
+        MesaTurnout.objects.filter(client=self.profile, mesa=0).update(voted_count=50)
+        MesaTurnout.objects.filter(client=self.profile, establecimiento='ESCUELA 0', mesa=1).delete()
+        MesaTurnout.objects.create(client=self.profile, establecimiento='CERRADA', mesa=9, total_voters=4, voted_count=2)
+        return expected
+
+    def counters(self):
+        profile = ClientProfile.objects.get(id=self.profile.id)
+        return (
+            (profile.total_voters, profile.voted_count),
+            sorted(Zone.objects.filter(client=self.profile).values_list('name', 'total_voters', 'voted_count')),
+            sorted(MesaTurnout.objects.filter(client=self.profile).values_list('establecimiento', 'mesa', 'total_voters', 'voted_count'),
+                   key=lambda row: (row[0], row[1] is None, row[1])),
+        )
+
+    def test_recompute_repairs_drift(self):
+        expected = self.seed(zones=2)
+        self.assertEqual(expected[0], (9, 4))
+        self.assertEqual(expected[1], [('Zona 0', 4, 1), ('Zona 1', 4, 2)])
+        self.assertEqual(expected[2], [('', None, 1, 1), ('ESCUELA 0', 0, 2, 1), ('ESCUELA 0', 1, 2, 0), ('ESCUELA 1', 0, 2, 1), ('ESCUELA 1', 1, 2, 1)])
+        recompute_client_counters(self.profile)
+        self.assertEqual(self.counters(), expected)
+
+    def test_statement_count_does_not_grow_with_zones_or_mesas(self):
+        for zones in (2, 12):
+            with self.subTest(zones=zones):
+                Voter.objects.filter(client=self.profile).delete()
+                MesaTurnout.objects.filter(client=self.profile).delete()
+                Zone.objects.filter(client=self.profile).delete()
+                expected = self.seed(zones=zones)
+                with self.assertNumQueries(14):
+                    recompute_client_counters(self.profile)
+                self.assertEqual(self.counters(), expected)
+
+
+class RecomputeCountersCommandTests(TransactionTestCase):
+    def test_command_recomputes_every_client(self):
+        from django.core.management import CommandError, call_command
+
+        profiles = [ClientProfile.objects.get(user=User.objects.create_user(name, password='secreto')) for name in ('uno', 'dos')]
+        for profile in profiles:
+            zone = Zone.objects.create(client=profile, name='Centro')
+            Voter.objects.create(client=profile, zone=zone, dni='1', last_name='PAZ', first_name='LIA', voted=True)
+            Voter.objects.create(client=profile, zone=zone, dni='2', last_name='SOL', first_name='MAR', mesa=3)
+        ClientProfile.objects.update(total_voters=0, voted_count=5)
+        out = io.StringIO()
+        call_command('recompute_counters', stdout=out)
+        self.assertEqual(out.getvalue().count(': 1/2'), 2)
+        for profile in profiles:
+            profile.refresh_from_db()
+            self.assertEqual((profile.total_voters, profile.voted_count), (2, 1))
+            self.assertEqual(list(Zone.objects.filter(client=profile).values_list('total_voters', 'voted_count')), [(2, 1)])
+            self.assertEqual(MesaTurnout.objects.filter(client=profile).count(), 2)
+
+        ClientProfile.objects.filter(id=profiles[1].id).update(voted_count=0)
+        call_command('recompute_counters', '--client', str(profiles[1].id), stdout=io.StringIO())
+        profiles[1].refresh_from_db()
+        self.assertEqual(profiles[1].voted_count, 1)
+        with self.assertRaises(CommandError):
+            call_command('recompute_counters', '--client', '999999', stdout=io.StringIO())
@@ -7,13 +7,25 @@ urlpatterns = [
     path('', views.custom_redirect, name='custom_redirect'),
     path('dashboard/', views.main_dashboard, name='main_dashboard'),
     path('visitor/dashboard/', views.visitor_dashboard, name='visitor_dashboard'),
+    path('search_voters/', views.search_voters_view, name='search_voters'),  # Ranked search by name, DNI prefix or school
     path('mark_voted/<int:voter_id>/', views.mark_voted, name='mark_voted'),
     path('mark_by_dni_set/', views.mark_voted_by_dni_set, name='mark_by_dni_set'),
+    path('dni_index/stats/', views.dni_index_stats, name='dni_index_stats'),  # DNI index memory/hit ratio (this worker)
+    path('mark_by_dni_batch/', views.mark_voted_by_dni_batch, name='mark_by_dni_batch'),  # Queued DNIs in one request
     path('search_voter_by_dni/', views.search_voter_by_dni, name='search_voter_by_dni'),
     path('voter_stats/', views.get_voter_stats, name='get_voter_stats'),  # New endpoint
     path('zone_stats/', views.get_zone_stats, name='get_zone_stats'),  # Per-zone stats
+    path('mesa_stats/', views.get_mesa_stats, name='get_mesa_stats'),  # Per-mesa turnout, lowest first
+    path('establecimiento_stats/', views.get_establecimiento_stats, name='get_establecimiento_stats'),  # Per-school turnout, lowest first
+    path('stats_stream/', views.stats_stream, name='stats_stream'),  # Live turnout deltas (SSE, ASGI only)
     path('pending_voters/', views.pending_voters, name='pending_voters'),  # Paginated pending voters
+    path('pending_voters/export/', views.export_pending_voters, name='export_pending_voters'),  # Full pending list download
+    path('offline/snapshot/', views.offline_snapshot, name='offline_snapshot'),  # Voter list for offline devices
+    path('offline/changes/', views.offline_changes, name='offline_changes'),  # Voters changed since a snapshot
+    path('voter_changes/', views.voter_changes, name='voter_changes'),  # Change feed for integrations
+    path('sw.js', views.offline_service_worker, name='offline_service_worker'),  # Visitor dashboard service worker
     path('clear_voters/', views.clear_voters, name='clear_voters'),  # Delete all voters for client
     path('upload_zone/', views.upload_voters_to_zone, name='upload_voters_to_zone'),  # Upload list assigning to a zone
+    path('import_jobs/<int:job_id>/', views.import_job_status, name='import_job_status'),  # Background import progress
     path('validate_password/', views.validate_destructive_password, name='validate_password'),  # Validate destructive password
 ]
@@ -1,30 +1,50 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.db import transaction
-from django.db.models import F, Count, Q
+from django.db import connection, transaction
+from django.db.models import Count, F, FilteredRelation, Q, Sum
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.text import compress_sequence, slugify
 from django.contrib import messages
-from .models import Voter, ClientProfile, Zone
+from .models import Voter, ClientProfile, Zone, ImportJob, MesaTurnout
+from .importer import SUPPORTED_EXTENSIONS, EmptyFileError, open_voter_file
+from .exports import EXPORT_CHUNK_SIZE, STREAM_FORMATS, write_xlsx
+from .search import MAX_SEARCH_LIMIT, MIN_QUERY_LENGTH, SEARCH_LIMIT, search_voters, trigram_available
+from .offline import CHANGE_FIELDS, OFFLINE_CHUNK_SIZE, changed_voters, changes_after, sync_state, write_snapshot
+from .jobs import enqueue_import
+from .purge import purge_client_voters
+from .counters import apply_vote_delta, apply_vote_deltas, recompute_client_counters
+from .middleware import ROLE_CLIENT, ROLE_VISITOR
+from . import dni_index, events
 
 @login_required
 def custom_redirect(request):
     if request.user.is_superuser:
         return redirect('/admin/')
-    elif hasattr(request.user, 'clientprofile'):
+    elif request.client_role == ROLE_CLIENT:
         return redirect('voting:main_dashboard')
-    elif hasattr(request.user, 'visitor_profile'):
+    elif request.client_role == ROLE_VISITOR:
         return redirect('voting:visitor_dashboard')
     else:
         return HttpResponseForbidden("Acceso denegado. No se encontró un perfil válido.")
 
 @login_required
 def main_dashboard(request):
-    if not hasattr(request.user, 'clientprofile'):
+    if request.client_role != ROLE_CLIENT:
         return HttpResponseForbidden("Acceso denegado. Debes ser un cliente para acceder a esta página.")
-    client_profile = request.user.clientprofile
+    client_profile = request.client_profile
     voters = client_profile.voters.all()
     voter_count = voters.count() # Get initial voter count
 
@@ -32,118 +52,42 @@ def main_dashboard(request):
         uploaded_file = request.FILES['file']
 
         # --- File Type Validation First ---
-        if not uploaded_file.name.endswith('.xlsx'):
-            messages.error(request, "Por favor, suba un archivo de Excel (.xlsx).")
+        if not uploaded_file.name.lower().endswith(SUPPORTED_EXTENSIONS):
+            messages.error(request, "Por favor, suba un archivo de Excel (.xlsx), CSV (.csv) o Parquet (.parquet).")
             # Redirect immediately without deleting data
             return redirect('voting:main_dashboard')
         # --- End File Type Validation ---
 
-        # Step 2: Read DataFrame
+        # Step 2: Check the header only; rows are read by the background import worker
         try:
-            # Lazy import pandas to avoid hard dependency at startup
-            import pandas as pd  # type: ignore
-            df = pd.read_excel(uploaded_file, engine='openpyxl')
-        except pd.errors.EmptyDataError:
-            messages.error(request, "El archivo de Excel subido está vacío.")
+            sheet = open_voter_file(uploaded_file, uploaded_file.name)
+        except EmptyFileError:
+            messages.error(request, "El archivo subido está vacío.")
             return redirect('voting:main_dashboard')
         except Exception as e: # Catch other potential read errors (e.g., corrupted file)
-            messages.error(request, f"Error al leer el archivo de Excel: {str(e)}")
+            messages.error(request, f"Error al leer el archivo: {str(e)}")
             return redirect('voting:main_dashboard')
+        missing_columns = sheet.missing_columns()
+        sheet.close()
 
         # Step 3: Validate Columns
-        required_columns = ['dni', 'Apellido', 'Nombre']
-        if not all(col in df.columns for col in required_columns):
-            messages.error(request, "El archivo de Excel debe contener las columnas 'dni', 'Apellido' y 'Nombre'.")
+        if missing_columns:
+            messages.error(request, "El archivo debe contener las columnas 'dni', 'Apellido' y 'Nombre'.")
             return redirect('voting:main_dashboard') # Redirect *before* deletion check
 
         # --- All file/column validations passed ---
 
-        # Step 4 & 5: Deletion Logic (only if needed and validations passed)
-        confirm_replace = request.POST.get('confirm_replace') == 'yes'
-        if confirm_replace and voter_count > 0:
-            # Require hardcoded password for destructive replace
-            if (request.POST.get('confirm_password') or '') != '09285252':
-                messages.error(request, "Contraseña incorrecta para reemplazar la lista.")
-                return redirect('voting:main_dashboard')
-            try:
-                with transaction.atomic():
-                    # Delete voters then zones belonging to this client
-                    client_profile.voters.all().delete()
-                    Zone.objects.filter(client=client_profile).delete()
-                messages.info(request, "Votantes y zonas existentes eliminados.")
-                voter_count = 0 # Update local count
-            except Exception as e:
-                messages.error(request, f"Error al eliminar los votantes/zona existentes: {str(e)}")
-                return redirect('voting:main_dashboard') # Stop if deletion fails
-
-        # Step 6 & 7: Import Voters
-        try:
-            default_zone, _ = Zone.objects.get_or_create(client=client_profile, name='Sin asignar')
-            created = 0
-            updated = 0
-            for index, row in df.iterrows():
-                # Normalize and validate values
-                dni_val = '' if pd.isna(row.get('dni')) else str(row.get('dni')).strip()
-                last_name = '' if pd.isna(row.get('Apellido')) else str(row.get('Apellido')).strip()
-                first_name = '' if pd.isna(row.get('Nombre')) else str(row.get('Nombre')).strip()
-                sex = '' if pd.isna(row.get('Sexo')) else str(row.get('Sexo')).strip().upper()
-                address = '' if pd.isna(row.get('Direccion')) else str(row.get('Direccion')).strip()
-                mesa = None if pd.isna(row.get('Mesa')) else int(row.get('Mesa')) if str(row.get('Mesa')).strip().isdigit() else None
-                orden = None if pd.isna(row.get('Orden')) else int(row.get('Orden')) if str(row.get('Orden')).strip().isdigit() else None
-                establecimiento = '' if pd.isna(row.get('Establecimiento')) else str(row.get('Establecimiento')).strip()
-                if not dni_val or not last_name or not first_name:
-                    messages.warning(request, f"Fila {index + 2} omitida: Falta DNI o Nombre.")
-                    continue
-
-                # Upsert by (client, dni)
-                voter = Voter.objects.filter(client=client_profile, dni=dni_val).first()
-                if voter:
-                    changed = False
-                    if (voter.last_name != last_name) or (voter.first_name != first_name):
-                        voter.last_name = last_name
-                        voter.first_name = first_name
-                        changed = True
-                    # always sync other fields if changed
-                    field_updates = []
-                    if voter.sex != sex:
-                        voter.sex = sex; field_updates.append('sex')
-                    if voter.address != address:
-                        voter.address = address; field_updates.append('address')
-                    if voter.mesa != mesa:
-                        voter.mesa = mesa; field_updates.append('mesa')
-                    if voter.orden != orden:
-                        voter.orden = orden; field_updates.append('orden')
-                    if voter.establecimiento != establecimiento:
-                        voter.establecimiento = establecimiento; field_updates.append('establecimiento')
-                    if voter.zone_id != default_zone.id:
-                        voter.zone = default_zone
-                        changed = True
-                    if changed or field_updates:
-                        voter.save(update_fields=['last_name', 'first_name', 'zone'] + field_updates)
-                        updated += 1
-                else:
-                    Voter.objects.create(
-                        client=client_profile,
-                        dni=dni_val,
-                        last_name=last_name,
-                        first_name=first_name,
-                        sex=sex,
-                        address=address,
-                        mesa=mesa,
-                        orden=orden,
-                        establecimiento=establecimiento,
-                        voted=False,
-                        zone=default_zone
-                    )
-                    created += 1
-            # After bulk operations, recompute denormalized counters for this client
-            recompute_client_counters(client_profile)
-        except Exception as e:  # Catch errors during upsert
-            messages.error(request, f"Error al procesar el archivo de Excel: {str(e)}")
-            return redirect('voting:main_dashboard')  # Stay on page without success flag
-
-        # Successful import -> redirect with flag for inline toast
-        return redirect(f"{reverse('voting:main_dashboard')}?uploaded=1")
+        # Step 4: Replacing an existing list requires the destructive-action password
+        replace = request.POST.get('confirm_replace') == 'yes' and voter_count > 0
+        if replace and (request.POST.get('confirm_password') or '') != '09285252':
+            messages.error(request, "Contraseña incorrecta para reemplazar la lista.")
+            return redirect('voting:main_dashboard')
+
+        # Step 5: Queue the import (deletion, if any, happens in the job); the page polls its status
+        uploaded_file.seek(0)
+        keep_votes = replace and request.POST.get('keep_votes') == 'yes'
+        job = enqueue_import(client_profile, uploaded_file, 'Sin asignar', replace=replace, keep_votes=keep_votes)
+        return redirect(f"{reverse('voting:main_dashboard')}?job={job.id}")
 
     # GET (or POST without file) -> render dashboard
     return render(request, 'voting/main_dashboard.html', {
@@ -155,19 +99,49 @@ def main_dashboard(request):
 @login_required
 def visitor_dashboard(request):
     """Allows visitors to search voters and mark them as voted"""
-    if not hasattr(request.user, 'visitor_profile'):  # Check for visitor_profile
+    if request.client_role != ROLE_VISITOR:
         return redirect('voting:custom_redirect')  # Prevent access for non-visitors
 
-    # Fetch the ClientProfile associated with the visitor user
-    client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-    query = request.GET.get('q', '')
-    voters = Voter.objects.filter(client=client_profile)
-    if query:
-        voters = voters.filter(name__icontains=query) | voters.filter(dni__icontains=query)
-    return render(request, 'voting/visitor_dashboard.html', {'voters': voters})
+    # Name/DNI search runs client-side against search_voters; 'q' only pre-fills it
+    return render(request, 'voting/visitor_dashboard.html', {'query': request.GET.get('q', '')})
 
 @login_required
-def search_voter_by_dni(request):
+def search_voters_view(request):
+    """Ranked voter search by surname, first name, DNI prefix or establecimiento (GET 'q', 'limit').
+    Tolerates typos where pg_trgm is installed (see voting/search.py)."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
+    query = request.GET.get('q', '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return JsonResponse({"status": "error", "message": f"Ingrese al menos {MIN_QUERY_LENGTH} caracteres"}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit') or SEARCH_LIMIT), 1), MAX_SEARCH_LIMIT)
+    except ValueError:
+        limit = SEARCH_LIMIT
+    voters = search_voters(client_id, query, limit)
+    return JsonResponse({
+        "status": "success",
+        "mode": "trigram" if trigram_available() else "basic",
+        "voters": [
+            {
+                "id": v['id'],
+                "name": f"{v['last_name']}, {v['first_name']}".strip(', '),
+                "last_name": v['last_name'],
+                "first_name": v['first_name'],
+                "dni": v['dni'],
+                "voted": v['voted'],
+                "mesa": v['mesa'],
+                "orden": v['orden'],
+                "establecimiento": v['establecimiento'],
+                "zone": v['zone_name'] or 'Sin asignar',
+            }
+            for v in voters
+        ],
+    })
+
+@login_required
+async def search_voter_by_dni(request):
     """API endpoint to search for a voter by DNI"""
     if request.method != "POST":
         return JsonResponse({"status": "error", "message": "Solo se permite el método POST"})
@@ -176,83 +150,70 @@ def search_voter_by_dni(request):
     if not dni:
         return JsonResponse({"status": "error", "message": "El DNI es requerido"})
 
-    # Determine which client's voters to search
-    if hasattr(request.user, 'clientprofile'):
-        client_profile = request.user.clientprofile
-    elif hasattr(request.user, 'visitor_profile'):
-        client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-    else:
+    # Determine which client's voters to search (resolved by ClientProfileMiddleware)
+    client_id = request.client_id
+    if client_id is None:
         return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
 
-    # If there are no voters uploaded yet for this client, return a specific message
-    total_for_client = Voter.objects.filter(client=client_profile).count()
-    if total_for_client == 0:
-        return JsonResponse({
-            "status": "no_data",
-            "message": "Sin datos, por favor cargue una lista de votantes primero"
-        })
+    return JsonResponse(_dni_lookup_payload(await _dni_lookup_query(client_id, dni).afirst()))
 
-    # Try to find the voter by DNI without raising 404s
-    voter = Voter.objects.filter(client=client_profile, dni=dni).first()
-    if not voter:
-        return JsonResponse({
+# Voter columns returned by the DNI lookup, read through the 'match' relation below
+DNI_LOOKUP_FIELDS = ['id', 'last_name', 'first_name', 'dni', 'voted', 'sex', 'address', 'mesa', 'orden', 'establecimiento']
+
+def _dni_lookup_query(client_id, dni):
+    # The client row LEFT JOINs its voter with that DNI (unique index) and the voter's zone
+    return (
+        ClientProfile.objects.filter(id=client_id)
+        .annotate(match=FilteredRelation('voters', condition=Q(voters__dni=dni)))
+        .values('total_voters', 'match__zone__name', *[f'match__{f}' for f in DNI_LOOKUP_FIELDS])
+    )
+
+def _dni_lookup_payload(row):
+    if row is None or row['match__id'] is None:
+        # total_voters tells "no data" from "not found" without counting voters
+        if row is None or not row['total_voters']:
+            return {
+                "status": "no_data",
+                "message": "Sin datos, por favor cargue una lista de votantes primero"
+            }
+        return {
             "status": "not_found",
             "message": "No se encontró ningún votante con ese DNI."
-        })
-
-    full_name = f"{voter.last_name}, {voter.first_name}".strip(', ')
-    return JsonResponse({
-        "status": "success",
-        "voter": {
-            "id": voter.id,
-            "name": full_name,
-            "last_name": voter.last_name,
-            "first_name": voter.first_name,
-            "dni": voter.dni,
-            "voted": voter.voted,
-            "sex": voter.sex,
-            "address": voter.address,
-            "mesa": voter.mesa,
-            "orden": voter.orden,
-            "establecimiento": voter.establecimiento,
-            "zone": voter.zone.name if voter.zone else 'Sin asignar'
         }
-    })
+    fields = {f: row[f'match__{f}'] for f in DNI_LOOKUP_FIELDS}
+    voter = {"id": fields.pop('id'), "name": f"{fields['last_name']}, {fields['first_name']}".strip(', ')}
+    voter.update(fields)
+    voter["zone"] = row['match__zone__name'] or 'Sin asignar'
+    return {"status": "success", "voter": voter}
+
+def lookup_voter_by_dni(client_id, dni):
+    """Payload of search_voter_by_dni in a single query (see _dni_lookup_query)."""
+    return _dni_lookup_payload(_dni_lookup_query(client_id, dni).first())
 
 @csrf_exempt  # Note: Consider using proper CSRF protection in production
 def mark_voted(request, voter_id):
     if request.method != "POST":
         return JsonResponse({"status": "error", "message": "Solo se permite el metodo POST"})
     
+    # Resolve the caller's client before touching the voter
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+
     try:
-        voter = Voter.objects.get(id=voter_id)
-        
-        # Check permissions
-        if hasattr(request.user, 'clientprofile'):
-            if voter.client != request.user.clientprofile:
-                return JsonResponse({"status": "error", "message": "Acceso denegado"})
-        elif hasattr(request.user, 'visitor_profile'):
-            client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-            if voter.client != client_profile:
-                return JsonResponse({"status": "error", "message": "Acceso denegado"})
-        else:
-            return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
-
-        # Toggle the voted status
-        prev = voter.voted
-        voter.voted = not voter.voted
-        voter.save(update_fields=['voted'])
-        # Update denormalized counters
-        delta = 1 if voter.voted and not prev else (-1 if (prev and not voter.voted) else 0)
-        if delta != 0:
-            try:
-                if voter.zone_id:
-                    Zone.objects.filter(id=voter.zone_id).update(voted_count=F('voted_count') + delta)
-                ClientProfile.objects.filter(id=voter.client_id).update(voted_count=F('voted_count') + delta)
-            except Exception:
-                # Fallback: ensure consistency later
-                pass
-        
+        # Lock the voter row so concurrent toggles serialize, and move the
+        # denormalized counters in the same transaction. Scoped to the caller's
+        # client, so another client's voter is neither locked nor revealed.
+        with transaction.atomic():
+            voter = Voter.objects.select_for_update().only(
+                'id', 'client_id', 'zone_id', 'voted', 'establecimiento', 'mesa',
+            ).get(id=voter_id, client_id=client_id)
+            voter.voted = not voter.voted
+            voter.save(update_fields=['voted'])
+            apply_vote_delta(
+                voter.client_id, voter.zone_id, 1 if voter.voted else -1, voter.id, (voter.establecimiento, voter.mesa),
+            )
+
         return JsonResponse({
             "status": "success",
             "voted": voter.voted
@@ -270,108 +231,268 @@ def mark_voted_by_dni_set(request):
         return JsonResponse({"status": "error", "message": "DNI requerido"}, status=400)
 
     # Resolve client profile for either client or visitor user
-    if hasattr(request.user, 'clientprofile'):
-        client_profile = request.user.clientprofile
-    elif hasattr(request.user, 'visitor_profile'):
-        client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-    else:
+    client_id = request.client_id
+    if client_id is None:
         return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=403)
 
-    voter = Voter.objects.filter(client=client_profile, dni=dni).first()
+    entry = dni_index.lookup(client_id, dni) if dni_index.enabled() else None
+    if entry is not None:
+        voter_id, zone_id, (establecimiento, mesa) = entry
+        # The entry may be stale: matching dni, client, zone and mesa as well makes the UPDATE verify it
+        with transaction.atomic():
+            if Voter.objects.filter(
+                id=voter_id, client_id=client_id, dni=dni, zone_id=zone_id,
+                establecimiento=establecimiento, mesa=mesa, voted=False,
+            ).update(voted=True):
+                apply_vote_delta(client_id, zone_id, 1, voter_id, (establecimiento, mesa))
+                return JsonResponse({"status": "success", "voted": True})
+        # Already voted, or the index is out of date: the database decides below
+
+    voter = Voter.objects.filter(client_id=client_id, dni=dni).only('id', 'client_id', 'zone_id', 'establecimiento', 'mesa').first()
+    if entry is not None and (voter is None or (voter.id, voter.zone_id, (voter.establecimiento, voter.mesa)) != entry):
+        dni_index.invalidate(client_id)
     if not voter:
         # Return 200 with not_found status to avoid console 404s on the client
         return JsonResponse({"status": "not_found", "message": "No se encontró ningún votante con ese DNI."})
 
-    if not voter.voted:
-        voter.voted = True
-        voter.save(update_fields=['voted'])
-        # Update denormalized counters (+1)
-        try:
-            if voter.zone_id:
-                Zone.objects.filter(id=voter.zone_id).update(voted_count=F('voted_count') + 1)
-            ClientProfile.objects.filter(id=voter.client_id).update(voted_count=F('voted_count') + 1)
-        except Exception:
-            pass
+    # Conditional update: only the request that actually flips the flag counts it
+    with transaction.atomic():
+        if Voter.objects.filter(id=voter.id, client_id=client_id, voted=False).update(voted=True):
+            apply_vote_delta(voter.client_id, voter.zone_id, 1, voter.id, (voter.establecimiento, voter.mesa))
 
     return JsonResponse({"status": "success", "voted": True})
 
+@login_required
+def dni_index_stats(request):
+    """Memory and hit ratio of the DNI index in the worker answering (superusers only)."""
+    if not request.user.is_superuser:
+        return JsonResponse({"status": "error", "message": "Acceso denegado"}, status=403)
+    return JsonResponse({"status": "success", **dni_index.stats()})
+
+# Upper bound on DNIs accepted by one batch request
+MAX_BATCH_DNIS = 500
+
+@login_required
+@require_POST
+def mark_voted_by_dni_batch(request):
+    """Mark a queue of DNIs as voted in one request (e.g. replayed after a connectivity outage).
+    Expects a JSON body {"dnis": [...]}; returns per-DNI results: marked, already_voted or not_found."""
+    try:
+        dnis = json.loads(request.body or b'{}').get('dnis')
+    except (ValueError, AttributeError):
+        dnis = None
+    if not isinstance(dnis, list):
+        return JsonResponse({"status": "error", "message": "Se espera un JSON con la lista 'dnis'"}, status=400)
+    # Normalize and de-duplicate while keeping the caller's order
+    dnis = list(dict.fromkeys(str(d).strip() for d in dnis if d is not None and str(d).strip()))
+    if not dnis:
+        return JsonResponse({"status": "error", "message": "DNI requerido"}, status=400)
+    if len(dnis) > MAX_BATCH_DNIS:
+        return JsonResponse({"status": "error", "message": f"Máximo {MAX_BATCH_DNIS} DNIs por envío"}, status=400)
+
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=403)
+
+    with transaction.atomic():
+        # Lock the matching rows (in id order, to avoid deadlocks between batches)
+        found = {
+            dni: (voter_id, zone_id, voted, (establecimiento, mesa))
+            for voter_id, dni, zone_id, voted, establecimiento, mesa in Voter.objects.select_for_update()
+                .filter(client_id=client_id, dni__in=dnis)
+                .order_by('id')
+                .values_list('id', 'dni', 'zone_id', 'voted', 'establecimiento', 'mesa')
+        }
+        to_mark = [voter_id for voter_id, _, voted, _ in found.values() if not voted]
+        zone_deltas = {}
+        mesa_deltas = {}
+        if to_mark:
+            Voter.objects.filter(client_id=client_id, id__in=to_mark).update(voted=True)
+            for voter_id, zone_id, voted, mesa in found.values():
+                if not voted:
+                    zone_deltas[zone_id] = zone_deltas.get(zone_id, 0) + 1
+                    mesa_deltas[mesa] = mesa_deltas.get(mesa, 0) + 1
+            apply_vote_deltas(client_id, zone_deltas, to_mark, mesa_deltas)
+
+    results = []
+    for dni in dnis:
+        if dni not in found:
+            results.append({"dni": dni, "status": "not_found"})
+        else:
+            results.append({"dni": dni, "status": "already_voted" if found[dni][2] else "marked"})
+    return JsonResponse({"status": "success", "marked": len(to_mark), "results": results})
+
 @login_required
 def redirect_to_dashboard(request):
-    if hasattr(request.user, "clientprofile"):
+    if request.client_role == ROLE_CLIENT:
         return redirect("voting:main_dashboard")  # Use namespaced URL
-    elif hasattr(request.user, "visitor_profile"):  # Update to check visitor_profile
+    elif request.client_role == ROLE_VISITOR:
         return redirect("voting:visitor_dashboard")  # Use namespaced URL
     else:
         return redirect("login")
 
+# Stats payloads are cached per (client, stats_version); the version moves with every counter change
+STATS_CACHE_TIMEOUT = 300
+
+async def _versioned_stats(request, name, build):
+    """Serve ``await build()`` from the cache keyed on the client's ``stats_version``, with an ETag.
+    Dashboards re-polling an unchanged client get a 304 after a single primary-key query."""
+    client_id = request.client_id
+    # Read the version before building so a cached payload is never older than its key
+    version = await ClientProfile.objects.filter(id=client_id).values_list('stats_version', flat=True).afirst()
+    etag = quote_etag(f"{name}-{client_id}-{version}")
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    key = f"voting:{name}:{client_id}:{version}"
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build()
+        await cache.aset(key, payload, STATS_CACHE_TIMEOUT)
+    response = JsonResponse(payload)
+    response['ETag'] = etag
+    # Let the browser keep the body but revalidate on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 @login_required
-def get_voter_stats(request):
+async def get_voter_stats(request):
     """API endpoint to get voter statistics"""
-    try:
-        if hasattr(request.user, 'clientprofile'):
-            client_profile = request.user.clientprofile
-        elif hasattr(request.user, 'visitor_profile'):
-            client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-        else:
-            return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
 
+    async def build():
         # Use denormalized counters
+        client_profile = await ClientProfile.objects.only('id', 'total_voters', 'voted_count').aget(id=client_id)
         total_voters = client_profile.total_voters
         voted_count = client_profile.voted_count
         # Auto-heal: if counters are zero but there are voters, recompute once
         if total_voters == 0:
-            real_total = Voter.objects.filter(client=client_profile).count()
-            if real_total > 0:
-                recompute_client_counters(client_profile)
-                client_profile.refresh_from_db(fields=["total_voters", "voted_count"])
+            if await Voter.objects.filter(client_id=client_id).aexists():
+                await sync_to_async(recompute_client_counters)(client_profile)
+                await client_profile.arefresh_from_db(fields=["total_voters", "voted_count"])
                 total_voters = client_profile.total_voters
                 voted_count = client_profile.voted_count
-
-        return JsonResponse({
+        return {
             "status": "success",
             "stats": {
                 "total_voters": total_voters,
                 "voted_count": voted_count,
                 "percentage": round(voted_count / total_voters * 100, 2) if total_voters > 0 else 0
             }
-        })
+        }
+
+    try:
+        return await _versioned_stats(request, 'voter_stats', build)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
 @login_required
-def get_zone_stats(request):
+async def get_zone_stats(request):
     """API endpoint to get per-zone voter statistics for the current client/visitor."""
-    try:
-        if hasattr(request.user, 'clientprofile'):
-            client_profile = request.user.clientprofile
-        elif hasattr(request.user, 'visitor_profile'):
-            client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-        else:
-            return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+
+    zones_qs = Zone.objects.filter(client_id=client_id).order_by('name').values('id', 'name', 'total_voters', 'voted_count')
 
-        zones = Zone.objects.filter(client=client_profile).order_by('name')
+    async def build():
+        zones = [z async for z in zones_qs]
         # Auto-heal: if all zone totals are zero but there are voters, recompute once
-        if zones.exists():
-            if not zones.filter(total_voters__gt=0).exists():
-                if Voter.objects.filter(client=client_profile).exists():
-                    recompute_client_counters(client_profile)
-                    zones = Zone.objects.filter(client=client_profile).order_by('name')
-        data = []
+        if zones and not any(z['total_voters'] for z in zones):
+            if await Voter.objects.filter(client_id=client_id).aexists():
+                await sync_to_async(lambda: recompute_client_counters(request.client_profile))()
+                zones = [z async for z in zones_qs]
         for z in zones:
-            total = z.total_voters
-            voted = z.voted_count
-            pct = round(voted / total * 100, 2) if total > 0 else 0
-            data.append({
-                'id': z.id,
-                'name': z.name,
-                'total_voters': total,
-                'voted_count': voted,
-                'percentage': pct,
-            })
-        return JsonResponse({"status": "success", "zones": data})
+            total = z['total_voters']
+            z['percentage'] = round(z['voted_count'] / total * 100, 2) if total > 0 else 0
+        return {"status": "success", "zones": zones}
+
+    try:
+        return await _versioned_stats(request, 'zone_stats', build)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)})
+
+def _turnout_order(row):
+    # Exact ratio (not the rounded percentage), then school and mesa (no mesa last) for a stable order
+    total = row['total_voters']
+    mesa = row.get('mesa')
+    return (row['voted_count'] / total if total else 0, row['establecimiento'], mesa is None, mesa or 0)
+
+def _by_lowest_turnout(rows):
+    """Add ``percentage`` to each row and sort them from the lowest turnout up."""
+    for row in rows:
+        total = row['total_voters']
+        row['percentage'] = round(row['voted_count'] / total * 100, 2) if total > 0 else 0
+    rows.sort(key=_turnout_order)
+    return rows
+
+async def _turnout_rows(client_id, client_profile, rows_qs):
+    rows = [row async for row in rows_qs]
+    # Auto-heal: lists loaded before the aggregate existed get their rows once
+    if not rows and await Voter.objects.filter(client_id=client_id).aexists():
+        await sync_to_async(recompute_client_counters)(client_profile)
+        rows = [row async for row in rows_qs]
+    return _by_lowest_turnout(rows)
+
+@login_required
+async def get_mesa_stats(request):
+    """Turnout per (establecimiento, mesa) for the current client/visitor, lowest first."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+
+    mesas_qs = MesaTurnout.objects.filter(client_id=client_id).values('establecimiento', 'mesa', 'total_voters', 'voted_count')
+
+    async def build():
+        return {"status": "success", "mesas": await _turnout_rows(client_id, request.client_profile, mesas_qs)}
+
+    try:
+        return await _versioned_stats(request, 'mesa_stats', build)
+    except Exception as e:
+        return JsonResponse({"status": "error", "message": str(e)})
+
+@login_required
+async def get_establecimiento_stats(request):
+    """Turnout per establecimiento (summed from the per-mesa rows), lowest first."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"})
+
+    schools_qs = (
+        MesaTurnout.objects.filter(client_id=client_id).order_by().values('establecimiento')
+        .annotate(mesas=Count('id'), total_voters=Sum('total_voters'), voted_count=Sum('voted_count'))
+    )
+
+    async def build():
+        return {"status": "success", "establecimientos": await _turnout_rows(client_id, request.client_profile, schools_qs)}
+
+    try:
+        return await _versioned_stats(request, 'establecimiento_stats', build)
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
 
+@login_required
+async def stats_stream(request):
+    """Server-Sent Events feed of turnout deltas for the caller's client (needs the ASGI app).
+    Under a WSGI server it answers 503 so the dashboard falls back to polling the stats endpoints."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=403)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"status": "error", "message": "Transmisión en vivo no disponible"}, status=503)
+    # Django only releases the request's connection (session and user queries) once the
+    # response is fully sent, i.e. when the dashboard goes away. Hand it back now: the
+    # stream needs no database (events come from the listener's own connection), and
+    # each open dashboard would otherwise hold a pool slot (DB_POOL) for hours.
+    await sync_to_async(lambda: connection.close())()
+    response = StreamingHttpResponse(events.stream(client_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Proxies must not buffer the stream
+    return response
+
 # Lightweight password validator for destructive actions (client-side pre-check)
 @login_required
 @require_POST
@@ -391,24 +512,18 @@ def clear_voters(request):
         return JsonResponse({"status": "error", "message": "Solo se permite el método POST"})
 
     # Only client users can clear their list
-    if not hasattr(request.user, 'clientprofile'):
+    if request.client_role != ROLE_CLIENT:
         return JsonResponse({"status": "error", "message": "Acceso denegado"})
 
     # Require hardcoded password for destructive delete
     if (request.POST.get('confirm_password') or '') != '09285252':
         return JsonResponse({"status": "error", "message": "Contraseña incorrecta"})
 
-    client_profile = request.user.clientprofile
+    client_id = request.client_id
     try:
-        with transaction.atomic():
-            voter_qs = Voter.objects.filter(client=client_profile)
-            deleted_count = voter_qs.count()
-            voter_qs.delete()
-            zones_qs = Zone.objects.filter(client=client_profile)
-            zones_deleted = zones_qs.count()
-            zones_qs.delete()
-            # Reset denormalized counters
-            ClientProfile.objects.filter(id=client_profile.id).update(total_voters=0, voted_count=0)
+        # One DELETE per table; counters reset and list_epoch bumped in the same transaction
+        deleted_count, zones_deleted = purge_client_voters(client_id)
+        dni_index.invalidate(client_id)
         return JsonResponse({
             "status": "success",
             "deleted_count": deleted_count,
@@ -420,14 +535,14 @@ def clear_voters(request):
 
 @login_required
 def upload_voters_to_zone(request):
-    """Create a zone (if needed) and import voters assigning them to that zone.
+    """Queue an import that creates a zone (if needed) and assigns the file's voters to it.
     Upsert semantics: if DNI exists for this client, update name and zone; else create.
-    Expects POST with 'zone_name' and file in 'file'."""
+    Expects POST with 'zone_name' and file in 'file'; poll 'status_url' for the result."""
     if request.method != 'POST':
         return JsonResponse({"status": "error", "message": "Solo se permite POST"}, status=400)
-    if not hasattr(request.user, 'clientprofile'):
+    if request.client_role != ROLE_CLIENT:
         return JsonResponse({"status": "error", "message": "Acceso denegado"}, status=403)
-    client_profile = request.user.clientprofile
+    client_profile = request.client_profile
     zone_name = request.POST.get('zone_name', '').strip()
     if not zone_name:
         return JsonResponse({"status": "error", "message": "Nombre de zona requerido"}, status=400)
@@ -435,142 +550,143 @@ def upload_voters_to_zone(request):
         return JsonResponse({"status": "error", "message": "Archivo requerido"}, status=400)
 
     uploaded_file = request.FILES['file']
-    if not uploaded_file.name.endswith('.xlsx'):
-        return JsonResponse({"status": "error", "message": "Formato inválido, use .xlsx"}, status=400)
+    if not uploaded_file.name.lower().endswith(SUPPORTED_EXTENSIONS):
+        return JsonResponse({"status": "error", "message": "Formato inválido, use .xlsx, .csv o .parquet"}, status=400)
 
     try:
-        # Lazy import pandas to avoid hard dependency at startup
-        import pandas as pd  # type: ignore
-        df = pd.read_excel(uploaded_file, engine='openpyxl')
+        sheet = open_voter_file(uploaded_file, uploaded_file.name)
     except Exception as e:
-        return JsonResponse({"status": "error", "message": f"Error leyendo Excel: {str(e)}"})
-
-    required_columns = ['dni', 'name']
-    if not all(col in df.columns for col in ['dni', 'Apellido', 'Nombre']):
+        return JsonResponse({"status": "error", "message": f"Error leyendo el archivo: {str(e)}"})
+    missing_columns = sheet.missing_columns()
+    sheet.close()
+    if missing_columns:
         return JsonResponse({"status": "error", "message": "El archivo debe tener columnas 'dni', 'Apellido' y 'Nombre'"}, status=400)
 
-    zone, _ = Zone.objects.get_or_create(client=client_profile, name=zone_name)
-    created = 0
-    updated = 0
-    skipped = 0
-    for index, row in df.iterrows():
-        dni_val = str(row.get('dni')).strip() if not pd.isna(row.get('dni')) else ''
-        last_name = '' if pd.isna(row.get('Apellido')) else str(row.get('Apellido')).strip()
-        first_name = '' if pd.isna(row.get('Nombre')) else str(row.get('Nombre')).strip()
-        sex = '' if pd.isna(row.get('Sexo')) else str(row.get('Sexo')).strip().upper()
-        address = '' if pd.isna(row.get('Direccion')) else str(row.get('Direccion')).strip()
-        mesa = None if pd.isna(row.get('Mesa')) else int(row.get('Mesa')) if str(row.get('Mesa')).strip().isdigit() else None
-        orden = None if pd.isna(row.get('Orden')) else int(row.get('Orden')) if str(row.get('Orden')).strip().isdigit() else None
-        establecimiento = '' if pd.isna(row.get('Establecimiento')) else str(row.get('Establecimiento')).strip()
-        if not dni_val or not last_name or not first_name:
-            skipped += 1
-            continue
-        voter = Voter.objects.filter(client=client_profile, dni=dni_val).first()
-        if voter:
-            # Update name + zone (don't touch voted flag)
-            changed = False
-            field_updates = []
-            if (voter.last_name != last_name) or (voter.first_name != first_name):
-                voter.last_name = last_name
-                voter.first_name = first_name
-                changed = True
-            if voter.sex != sex:
-                voter.sex = sex; field_updates.append('sex')
-            if voter.address != address:
-                voter.address = address; field_updates.append('address')
-            if voter.mesa != mesa:
-                voter.mesa = mesa; field_updates.append('mesa')
-            if voter.orden != orden:
-                voter.orden = orden; field_updates.append('orden')
-            if voter.establecimiento != establecimiento:
-                voter.establecimiento = establecimiento; field_updates.append('establecimiento')
-            if voter.zone_id != zone.id:
-                voter.zone = zone
-                changed = True
-            if changed or field_updates:
-                voter.save(update_fields=['last_name', 'first_name', 'zone'] + field_updates)
-                updated += 1
-        else:
-            Voter.objects.create(
-                client=client_profile,
-                dni=dni_val,
-                last_name=last_name,
-                first_name=first_name,
-                sex=sex,
-                address=address,
-                mesa=mesa,
-                orden=orden,
-                establecimiento=establecimiento,
-                voted=False,
-                zone=zone
-            )
-            created += 1
-
-    # Recompute denormalized counters after this zone upload
-    try:
-        recompute_client_counters(client_profile)
-    except Exception:
-        pass
+    uploaded_file.seek(0)
+    job = enqueue_import(client_profile, uploaded_file, zone_name)
+    return JsonResponse({
+        "status": "queued",
+        "zone": zone_name,
+        "job_id": job.id,
+        "status_url": reverse('voting:import_job_status', args=[job.id]),
+    })
 
+@login_required
+def import_job_status(request, job_id):
+    """Progress of a queued import, polled by the dashboard."""
+    if request.client_role != ROLE_CLIENT:
+        return JsonResponse({"status": "error", "message": "Acceso denegado"}, status=403)
+    job = ImportJob.objects.filter(id=job_id, client_id=request.client_id).defer('payload').first()
+    if not job:
+        return JsonResponse({"status": "error", "message": "Importación no encontrada"}, status=404)
     return JsonResponse({
         "status": "success",
-        "zone": zone.name,
-        "created": created,
-        "updated": updated,
-        "skipped": skipped
+        "job": {
+            "id": job.id,
+            "state": job.status,
+            "filename": job.filename,
+            "zone": job.zone_name,
+            "rows_processed": job.rows_processed,
+            "created": job.created,
+            "updated": job.updated,
+            "skipped": job.skipped,
+            "errors": job.errors,
+            "finished": job.status in (ImportJob.DONE, ImportJob.FAILED),
+        }
     })
 
+# NULLs last explicitly (PostgreSQL's default), the seek in _pending_after relies on it
+PENDING_ORDER = (F('mesa').asc(nulls_last=True), F('orden').asc(nulls_last=True), 'dni')
+PENDING_FIELDS = ('dni', 'last_name', 'first_name', 'sex', 'address', 'mesa', 'orden', 'establecimiento')
 
-def recompute_client_counters(client_profile: ClientProfile) -> None:
-    """Recompute denormalized counters for a given client and its zones.
-    Safe to call after bulk operations (uploads, deletes).
-    """
-    # Client totals
-    total = Voter.objects.filter(client=client_profile).count()
-    voted = Voter.objects.filter(client=client_profile, voted=True).count()
-    ClientProfile.objects.filter(id=client_profile.id).update(total_voters=total, voted_count=voted)
-
-    # Zone totals: build maps of counts per zone
-    by_zone = (
-        Voter.objects
-        .filter(client=client_profile)
-        .values('zone_id')
-        .annotate(total=Count('id'), voted=Count('id', filter=Q(voted=True)))
-    )
-    counts_map = {row['zone_id']: (row['total'], row['voted']) for row in by_zone}
+def _encode_cursor(voter):
+    raw = json.dumps([voter['mesa'], voter['orden'], voter['dni']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-    # Update all zones for this client; default to 0 when no voters
-    for z in Zone.objects.filter(client=client_profile).only('id'):
-        t, v = counts_map.get(z.id, (0, 0))
-        Zone.objects.filter(id=z.id).update(total_voters=t, voted_count=v)
+def _decode_cursor(cursor):
+    """Return (mesa, orden, dni) from an opaque cursor; raises ValueError if malformed."""
+    try:
+        mesa, orden, dni = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError(cursor)
+    if not (mesa is None or isinstance(mesa, int)) or not (orden is None or isinstance(orden, int)) or not isinstance(dni, str):
+        raise ValueError(cursor)
+    return mesa, orden, dni
+
+async def _pending_after(qs, key, limit):
+    """Up to ``limit`` + 1 rows of ``qs`` strictly after ``key`` in (mesa, orden, dni) order (NULLs last).
+
+    The seek is split into index-friendly ranges (rest of the current mesa, later
+    mesas, then mesa NULL) so each query starts at the cursor instead of skipping rows.
+    """
+    if key is None:
+        ranges = [Q()]
+    else:
+        mesa, orden, dni = key
+        if orden is None:
+            rest_of_mesa = Q(orden__isnull=True, dni__gt=dni)
+        else:
+            rest_of_mesa = Q(orden=orden, dni__gt=dni) | Q(orden__gt=orden) | Q(orden__isnull=True)
+        if mesa is None:
+            ranges = [Q(mesa__isnull=True) & rest_of_mesa]
+        else:
+            ranges = [Q(mesa=mesa) & rest_of_mesa, Q(mesa__gt=mesa), Q(mesa__isnull=True)]
+    rows = []
+    for condition in ranges:
+        rows += [row async for row in qs.filter(condition).order_by(*PENDING_ORDER).values(*PENDING_FIELDS)[:limit + 1 - len(rows)]]
+        if len(rows) > limit:
+            break
+    return rows
 
 @login_required
-def pending_voters(request):
-    """Return paginated list of not-voted voters for a given zone (or all). Params: zone_id, page, page_size."""
+async def pending_voters(request):
+    """Return not-voted voters for a given zone (or all). Params: zone_id, page_size and either
+    cursor (keyset mode: pass '' for the first page, then next_cursor) or the legacy page number."""
     try:
-        if hasattr(request.user, 'clientprofile'):
-            client_profile = request.user.clientprofile
-        elif hasattr(request.user, 'visitor_profile'):
-            client_profile = get_object_or_404(ClientProfile, visitor_user=request.user)
-        else:
+        client_id = request.client_id
+        if client_id is None:
             return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
 
         zone_id = request.GET.get('zone_id')  # may be None or 'all'
-        page = int(request.GET.get('page', '1'))
         page_size = int(request.GET.get('page_size', '100'))
-        page = max(page, 1)
         page_size = max(10, min(page_size, 1000))  # clamp (allow larger pages for main dashboard)
 
-        qs = Voter.objects.filter(client=client_profile, voted=False)
+        qs = Voter.objects.filter(client_id=client_id, voted=False)
         if zone_id and zone_id != 'all':
             qs = qs.filter(zone_id=zone_id)
 
-        total = qs.count()
+        cursor = request.GET.get('cursor')
+        if cursor is not None:
+            try:
+                key = _decode_cursor(cursor) if cursor else None
+            except ValueError:
+                return JsonResponse({"status": "error", "message": "Cursor inválido"}, status=400)
+            voters = await _pending_after(qs, key, page_size)
+            has_more = len(voters) > page_size
+            voters = voters[:page_size]
+            # Pending total from the denormalized counters instead of a count(*) per page
+            if zone_id and zone_id != 'all':
+                counters = await Zone.objects.filter(id=zone_id, client_id=client_id).values_list('total_voters', 'voted_count').afirst()
+            else:
+                counters = await ClientProfile.objects.filter(id=client_id).values_list('total_voters', 'voted_count').afirst()
+            total = max(counters[0] - counters[1], 0) if counters else 0
+            return JsonResponse({
+                'status': 'success',
+                'page_size': page_size,
+                'total': total,
+                'has_more': has_more,
+                'next_cursor': _encode_cursor(voters[-1]) if has_more else None,
+                'voters': voters,
+            })
+
+        page = int(request.GET.get('page', '1'))
+        page = max(page, 1)
+        total = await qs.acount()
         offset = (page - 1) * page_size
-        voters = list(
-            qs.order_by('mesa', 'orden', 'dni')
-              .values('dni', 'last_name', 'first_name', 'sex', 'address', 'mesa', 'orden', 'establecimiento')[offset: offset + page_size]
-        )
+        voters = [
+            row async for row in qs.order_by(*PENDING_ORDER)
+              .values(*PENDING_FIELDS)[offset: offset + page_size]
+        ]
         has_more = offset + page_size < total
 
         return JsonResponse({
@@ -583,3 +699,146 @@ def pending_voters(request):
         })
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)})
+
+@login_required
+def export_pending_voters(request):
+    """Download every pending voter of a zone (or the whole client) for offline walk lists.
+    Params: zone_id and format (csv, ndjson, columnar or xlsx). Text formats are streamed from a
+    server-side cursor and gzip-encoded when the client accepts it."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
+    export_format = request.GET.get('format', 'csv')
+    if export_format != 'xlsx' and export_format not in STREAM_FORMATS:
+        return JsonResponse({"status": "error", "message": "Formato inválido, use csv, ndjson, columnar o xlsx"}, status=400)
+
+    qs = Voter.objects.filter(client_id=client_id, voted=False)
+    zone_id = request.GET.get('zone_id')
+    label = 'todas'
+    if zone_id and zone_id != 'all':
+        zone = Zone.objects.filter(id=zone_id, client_id=client_id).only('name').first()
+        if zone is None:
+            return JsonResponse({"status": "error", "message": "Zona no encontrada"}, status=404)
+        qs = qs.filter(zone_id=zone.id)
+        label = slugify(zone.name) or f"zona-{zone.id}"
+    rows = qs.order_by(*PENDING_ORDER).values_list(*PENDING_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    filename = f"pendientes-{label}-{timezone.localdate():%Y%m%d}"
+
+    if export_format == 'xlsx':
+        return _stream_under_asgi(request, FileResponse(
+            write_xlsx(rows, PENDING_FIELDS),
+            as_attachment=True,
+            filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        ))
+
+    writer, content_type, extension = STREAM_FORMATS[export_format]
+    response = _streaming_response(request, writer(rows, PENDING_FIELDS), content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+def _streaming_response(request, content, content_type):
+    """Stream the ``content`` byte chunks, gzip-encoded when the client accepts it."""
+    gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = StreamingHttpResponse(compress_sequence(content) if gzipped else content, content_type=content_type)
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return _stream_under_asgi(request, response)
+
+async def _pull_chunks(chunks):
+    """Async iterator over the sync iterator ``chunks``, one chunk per sync_to_async call.
+    Thread-sensitive calls all run on the request's thread, which owns the server-side cursor
+    (and closes the original generator through ``response.close()`` when the request ends)."""
+    chunks = iter(chunks)
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _stream_under_asgi(request, response):
+    """Under ASGI, Django consumes a sync streaming body with ``sync_to_async(list)`` before
+    sending the first byte; hand it an async iterator so exports and snapshots stay streamed."""
+    if isinstance(request, ASGIRequest) and not response.is_async:
+        response.streaming_content = _pull_chunks(response.streaming_content)
+    return response
+
+@login_required
+def offline_snapshot(request):
+    """Compact copy of the client's whole voter list for the offline visitor dashboard.
+    Tagged with the list epoch and change sequence to continue from with offline_changes."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
+    epoch, seq = sync_state(client_id)
+    etag = quote_etag(f"snapshot-{client_id}-{epoch}-{seq}")
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    zones = {str(zone_id): name for zone_id, name in Zone.objects.filter(client_id=client_id).values_list('id', 'name')}
+    response = _streaming_response(request, write_snapshot(client_id, epoch, seq, zones), 'application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required
+def offline_changes(request):
+    """Voters changed since an offline snapshot. Params: epoch, since and after (the cursor
+    returned by the previous call). Answers status 'reset' when the snapshot is obsolete."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
+    try:
+        epoch = int(request.GET['epoch'])
+        since = int(request.GET['since'])
+        after = int(request.GET['after']) if request.GET.get('after') else None
+    except (KeyError, ValueError):
+        return JsonResponse({"status": "error", "message": "Parámetros 'epoch' y 'since' requeridos"}, status=400)
+    current_epoch, _ = sync_state(client_id)
+    if epoch != current_epoch:
+        return JsonResponse({"status": "reset", "epoch": current_epoch})
+    rows, (since, after), has_more = changes_after(client_id, since, after)
+    return JsonResponse({
+        "status": "success",
+        "epoch": epoch,
+        "since": since,
+        "after": after,
+        "has_more": has_more,
+        "rows": rows,
+    })
+
+def offline_service_worker(request):
+    """Service worker caching the visitor dashboard shell; served here so its scope is /voting/."""
+    response = render(request, 'voting/sw.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@login_required
+def voter_changes(request):
+    """Voters changed after a sequence, in chunks, for dashboards and integrations.
+    Params: since (omit it to walk the whole list), after (cursor id from the previous call),
+    limit and optionally epoch; a list replaced or cleared since then answers status 'reset'."""
+    client_id = request.client_id
+    if client_id is None:
+        return JsonResponse({"status": "error", "message": "Tipo de usuario inválido"}, status=400)
+    try:
+        # Rows never changed since they were loaded keep sequence 0
+        since = int(request.GET['since']) if request.GET.get('since') else -1
+        after = int(request.GET['after']) if request.GET.get('after') else None
+        limit = min(max(int(request.GET.get('limit') or 1000), 1), OFFLINE_CHUNK_SIZE)
+        epoch = int(request.GET['epoch']) if request.GET.get('epoch') else None
+    except ValueError:
+        return JsonResponse({"status": "error", "message": "Parámetros inválidos"}, status=400)
+    current_epoch, current_seq = sync_state(client_id)
+    if epoch is not None and epoch != current_epoch:
+        return JsonResponse({"status": "reset", "epoch": current_epoch, "seq": current_seq})
+    rows, (since, after), has_more = changed_voters(client_id, since, after, limit, CHANGE_FIELDS)
+    return JsonResponse({
+        "status": "success",
+        "epoch": current_epoch,
+        "since": since,
+        "after": after,
+        "has_more": has_more,
+        "changes": [dict(zip(CHANGE_FIELDS, row)) for row in rows],
+    })